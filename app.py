@@ -1,11 +1,17 @@
-from flask import Flask, render_template, request, jsonify, send_from_directory
+from flask import Flask, Response, render_template, request, jsonify, send_from_directory
+from flask.json.provider import DefaultJSONProvider
 from werkzeug.exceptions import NotFound, InternalServerError
 from flask_cors import CORS
 import os
 import json
+import threading
+import time
 from dotenv import load_dotenv
 from database import Database
-from recipe_extractor import RecipeExtractor
+from job_queue import JobQueue
+from models import RowModel
+from recipe_extractor import RecipeExtractor, is_transient_error, retry_delay
+from recipe_index import RecipeIndex
 from menu_generator import MenuGenerator
 from cleaning_manager import CleaningManager
 from datetime import datetime, timedelta
@@ -28,7 +34,19 @@ except Exception as e:
     except Exception as e2:
         print(f"Warning: Error manual loading .env: {e2}")
 
+
+class ModelJSONProvider(DefaultJSONProvider):
+    """JSON provider that serializes Adult/Child/Recipe row models with to_json()"""
+    
+    @staticmethod
+    def default(o):
+        if isinstance(o, RowModel):
+            return o.to_json()
+        return DefaultJSONProvider.default(o)
+
+
 app = Flask(__name__)
+app.json = ModelJSONProvider(app)
 app.config['SECRET_KEY'] = os.getenv('SECRET_KEY', os.urandom(24))
 # Disable ALL cache to force reload
 app.config['TEMPLATES_AUTO_RELOAD'] = True
@@ -76,7 +94,7 @@ try:
 except Exception as e:
     print(f"Error inicializando base de datos: {str(e)}")
 
-extractor = RecipeExtractor()
+extractor = RecipeExtractor(page_cache=db)
 
 # Menu generator will be initialized when needed (requires API key)
 menu_gen = None
@@ -87,7 +105,7 @@ def get_menu_generator():
     if menu_gen is None:
         api_key = os.getenv('ANTHROPIC_API_KEY')
         if api_key:
-            menu_gen = MenuGenerator(api_key)
+            menu_gen = MenuGenerator(api_key, response_cache=db)
         else:
             raise ValueError("ANTHROPIC_API_KEY no configurada")
     return menu_gen
@@ -291,17 +309,33 @@ def delete_child(child_id):
 
 # ==================== RECIPE EXTRACTION API ====================
 
+def wants_async_response() -> bool:
+    """True when the client asked to get a job back instead of waiting (?async=1 or Prefer: respond-async)"""
+    prefer = [token.strip().lower() for token in request.headers.get('Prefer', '').split(',')]
+    return request.args.get('async', '').lower() in ('1', 'true') or 'respond-async' in prefer
+
 @app.route('/api/recipes/extract', methods=['POST'])
 def extract_recipe():
-    """Extract recipe from URL"""
+    """
+    Extract a recipe from a URL ("url"), save it and return it.
+    
+    With ?async=1 or a "Prefer: respond-async" header the URLs ("url" or "urls")
+    are queued as background import jobs instead: 202 with the job ids right
+    away; poll progress_url for the fetch/parse/save stages of every import,
+    or /api/jobs/<job_id> for one.
+    """
+    data = request.get_json(silent=True)
+    if wants_async_response():
+        return queue_recipe_imports(data)
+    
     try:
-        data = request.json
-        url = data.get('url')
+        url = str(data.get('url') or '').strip() if isinstance(data, dict) else ''
         
         if not url:
             return jsonify({
                 'success': False,
-                'error': 'URL es requerida'
+                'error': 'URL es requerida' if not (isinstance(data, dict) and data.get('urls'))
+                         else 'Para importar varias URLs usa ?async=1'
             }), 400
         
         print(f"[ExtractRecipe] Extracting recipe from URL: {url}")
@@ -317,17 +351,13 @@ def extract_recipe():
             }), 400
         
         print(f"[ExtractRecipe] Recipe extracted: {recipe_data.get('title', 'Unknown')}")
-        print(f"[ExtractRecipe] Recipe data keys: {list(recipe_data.keys())}")
         
         # Save to database
         try:
-            recipe_id = db.add_recipe(recipe_data)
-            recipe_data['id'] = recipe_id
-            print(f"[ExtractRecipe] Recipe saved successfully with ID: {recipe_id}")
+            recipe_data['id'] = db.add_recipe(recipe_data)
+            print(f"[ExtractRecipe] Recipe saved successfully with ID: {recipe_data['id']}")
         except Exception as db_error:
             print(f"[ExtractRecipe] Database error: {str(db_error)}")
-            import traceback
-            print(f"[ExtractRecipe] Traceback: {traceback.format_exc()}")
             return jsonify({
                 'success': False,
                 'error': f'Error al guardar la receta: {str(db_error)}'
@@ -348,6 +378,85 @@ def extract_recipe():
             'error': str(e)
         }), 500
 
+def queue_recipe_imports(data):
+    """Asynchronous /api/recipes/extract: queue one import_recipe job per URL and answer 202"""
+    try:
+        urls = (data.get('urls') or ([data['url']] if data.get('url') else [])) if isinstance(data, dict) else []
+        if not isinstance(urls, list):
+            urls = [urls]
+        urls = [str(url).strip() for url in urls if str(url).strip()]
+        
+        # Missing or malformed body: the client's fault
+        if not urls:
+            return jsonify({
+                'success': False,
+                'error': 'URL es requerida'
+            }), 400
+        
+        jobs = []
+        for url in urls:
+            job_id = import_queue.submit('import_recipe', {'url': url})
+            jobs.append({'job_id': job_id, 'url': url, 'status_url': f'/api/jobs/{job_id}'})
+        print(f"[ExtractRecipe] Queued {len(jobs)} recipe import(s): {[job['job_id'] for job in jobs]}")
+        
+        return jsonify({
+            'success': True,
+            'status': 'queued',
+            'job_id': jobs[0]['job_id'],
+            'status_url': jobs[0]['status_url'],
+            'jobs': jobs,
+            'progress_url': '/api/recipes/imports?jobs=' + ','.join(str(job['job_id']) for job in jobs)
+        }), 202, {'Preference-Applied': 'respond-async'}
+        
+    except Exception as e:
+        # Queueing failed on our side (e.g. the database)
+        print(f"[ExtractRecipe] Unexpected error: {str(e)}")
+        return jsonify({
+            'success': False,
+            'error': str(e)
+        }), 500
+
+@app.route('/api/recipes/imports', methods=['GET'])
+def get_recipe_imports():
+    """
+    Progress of queued recipe imports (?jobs=1,2,3): every job with its
+    fetch/parse/save stage rows, plus totals for a progress bar
+    """
+    try:
+        job_ids = [int(job_id) for job_id in request.args.get('jobs', '').split(',') if job_id.strip()]
+    except ValueError:
+        return jsonify({
+            'success': False,
+            'error': 'Parámetro jobs inválido'
+        }), 400
+    
+    stages = db.get_job_stages(job_ids)
+    jobs = []
+    for job_id in job_ids:
+        job = db.get_job(job_id, include_payload=True)
+        if job is None or job['job_type'] != 'import_recipe':
+            continue
+        recorded = {stage['stage']: stage for stage in stages[job_id]}
+        job['url'] = (job.pop('payload') or {}).get('url')
+        job['stages'] = [recorded.get(stage, {'stage': stage, 'status': 'pending', 'attempts': 0})
+                         for stage in RECIPE_IMPORT_STAGES]
+        jobs.append(job)
+    
+    finished = [job for job in jobs if job['status'] in ('succeeded', 'failed')]
+    response = jsonify({
+        'success': True,
+        'data': {
+            'jobs': jobs,
+            'total': len(jobs),
+            'finished': len(finished),
+            'succeeded': sum(1 for job in finished if job['status'] == 'succeeded'),
+            'failed': sum(1 for job in finished if job['status'] == 'failed'),
+            'progress': round(sum(map(import_progress, jobs)) / len(jobs), 3) if jobs else 1.0
+        }
+    })
+    response.headers['Cache-Control'] = 'no-store'
+    return response
+
 @app.route('/api/recipes/<int:recipe_id>', methods=['DELETE'])
 def delete_recipe(recipe_id):
     """Delete a recipe"""
@@ -476,9 +585,23 @@ def view_recipe():
     except Exception as e:
         return render_template('recipe_view.html', error=f'Error al cargar la receta: {str(e)}')
 
+def extract_and_save_recipes(urls):
+    """Fetch the URLs concurrently and save each recipe as it arrives; yields (index, recipe_data)"""
+    for index, recipe_data in extractor.iter_extract_urls(urls):
+        if not recipe_data.get('error'):
+            try:
+                recipe_data['id'] = db.add_recipe(recipe_data)
+            except Exception as e:
+                recipe_data = {'error': f'Error al guardar la receta: {e}', 'url': urls[index], 'success': False}
+        yield index, recipe_data
+
 @app.route('/api/recipes/batch', methods=['POST'])
 def extract_multiple_recipes():
-    """Extract multiple recipes from URLs"""
+    """
+    Extract multiple recipes from URLs, fetching them concurrently.
+    With Accept: application/x-ndjson each recipe is streamed as one JSON line
+    as soon as its page is done, followed by a summary line.
+    """
     try:
         data = request.json
         urls = data.get('urls', [])
@@ -489,13 +612,26 @@ def extract_multiple_recipes():
                 'error': 'Se requiere al menos una URL'
             }), 400
         
-        results = []
-        for url in urls:
-            recipe_data = extractor.extract_from_url(url)
-            if not recipe_data.get('error'):
-                recipe_id = db.add_recipe(recipe_data)
-                recipe_data['id'] = recipe_id
-            results.append(recipe_data)
+        if request.accept_mimetypes.best == 'application/x-ndjson':
+            def stream():
+                success_count = 0
+                for index, recipe_data in extract_and_save_recipes(urls):
+                    success_count += not recipe_data.get('error')
+                    yield json.dumps({'index': index, 'data': recipe_data}, ensure_ascii=False, default=str) + '\n'
+                yield json.dumps({
+                    'done': True,
+                    'success': True,
+                    'message': f'{success_count}/{len(urls)} recetas extraídas correctamente'
+                }, ensure_ascii=False) + '\n'
+            
+            return Response(stream(), mimetype='application/x-ndjson', headers={
+                'Cache-Control': 'no-cache',
+                'X-Accel-Buffering': 'no'
+            })
+        
+        results = [None] * len(urls)
+        for index, recipe_data in extract_and_save_recipes(urls):
+            results[index] = recipe_data
         
         success_count = sum(1 for r in results if not r.get('error'))
         
@@ -511,11 +647,85 @@ def extract_multiple_recipes():
             'error': str(e)
         }), 400
 
+RECIPE_IMPORT_STAGES = ('fetch', 'parse', 'save')
+
+# Fetch attempts per import and the first retry delay (doubled on each retry)
+RECIPE_IMPORT_ATTEMPTS = int(os.getenv('RECIPE_IMPORT_ATTEMPTS', '4'))
+RECIPE_IMPORT_BACKOFF = float(os.getenv('RECIPE_IMPORT_BACKOFF', '2'))
+
+def import_progress(job: dict) -> float:
+    """Share of an import that is done; a finished job counts in full (a failed fetch skips parse and save)"""
+    if job['status'] in ('succeeded', 'failed'):
+        return 1.0
+    return sum(stage['status'] == 'succeeded' for stage in job['stages']) / len(RECIPE_IMPORT_STAGES)
+
+def run_recipe_import(job_id: int, payload: dict) -> dict:
+    """
+    'import_recipe' job handler: fetch, parse and save one recipe URL,
+    recording each stage in job_stages. Timeouts, connection errors and
+    429/5xx answers are retried with exponential backoff, so a flaky site
+    costs a background worker some waiting instead of a failed import.
+    """
+    url = payload['url']
+    
+    attempt = 1
+    while True:
+        db.set_job_stage(job_id, 'fetch', 'running', attempt)
+        try:
+            response = extractor.fetch_page(url)
+            break
+        except Exception as e:
+            if attempt >= RECIPE_IMPORT_ATTEMPTS or not is_transient_error(e):
+                db.set_job_stage(job_id, 'fetch', 'failed', attempt, str(e))
+                return {'success': False, 'url': url, 'error': f'No se pudo descargar la página: {e}'}
+            db.set_job_stage(job_id, 'fetch', 'retrying', attempt, str(e))
+            time.sleep(retry_delay(e, attempt, RECIPE_IMPORT_BACKOFF))
+            attempt += 1
+    db.set_job_stage(job_id, 'fetch', 'succeeded', attempt)
+    
+    db.set_job_stage(job_id, 'parse', 'running')
+    try:
+        recipe_data = extractor.extract_from_response(url, response)
+    except Exception as e:
+        db.set_job_stage(job_id, 'parse', 'failed', error=str(e))
+        return {'success': False, 'url': url, 'error': f'Error al extraer la receta: {e}'}
+    if recipe_data.get('error'):
+        db.set_job_stage(job_id, 'parse', 'failed', error=recipe_data['error'])
+        return {'success': False, 'url': url, 'error': recipe_data['error']}
+    db.set_job_stage(job_id, 'parse', 'succeeded')
+    
+    db.set_job_stage(job_id, 'save', 'running')
+    try:
+        recipe_data['id'] = db.add_recipe(recipe_data)
+    except Exception as e:
+        db.set_job_stage(job_id, 'save', 'failed', error=str(e))
+        return {'success': False, 'url': url, 'error': f'Error al guardar la receta: {e}'}
+    db.set_job_stage(job_id, 'save', 'succeeded')
+    print(f"[ImportRecipe] Recipe saved with ID {recipe_data['id']}: {recipe_data.get('title', 'Unknown')}")
+    
+    # The page text stays out of the job row (it is not stored with the recipe either)
+    recipe_data.pop('extracted_text', None)
+    return {'success': True, 'data': recipe_data}
+
+# Imports get their own workers so a dozen pasted links never delay menu
+# generation. Every queue adds its threads to each gunicorn process (and they
+# share the PostgreSQL pool), so both counts are configurable.
+RECIPE_IMPORT_WORKERS = int(os.getenv('RECIPE_IMPORT_WORKERS', '2'))
+JOB_WORKERS = int(os.getenv('JOB_WORKERS', '2'))
+
+import_queue = JobQueue(db, workers=RECIPE_IMPORT_WORKERS)
+import_queue.register('import_recipe', run_recipe_import)
+
 # ==================== MENU GENERATION API ====================
 
+MENU_GENERATION_MODES = ('weekly', 'parallel')
+
 @app.route('/api/menu/generate', methods=['POST'])
 def generate_menu():
-    """Generate weekly menu using AI"""
+    """
+    Queue weekly menu generation as a background job. Returns 202 with the
+    job id right away; poll /api/jobs/<job_id> for the generated menu.
+    """
     try:
         # Get family profiles
         adults = db.get_all_adults()
@@ -567,46 +777,117 @@ def generate_menu():
                     'error': f'Formato de fecha inválido. Usa YYYY-MM-DD. Recibido: {str(week_start_date)[:50]}'
                 }), 400
         
-        # Get menu preferences from database
-        menu_prefs = db.get_menu_preferences()
-        preferences.update({
-            'include_weekend': menu_prefs.get('include_weekend', True),
-            'include_breakfast': menu_prefs.get('include_breakfast', True),
-            'include_lunch': menu_prefs.get('include_lunch', True),
-            'include_dinner': menu_prefs.get('include_dinner', True),
-            'excluded_days': menu_prefs.get('excluded_days', [])
-        })
-        
-        # Get recipes
-        recipes = db.get_all_recipes()
-        
-        # Get historical ratings for learning
-        historical_ratings = db.get_all_menu_ratings(limit=30)
-        
-        # Generate menu with enhanced parameters
-        gen = get_menu_generator()
-        result = gen.generate_weekly_menu(
-            adults=adults, 
-            children=children, 
-            recipes=recipes, 
-            preferences=preferences,
-            day_settings=day_settings,  # Pass day settings to generator
-            historical_ratings=historical_ratings  # Pass historical ratings for learning
-        )
-        
-        if not result['success']:
-            return jsonify(result), 400
+        # 'weekly' asks for the whole week in one call, 'parallel' generates the days concurrently
+        mode = data.get('mode') or os.getenv('MENU_GENERATION_MODE', 'weekly')
+        if mode not in MENU_GENERATION_MODES:
+            return jsonify({
+                'success': False,
+                'error': f"Modo de generación inválido: {str(mode)[:20]}. Usa {' o '.join(MENU_GENERATION_MODES)}"
+            }), 400
         
-        # Save menu to database with specific week_start
+        # Fail fast on a missing API key instead of queueing a job that cannot run
+        get_menu_generator()
         
-        # Include raw_response in metadata so frontend can use it if menu parsing fails
-        metadata = {
-            'generated_at': result['generated_at'],
-            'day_settings': day_settings,
+        job_id = job_queue.submit('generate_menu', {
+            'week_start': week_start,
             'preferences': preferences,
-            'raw_response': result.get('raw_response', '')  # Include raw response for fallback
-        }
+            'day_settings': day_settings,
+            'mode': mode,
+            # fresh=true skips the LLM response cache ("give me something different")
+            'fresh': bool(data.get('fresh', False))
+        })
+        print(f"[GenerateMenu] Queued job {job_id} for week {week_start}")
         
+        return jsonify({
+            'success': True,
+            'job_id': job_id,
+            'status': 'queued',
+            'status_url': f'/api/jobs/{job_id}',
+            'week_start': week_start
+        }), 202
+        
+    except ValueError as e:
+        return jsonify({
+            'success': False,
+            'error': str(e),
+            'message': 'Configura la variable de entorno ANTHROPIC_API_KEY'
+        }), 400
+    except Exception as e:
+        return jsonify({
+            'success': False,
+            'error': str(e)
+        }), 400
+
+def run_menu_generation(job_id: int, payload: dict) -> dict:
+    """
+    'generate_menu' job handler: call the AI and save the menu and its recipes.
+    Profiles, preferences and recipes are read when the job runs, so a job
+    that waited in the queue still uses the latest family data. The response
+    is streamed and every finished day is published as a 'menu_day_generated'
+    event, so the UI can show days while the rest of the week is written.
+    """
+    week_start = payload['week_start']
+    preferences = payload.get('preferences') or {}
+    day_settings = payload.get('day_settings')
+    
+    adults = db.get_all_adults()
+    children = db.get_all_children()
+    
+    # Get menu preferences from database
+    menu_prefs = db.get_menu_preferences()
+    preferences.update({
+        'include_weekend': menu_prefs.get('include_weekend', True),
+        'include_breakfast': menu_prefs.get('include_breakfast', True),
+        'include_lunch': menu_prefs.get('include_lunch', True),
+        'include_dinner': menu_prefs.get('include_dinner', True),
+        'excluded_days': menu_prefs.get('excluded_days', [])
+    })
+    
+    # Get historical ratings for learning
+    historical_ratings = db.get_all_menu_ratings(limit=30)
+    
+    # Get the recipes most relevant to this family (profiles, ratings, recent menus)
+    recipes, recommended = select_prompt_recipes(adults, children, historical_ratings)
+    
+    # Generate menu with enhanced parameters
+    gen = get_menu_generator()
+    mode = payload.get('mode', 'weekly')
+    generate = gen.generate_weekly_menu_parallel if mode == 'parallel' else gen.generate_weekly_menu
+    result = generate(
+        adults=adults, 
+        children=children, 
+        recipes=recipes, 
+        preferences=preferences,
+        day_settings=day_settings,  # Pass day settings to generator
+        historical_ratings=historical_ratings,  # Pass historical ratings for learning
+        recommended=recommended,
+        use_cache=not payload.get('fresh', False),
+        on_day=lambda menu_type, day_name, day_menu: db.publish_event('menu_day_generated', {
+            'job_id': job_id,
+            'week_start': week_start,
+            'menu_type': menu_type,
+            'day_name': day_name,
+            'day_menu': day_menu
+        })
+    )
+    
+    if not result['success']:
+        return result
+    
+    # Save menu to database with specific week_start
+    
+    # Include raw_response so frontend can use it if menu parsing fails
+    # (save_weekly_menu stores it compressed in menu_raw_responses)
+    metadata = {
+        'generated_at': result['generated_at'],
+        'generation_mode': mode,
+        'day_settings': day_settings,
+        'preferences': preferences,
+        'raw_response': result.get('raw_response', '')  # Include raw response for fallback
+    }
+    
+    # Menu and its recipes are saved in one unit of work (one connection, one commit)
+    with db.transaction():
         menu_id = db.save_weekly_menu(
             week_start, 
             result['menu'],
@@ -615,51 +896,147 @@ def generate_menu():
         
         # Extract and save recipes from the generated menu
         try:
-            saved_recipe_ids = db.extract_and_save_recipes_from_menu(result['menu'])
+            with db.transaction(savepoint=True):
+                saved_recipe_ids = db.extract_and_save_recipes_from_menu(result['menu'])
             print(f"[GenerateMenu] Saved {len(saved_recipe_ids)} recipes from menu")
         except Exception as e:
             print(f"[GenerateMenu] Error saving recipes from menu: {e}")
             # Don't fail menu generation if recipe saving fails
+    
+    result['menu_id'] = menu_id
+    result['week_start'] = week_start  # Include the week_start in response
+    # The raw response is kept in menu_raw_responses (/api/menu/<id>/raw-response)
+    # rather than copied into every job row
+    result.pop('raw_response', None)
+    
+    return result
+
+job_queue = JobQueue(db, workers=JOB_WORKERS)
+job_queue.register('generate_menu', run_menu_generation)
+
+def start_background_workers():
+    """
+    Start this process's job workers so queued jobs (including ones left over
+    from a restart) run without waiting for a new submit. Called by gunicorn
+    in every worker process (gunicorn.conf.py) and by the development server.
+    """
+    job_queue.start()
+    import_queue.start()
+
+recipe_index = RecipeIndex(db)
+
+def select_prompt_recipes(adults, children, historical_ratings):
+    """
+    Recipes for a menu prompt: a profile-only selection for the cached family
+    context (it only changes with the family or the recipe library) and the
+    titles ranked with ratings and recent menus for the per-request part,
+    both from one scoring pass over the library
+    """
+    recipes, ranked = recipe_index.select_for_prompt(adults, children, historical_ratings, db.get_recent_menus())
+    return recipes, [recipe['title'] for recipe in ranked]
+
+@app.route('/api/jobs/<int:job_id>', methods=['GET'])
+def get_job_status(job_id):
+    """Status of a background job; result is set once it has succeeded or failed"""
+    job = db.get_job(job_id)
+    if job is None:
+        return jsonify({
+            'success': False,
+            'error': 'Trabajo no encontrado'
+        }), 404
+    
+    response = jsonify({
+        'success': True,
+        'data': job
+    })
+    response.headers['Cache-Control'] = 'no-store'
+    return response
+
+# Cache-Control per polled menu route. Browsers keep the body but revalidate
+# with If-None-Match, so an unchanged menu costs a bodiless 304.
+MENU_CACHE_CONTROL = {
+    'latest': 'no-cache',
+    # Depends on the server's current date, so never share it between clients
+    'current-week': 'private, no-cache',
+    'not-found': 'no-store',
+}
+
+def menu_etag(menu, *variant) -> str:
+    """Strong ETag from the menu id, its version stamp and anything else the body depends on"""
+    return '-'.join(['menu', str(menu['id']), f"v{menu.get('version') or 1}", *map(str, variant)])
+
+def not_modified(etag: str, cache_control: str):
+    """304 for a client whose If-None-Match already matches, or None"""
+    if not request.if_none_match.contains(etag):
+        return None
+    response = app.response_class(status=304)
+    response.set_etag(etag)
+    response.headers['Cache-Control'] = cache_control
+    return response
+
+def with_etag(response, etag: str, cache_control: str):
+    """Attach the ETag and Cache-Control headers to a full menu response"""
+    response.set_etag(etag)
+    response.headers['Cache-Control'] = cache_control
+    return response
+
+@app.route('/api/menu/latest', methods=['GET'])
+def get_latest_menu():
+    """Get the most recent menu (supports If-None-Match)"""
+    try:
+        # Answer unchanged polls from the version stamp, without loading menu_data
+        stamp = db.get_menu_stamp()
+        if stamp:
+            response = not_modified(menu_etag(stamp), MENU_CACHE_CONTROL['latest'])
+            if response:
+                return response
         
-        result['menu_id'] = menu_id
-        result['week_start'] = week_start  # Include the week_start in response
+        menu = db.get_latest_menu()
         
-        return jsonify(result)
+        if not menu:
+            response = jsonify({
+                'success': False,
+                'error': 'No hay menús disponibles'
+            })
+            response.headers['Cache-Control'] = MENU_CACHE_CONTROL['not-found']
+            return response, 404
+        
+        return with_etag(jsonify({
+            'success': True,
+            'data': menu
+        }), menu_etag(menu), MENU_CACHE_CONTROL['latest'])
         
-    except ValueError as e:
-        return jsonify({
-            'success': False,
-            'error': str(e),
-            'message': 'Configura la variable de entorno ANTHROPIC_API_KEY'
-        }), 400
     except Exception as e:
         return jsonify({
             'success': False,
             'error': str(e)
         }), 400
 
-@app.route('/api/menu/latest', methods=['GET'])
-def get_latest_menu():
-    """Get the most recent menu"""
+@app.route('/api/menu/<int:menu_id>/raw-response', methods=['GET'])
+def get_menu_raw_response(menu_id):
+    """Get the raw Claude response for a menu (only needed for the parsing fallback)"""
     try:
-        menu = db.get_latest_menu()
+        raw_response = db.get_menu_raw_response(menu_id)
         
-        if not menu:
+        if raw_response is None:
             return jsonify({
                 'success': False,
-                'error': 'No hay menús disponibles'
+                'error': 'No hay respuesta original para este menú'
             }), 404
         
         return jsonify({
             'success': True,
-            'data': menu
+            'data': {
+                'menu_id': menu_id,
+                'raw_response': raw_response
+            }
         })
         
     except Exception as e:
         return jsonify({
             'success': False,
             'error': str(e)
-        }), 400
+        }), 500
 
 @app.route('/api/menu/week/<week_start>', methods=['GET'])
 def get_menu_by_week(week_start):
@@ -694,6 +1071,18 @@ def get_current_week_menu():
         days_since_monday = today.weekday()  # 0 = Monday, 6 = Sunday
         week_start = (today - timedelta(days=days_since_monday)).strftime('%Y-%m-%d')
         
+        cache_control = MENU_CACHE_CONTROL['current-week']
+        
+        # Answer unchanged polls from the version stamps, without loading menu_data
+        stamp = db.get_menu_stamp(week_start)
+        if stamp:
+            response = not_modified(menu_etag(stamp, week_start), cache_control)
+        else:
+            stamp = db.get_menu_stamp()
+            response = stamp and not_modified(menu_etag(stamp, week_start, 'fallback'), cache_control)
+        if response:
+            return response
+        
         print(f"[GetCurrentWeekMenu] Calculating current week start: {week_start} (today: {today.strftime('%Y-%m-%d')})")
         
         menu = db.get_menu_by_week_start(week_start)
@@ -705,25 +1094,27 @@ def get_current_week_menu():
             
             if latest_menu:
                 print(f"[GetCurrentWeekMenu] Using latest menu as fallback (week_start: {latest_menu.get('week_start_date', 'unknown')})")
-                return jsonify({
+                return with_etag(jsonify({
                     'success': True,
                     'data': latest_menu,
                     'week_start': latest_menu.get('week_start_date', week_start),
                     'is_fallback': True  # Indicate this is a fallback
-                })
+                }), menu_etag(latest_menu, week_start, 'fallback'), cache_control)
             else:
-                return jsonify({
+                response = jsonify({
                     'success': False,
                     'error': 'No hay menú disponible para esta semana',
                     'week_start': week_start
-                }), 404
+                })
+                response.headers['Cache-Control'] = MENU_CACHE_CONTROL['not-found']
+                return response, 404
         
-        return jsonify({
+        return with_etag(jsonify({
             'success': True,
             'data': menu,
             'week_start': week_start,
             'is_fallback': False
-        })
+        }), menu_etag(menu, week_start), cache_control)
         
     except Exception as e:
         print(f"[GetCurrentWeekMenu] Error: {e}")
@@ -856,9 +1247,13 @@ def get_shopping_list(week_start):
 
 @app.route('/api/menu/all', methods=['GET'])
 def get_all_menus():
-    """Get all available weekly menus"""
+    """
+    Get all available weekly menus.
+    Returns only id, week_start_date, rating and created_at unless ?full=true
+    """
     try:
-        menus = db.get_all_menus()
+        full = request.args.get('full', 'false').lower() in ('1', 'true', 'yes')
+        menus = db.get_all_menus(summary=not full)
         
         return jsonify({
             'success': True,
@@ -984,9 +1379,6 @@ def regenerate_individual_meal():
                 'error': 'Debes añadir al menos un perfil familiar primero'
             }), 400
         
-        # Get recipes
-        recipes = db.get_all_recipes()
-        
         # Get menu preferences
         menu_prefs = db.get_menu_preferences()
         preferences = {
@@ -1000,6 +1392,9 @@ def regenerate_individual_meal():
         # Get historical ratings for learning
         historical_ratings = db.get_all_menu_ratings(limit=30)
         
+        # Same relevance-ranked recipes as the weekly generation
+        recipes, recommended = select_prompt_recipes(adults, children, historical_ratings)
+        
         # Generate menu for single meal
         gen = get_menu_generator()
         
@@ -1023,13 +1418,15 @@ def regenerate_individual_meal():
         if target_group == 'adultos':
             result = gen.generate_single_day_menu(
                 adults=adults,
-                children=[],
+                children=children,  # Whole family: keeps the cached prompt prefix identical
                 recipes=recipes,
                 preferences=preferences,
                 day_name=day_name,
                 menu_type='adultos',
                 specific_meal=meal_type,  # Only generate this specific meal
-                historical_ratings=historical_ratings
+                historical_ratings=historical_ratings,
+                recommended=recommended,
+                use_cache=not data.get('fresh', False)
             )
             
             if result['success'] and 'day_menu' in result and meal_type in result['day_menu']:
@@ -1043,14 +1440,16 @@ def regenerate_individual_meal():
         
         elif target_group == 'ninos':
             result = gen.generate_single_day_menu(
-                adults=[],
+                adults=adults,  # Whole family: keeps the cached prompt prefix identical
                 children=children,
                 recipes=recipes,
                 preferences=preferences,
                 day_name=day_name,
                 menu_type='ninos',
                 specific_meal=meal_type,  # Only generate this specific meal
-                historical_ratings=historical_ratings
+                historical_ratings=historical_ratings,
+                recommended=recommended,
+                use_cache=not data.get('fresh', False)
             )
             
             if result['success'] and 'day_menu' in result and meal_type in result['day_menu']:
@@ -1074,7 +1473,14 @@ def regenerate_individual_meal():
         metadata['last_regenerated_meal'] = f'{day_name}_{meal_type}'
         metadata['last_regenerated_date'] = datetime.now().isoformat()
         
-        db.save_weekly_menu(week_start_date, menu_data, metadata)
+        with db.transaction():
+            menu_id = db.save_weekly_menu(week_start_date, menu_data, metadata)
+            db.publish_event('menu_regenerated', {
+                'menu_id': menu_id,
+                'week_start_date': week_start_date,
+                'day_name': day_name,
+                'meal_type': meal_type
+            })
         
         return jsonify({
             'success': True,
@@ -1126,9 +1532,6 @@ def regenerate_menu_day():
                 'error': 'Debes añadir al menos un perfil familiar primero'
             }), 400
         
-        # Get recipes
-        recipes = db.get_all_recipes()
-        
         # Get menu preferences
         menu_prefs = db.get_menu_preferences()
         preferences = {
@@ -1142,6 +1545,9 @@ def regenerate_menu_day():
         # Get historical ratings for learning
         historical_ratings = db.get_all_menu_ratings(limit=30)
         
+        # Same relevance-ranked recipes as the weekly generation
+        recipes, recommended = select_prompt_recipes(adults, children, historical_ratings)
+        
         # Generate menu for single day for both adults and children
         gen = get_menu_generator()
         
@@ -1152,12 +1558,14 @@ def regenerate_menu_day():
         if adults:
             result_adults = gen.generate_single_day_menu(
                 adults=adults,
-                children=[],  # Only adults
+                children=children,  # Whole family: keeps the cached prompt prefix identical
                 recipes=recipes,
                 preferences=preferences,
                 day_name=day_name,
                 menu_type='adultos',
-                historical_ratings=historical_ratings
+                historical_ratings=historical_ratings,
+                recommended=recommended,
+                use_cache=not data.get('fresh', False)
             )
             
             if result_adults['success']:
@@ -1170,13 +1578,15 @@ def regenerate_menu_day():
         # Generate for children if they exist
         if children:
             result_children = gen.generate_single_day_menu(
-                adults=[],  # Only children
+                adults=adults,  # Whole family: keeps the cached prompt prefix identical
                 children=children,
                 recipes=recipes,
                 preferences=preferences,
                 day_name=day_name,
                 menu_type='ninos',
-                historical_ratings=historical_ratings
+                historical_ratings=historical_ratings,
+                recommended=recommended,
+                use_cache=not data.get('fresh', False)
             )
             
             if result_children['success']:
@@ -1198,7 +1608,13 @@ def regenerate_menu_day():
         metadata['last_regenerated_day'] = day_name
         metadata['last_regenerated_date'] = datetime.now().isoformat()
         
-        db.save_weekly_menu(week_start_date, menu_data, metadata)
+        with db.transaction():
+            menu_id = db.save_weekly_menu(week_start_date, menu_data, metadata)
+            db.publish_event('menu_regenerated', {
+                'menu_id': menu_id,
+                'week_start_date': week_start_date,
+                'day_name': day_name
+            })
         
         return jsonify({
             'success': True,
@@ -1216,6 +1632,67 @@ def regenerate_menu_day():
             'error': str(e)
         }), 400
 
+# ==================== CHANGE EVENTS (SSE) API ====================
+
+# Every open stream holds a server thread, so each process serves at most
+# EVENT_STREAM_MAX_CLIENTS of them (extra subscribers get a 503 and retry after
+# EVENT_STREAM_RETRY seconds). A stream sends a keep-alive comment when idle and
+# ends after EVENT_STREAM_MAX_DURATION, when the browser's EventSource
+# reconnects with Last-Event-ID, so the slots rotate between open pages.
+EVENT_STREAM_MAX_CLIENTS = int(os.getenv('EVENT_STREAM_MAX_CLIENTS', '4'))
+EVENT_STREAM_RETRY = 3
+EVENT_STREAM_KEEPALIVE = 15.0
+EVENT_STREAM_MAX_DURATION = 60.0
+event_stream_slots = threading.BoundedSemaphore(EVENT_STREAM_MAX_CLIENTS)
+
+def format_sse(event: dict) -> str:
+    """Serialize an events row as a Server-Sent Events message"""
+    payload = json.dumps(dict(event['data'], created_at=event['created_at']), ensure_ascii=False)
+    return f"id: {event['id']}\nevent: {event['event_type']}\ndata: {payload}\n\n"
+
+@app.route('/api/events', methods=['GET'])
+def event_stream():
+    """
+    Server-Sent Events stream of small change notifications:
+    menu_updated, menu_regenerated, day_rating_changed, cleaning_assignment_updated.
+    Clients refetch only the affected fragment. Resumes after Last-Event-ID
+    (or ?last_event_id=); new subscribers only get events from now on.
+    Answers 503 with Retry-After when this process has no free stream slot.
+    """
+    last_event_id = request.headers.get('Last-Event-ID') or request.args.get('last_event_id')
+    try:
+        last_id = int(last_event_id) if last_event_id else db.get_latest_event_id()
+    except ValueError:
+        last_id = db.get_latest_event_id()
+    
+    if not event_stream_slots.acquire(blocking=False):
+        return Response(f'retry: {EVENT_STREAM_RETRY * 1000}\n\n', status=503, mimetype='text/event-stream', headers={
+            'Cache-Control': 'no-cache',
+            'Retry-After': str(EVENT_STREAM_RETRY)
+        })
+    
+    def stream(last_id):
+        yield f'retry: {EVENT_STREAM_RETRY * 1000}\n\n'
+        started = time.monotonic()
+        while True:
+            remaining = EVENT_STREAM_MAX_DURATION - (time.monotonic() - started)
+            if remaining <= 0:
+                break
+            events = db.wait_for_events(last_id, min(EVENT_STREAM_KEEPALIVE, remaining))
+            for event in events:
+                yield format_sse(event)
+                last_id = event['id']
+            if not events:
+                yield ': keep-alive\n\n'
+    
+    response = Response(stream(last_id), mimetype='text/event-stream', headers={
+        'Cache-Control': 'no-cache',
+        'X-Accel-Buffering': 'no'
+    })
+    # Frees the slot when the stream ends or the client goes away
+    response.call_on_close(event_stream_slots.release)
+    return response
+
 @app.route('/api/family/summary', methods=['GET'])
 def family_summary():
     """Get family summary"""
@@ -1398,11 +1875,10 @@ def test_api_key():
 def get_cleaning_capacity():
     """Get cleaning capacity settings"""
     try:
-        conn = db.get_connection()
-        cursor = conn.cursor()
-        cursor.execute('SELECT * FROM cleaning_capacity ORDER BY member_type')
-        capacities = cursor.fetchall()
-        conn.close()
+        with db.transaction() as conn:
+            cursor = conn.cursor()
+            cursor.execute('SELECT * FROM cleaning_capacity ORDER BY member_type')
+            capacities = cursor.fetchall()
         
         # Convert to dictionary format
         capacity_dict = {}
@@ -1436,27 +1912,24 @@ def save_cleaning_capacity():
         data = request.json
         print(f"[CleaningCapacity] Received capacity settings: {data}")
         
-        conn = db.get_connection()
-        cursor = conn.cursor()
-        
-        # Update each capacity type
-        for member_type, settings in data.items():
-            cursor.execute('''
-                UPDATE cleaning_capacity SET 
-                max_daily_percentage = ?, max_weekly_hours = ?, task_difficulty_max = ?,
-                preferred_areas = ?, can_do_complex_tasks = ?, updated_at = CURRENT_TIMESTAMP
-                WHERE member_type = ?
-            ''', (
-                settings.get('max_daily_percentage', 100),
-                settings.get('max_weekly_hours', 40),
-                settings.get('task_difficulty_max', 5),
-                json.dumps(settings.get('preferred_areas', [])),
-                1 if settings.get('can_do_complex_tasks') else 0,
-                member_type
-            ))
-        
-        conn.commit()
-        conn.close()
+        with db.transaction() as conn:
+            cursor = conn.cursor()
+            
+            # Update each capacity type
+            for member_type, settings in data.items():
+                cursor.execute('''
+                    UPDATE cleaning_capacity SET 
+                    max_daily_percentage = ?, max_weekly_hours = ?, task_difficulty_max = ?,
+                    preferred_areas = ?, can_do_complex_tasks = ?, updated_at = CURRENT_TIMESTAMP
+                    WHERE member_type = ?
+                ''', (
+                    settings.get('max_daily_percentage', 100),
+                    settings.get('max_weekly_hours', 40),
+                    settings.get('task_difficulty_max', 5),
+                    json.dumps(settings.get('preferred_areas', [])),
+                    1 if settings.get('can_do_complex_tasks') else 0,
+                    member_type
+                ))
         
         return jsonify({
             'success': True,
@@ -1475,11 +1948,10 @@ def get_house_config():
     """Get house configuration"""
     try:
         # Get configuration from database
-        conn = db.get_connection()
-        cursor = conn.cursor()
-        cursor.execute('SELECT * FROM house_config ORDER BY id DESC LIMIT 1')
-        config = cursor.fetchone()
-        conn.close()
+        with db.transaction() as conn:
+            cursor = conn.cursor()
+            cursor.execute('SELECT * FROM house_config ORDER BY id DESC LIMIT 1')
+            config = cursor.fetchone()
         
         if config:
             # Parse config_data from JSON
@@ -1526,37 +1998,32 @@ def save_house_config():
         print(f"[HouseConfig] Received configuration: {data}")
         
         # Get connection and save to database
-        conn = db.get_connection()
-        cursor = conn.cursor()
-        
-        # Check if there's already a record
-        cursor.execute('SELECT id FROM house_config ORDER BY id DESC LIMIT 1')
-        existing = cursor.fetchone()
-        
         import json
         config_json = json.dumps(data)
         
-        if existing:
-            # Update existing record
-            cursor.execute('''
-                UPDATE house_config SET 
-                config_data = ?, updated_at = CURRENT_TIMESTAMP
-                WHERE id = ?
-            ''', (config_json, existing[0]))
-            print(f"[HouseConfig] Updated {cursor.rowcount} rows")
-        else:
-            # Insert new record
-            cursor.execute('''
-                INSERT INTO house_config (config_data)
-                VALUES (?)
-            ''', (config_json,))
-            print(f"[HouseConfig] Inserted new record")
-        
-        # Commit changes
-        conn.commit()
-        
-        # Close connection
-        db._close_connection(conn)
+        # Committed and released by the unit of work
+        with db.transaction() as conn:
+            cursor = conn.cursor()
+            
+            # Check if there's already a record
+            cursor.execute('SELECT id FROM house_config ORDER BY id DESC LIMIT 1')
+            existing = cursor.fetchone()
+            
+            if existing:
+                # Update existing record
+                cursor.execute('''
+                    UPDATE house_config SET 
+                    config_data = ?, updated_at = CURRENT_TIMESTAMP
+                    WHERE id = ?
+                ''', (config_json, existing[0]))
+                print(f"[HouseConfig] Updated {cursor.rowcount} rows")
+            else:
+                # Insert new record
+                cursor.execute('''
+                    INSERT INTO house_config (config_data)
+                    VALUES (?)
+                ''', (config_json,))
+                print(f"[HouseConfig] Inserted new record")
         
         return jsonify({
             'success': True,
@@ -1578,11 +2045,10 @@ def generate_smart_cleaning_plan():
     """
     try:
         # Get house configuration from database
-        conn = db.get_connection()
-        cursor = conn.cursor()
-        cursor.execute('SELECT * FROM house_config ORDER BY id DESC LIMIT 1')
-        house_config_record = cursor.fetchone()
-        conn.close()
+        with db.transaction() as conn:
+            cursor = conn.cursor()
+            cursor.execute('SELECT * FROM house_config ORDER BY id DESC LIMIT 1')
+            house_config_record = cursor.fetchone()
         
         if house_config_record:
             # Parse config_data from JSON
@@ -1623,11 +2089,10 @@ def generate_smart_cleaning_plan():
         children = db.get_all_children()
         
         # Get cleaning capacities
-        conn = db.get_connection()
-        cursor = conn.cursor()
-        cursor.execute('SELECT member_type, max_daily_percentage, max_weekly_hours, task_difficulty_max, preferred_areas, can_do_complex_tasks FROM cleaning_capacity')
-        capacities = cursor.fetchall()
-        conn.close()
+        with db.transaction() as conn:
+            cursor = conn.cursor()
+            cursor.execute('SELECT member_type, max_daily_percentage, max_weekly_hours, task_difficulty_max, preferred_areas, can_do_complex_tasks FROM cleaning_capacity')
+            capacities = cursor.fetchall()
         
         # Convert capacities to dictionary
         capacity_dict = {}
@@ -2035,7 +2500,8 @@ def health():
     """Health check endpoint"""
     return jsonify({
         'status': 'ok',
-        'timestamp': datetime.now().isoformat()
+        'timestamp': datetime.now().isoformat(),
+        'database_pool': db.pool_metrics()
     })
 
 # ==================== TEMPORARY: GET API KEY FOR .ENV ====================
@@ -2161,6 +2627,10 @@ if __name__ == '__main__':
         
         print("="*60 + "\n")
         
+        # With the reloader only the child process serves requests
+        if os.environ.get('WERKZEUG_RUN_MAIN') == 'true':
+            start_background_workers()
+        
         app.run(
             debug=True,  # Enable debug mode for auto-reload
             host='0.0.0.0',
@@ -0,0 +1,166 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Benchmark for the hot menu, rating and cleaning-calendar queries.
+
+Seeds a temporary SQLite database with several years of weekly menus, day
+ratings and calendar cleaning assignments, then times each query with the
+SCHEMA_MIGRATIONS indexes dropped and again with them in place.
+
+Usage:
+    python benchmark_database.py [--years 10] [--iterations 200]
+"""
+import argparse
+import json
+import os
+import random
+import tempfile
+import time
+from datetime import date, timedelta
+
+from database import Database, SCHEMA_MIGRATIONS
+
+DAYS = ['lunes', 'martes', 'miércoles', 'jueves', 'viernes', 'sábado', 'domingo']
+
+
+def seed(db: Database, years: int):
+    """Fill the database with `years` of weekly menus, ratings and cleaning assignments"""
+    rng = random.Random(42)
+    start = date.today() - timedelta(weeks=52 * years)
+    meal = {'nombre': 'Plato', 'ingredientes': ['ingrediente'] * 12, 'instrucciones': 'x' * 400}
+    menu_json = json.dumps({
+        'menu_adultos': {'dias': {day: {'comida': meal, 'cena': meal} for day in DAYS}},
+        'menu_ninos': {'dias': {day: {'comida': meal, 'cena': meal} for day in DAYS}},
+    })
+
+    with db.transaction() as conn:
+        cursor = conn.cursor()
+        menus = []
+        for week in range(52 * years):
+            week_start = start + timedelta(weeks=week)
+            created_at = f'{week_start.isoformat()} 10:00:00'
+            menus.append((week_start.isoformat(), menu_json, '{}', rng.choice([None, 1, 2, 3, 4, 5]), created_at))
+        cursor.executemany('''
+            INSERT INTO weekly_menus (week_start_date, menu_data, metadata, rating, created_at)
+            VALUES (?, ?, ?, ?, ?)
+        ''', menus)
+
+        cursor.execute('SELECT id, week_start_date, created_at FROM weekly_menus')
+        ratings = [
+            (row[0], row[1], day, menu_type, rng.randint(1, 5), row[2])
+            for row in cursor.fetchall()
+            for day in DAYS
+            for menu_type in ('adultos', 'ninos')
+        ]
+        cursor.executemany('''
+            INSERT INTO menu_day_ratings (menu_id, week_start_date, day_name, menu_type, rating, created_at)
+            VALUES (?, ?, ?, ?, ?, ?)
+        ''', ratings)
+
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS cleaning_assignments (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                task_id INTEGER,
+                member_id INTEGER,
+                member_type TEXT,
+                dia_semana TEXT,
+                week_start DATE,
+                fecha_especifica DATE,
+                completado BOOLEAN DEFAULT 0
+            )
+        ''')
+        assignments = []
+        for offset in range(7 * 52 * years):
+            day = start + timedelta(days=offset)
+            week_start = day - timedelta(days=day.weekday())
+            for task_id in range(5):
+                assignments.append((task_id, rng.randint(1, 4), 'adulto', DAYS[day.weekday()],
+                                    week_start.isoformat(), day.isoformat()))
+        cursor.executemany('''
+            INSERT INTO cleaning_assignments (task_id, member_id, member_type, dia_semana, week_start, fecha_especifica)
+            VALUES (?, ?, ?, ?, ?, ?)
+        ''', assignments)
+
+    return len(menus), len(ratings), len(assignments)
+
+
+def hot_queries(sample_week: str, sample_day: str, sample_menu_id: int):
+    """(label, sql, params) for each access pattern covered by SCHEMA_MIGRATIONS"""
+    return [
+        ('get_latest_menu', 'SELECT * FROM weekly_menus ORDER BY created_at DESC LIMIT 1', ()),
+        ('get_menu_by_week_start', 'SELECT * FROM weekly_menus WHERE week_start_date = ?', (sample_week,)),
+        ('get_highly_rated_menus', '''
+            SELECT week_start_date, menu_data, rating, created_at FROM weekly_menus
+            WHERE rating >= ? ORDER BY rating DESC, created_at DESC LIMIT ?
+        ''', (4, 10)),
+        ('get_menu_day_rating', '''
+            SELECT rating FROM menu_day_ratings WHERE menu_id = ? AND day_name = ? AND menu_type = ?
+        ''', (sample_menu_id, 'martes', 'adultos')),
+        ('get_all_menu_ratings', 'SELECT * FROM menu_day_ratings ORDER BY created_at DESC LIMIT ?', (30,)),
+        ('calendar cleaning by date', '''
+            SELECT * FROM cleaning_assignments
+            WHERE fecha_especifica = ? OR (fecha_especifica IS NULL AND dia_semana = ?)
+        ''', (sample_day, 'martes')),
+    ]
+
+
+def time_queries(db: Database, queries, iterations: int):
+    """Average milliseconds per execution for each query"""
+    timings = {}
+    with db.transaction() as conn:
+        for label, sql, params in queries:
+            started = time.perf_counter()
+            for _ in range(iterations):
+                conn.execute(sql, params).fetchall()
+            timings[label] = (time.perf_counter() - started) * 1000 / iterations
+    return timings
+
+
+def drop_indexes(db: Database):
+    """Remove the migration indexes so the baseline runs on the old schema"""
+    with db.transaction() as conn:
+        for _, _, _, steps in SCHEMA_MIGRATIONS:
+            for step in steps:
+                if isinstance(step, str) and step.startswith('CREATE INDEX'):
+                    index_name = step.split('EXISTS ')[1].split()[0]
+                    conn.execute(f'DROP INDEX IF EXISTS {index_name}')
+        conn.execute('DELETE FROM schema_migrations')
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--years', type=int, default=10, help='years of weekly menus to seed')
+    parser.add_argument('--iterations', type=int, default=200, help='executions per query')
+    args = parser.parse_args()
+
+    fd, path = tempfile.mkstemp(suffix='.db')
+    os.close(fd)
+    db = Database(db_url=f'sqlite:///{path}')
+    try:
+        menus, ratings, assignments = seed(db, args.years)
+        print(f"Seeded {menus} menus, {ratings} day ratings, {assignments} cleaning assignments")
+
+        with db.transaction() as conn:
+            row = conn.execute('SELECT id, week_start_date FROM weekly_menus ORDER BY id LIMIT 1 OFFSET ?',
+                               (menus // 2,)).fetchone()
+        sample_day = (date.fromisoformat(row[1]) + timedelta(days=1)).isoformat()
+        queries = hot_queries(row[1], sample_day, row[0])
+
+        drop_indexes(db)
+        before = time_queries(db, queries, args.iterations)
+        db.init_database()
+        after = time_queries(db, queries, args.iterations)
+
+        print(f"\n{'query':<28}{'no index (ms)':>15}{'indexed (ms)':>15}{'speed-up':>10}")
+        for label, _, _ in queries:
+            speedup = before[label] / after[label] if after[label] else float('inf')
+            print(f"{label:<28}{before[label]:>15.3f}{after[label]:>15.3f}{speedup:>9.1f}x")
+    finally:
+        db.close_connections()
+        for suffix in ('', '-wal', '-shm'):
+            if os.path.exists(path + suffix):
+                os.unlink(path + suffix)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,97 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Benchmark for the JSON parsers in json_stream.
+
+Times loads_tolerant (TolerantJSONParser) on a generated weekly menu response
+wrapped in prose and a code fence, against json.loads on the bare JSON, and
+on a document four times larger to check that parsing stays linear.
+
+Also times iter_json_strings on a multi-megabyte Pinterest-style state
+script: the wait for the first value and a full scan, against json.loads.
+
+Usage:
+    python benchmark_json_parsing.py [--iterations 5] [--pins 20000]
+"""
+import argparse
+import json
+import time
+
+from json_stream import iter_json_strings, loads_tolerant
+
+DAYS = ['lunes', 'martes', 'miércoles', 'jueves', 'viernes', 'sábado', 'domingo']
+
+
+def weekly_menu_response() -> str:
+    """A weekly menu response shaped like the ones Claude returns (about 60 KB)"""
+    meal = lambda name: {
+        'nombre': name,
+        'ingredientes': [f'{i * 50}g de ingrediente {i}' for i in range(1, 11)],
+        'tiempo_prep': 25,
+        'calorias': 540,
+        'nutrientes': {'proteinas': '32g', 'carbohidratos': '48g', 'grasas': '18g', 'fibra': '7g'},
+        'instrucciones': '1. Preparar los ingredientes. 2. Cocinar a fuego medio durante 20 minutos. ' * 4,
+        'porque_seleccionada': 'Equilibrado, rápido y con ingredientes de temporada que gustan a toda la familia.'
+    }
+    menu = {
+        f'menu_{menu_type}': {
+            'dias': {day: {m: meal(f'{m} del {day} ({menu_type})') for m in ('desayuno', 'comida', 'merienda', 'cena')}
+                     for day in DAYS},
+            'lista_compras': {'verduras': [f'verdura {i}' for i in range(30)], 'proteinas': ['pollo', 'merluza']}
+        }
+        for menu_type in ('adultos', 'ninos')
+    }
+    return 'Aquí tienes el menú semanal:\n\n```json\n' + json.dumps(menu, indent=2, ensure_ascii=False) + '\n```'
+
+
+def pinterest_state(pins: int) -> str:
+    """A Pinterest-style __PWS_DATA__ script with `pins` pins (about 200 bytes each)"""
+    return json.dumps({'props': {'initialReduxState': {'pins': [
+        {'id': str(i), 'images': {'orig': {'url': f'https://i.pinimg.com/originals/{i}.jpg'}},
+         'description': 'Receta ' * 20}
+        for i in range(pins)
+    ]}}})
+
+
+def best_of(function, argument, iterations: int) -> float:
+    """Fastest of `iterations` runs, in milliseconds"""
+    timings = []
+    for _ in range(iterations):
+        started = time.perf_counter()
+        function(argument)
+        timings.append(time.perf_counter() - started)
+    return min(timings) * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--iterations', type=int, default=5, help='runs per measurement (best is kept)')
+    parser.add_argument('--pins', type=int, default=20000, help='pins in the Pinterest state script')
+    args = parser.parse_args()
+
+    text = weekly_menu_response()
+    body = text[text.index('{'):text.rindex('}') + 1]
+    big = '{"semanas": [' + ', '.join([body] * 4) + ']}'
+
+    baseline = best_of(json.loads, body, args.iterations)
+    tolerant = best_of(loads_tolerant, text, args.iterations)
+    tolerant_big = best_of(loads_tolerant, big, args.iterations)
+
+    print(f"Weekly menu response: {len(text) / 1024:.0f} KB\n")
+    print(f"  {'json.loads (bare JSON)':<34} {baseline:8.2f} ms")
+    print(f"  {'loads_tolerant (fenced response)':<34} {tolerant:8.2f} ms  ({tolerant / baseline:.1f}x json.loads)")
+    print(f"  {'loads_tolerant (4x document)':<34} {tolerant_big:8.2f} ms  ({tolerant_big / tolerant:.1f}x the 1x time)")
+
+    state = pinterest_state(args.pins)
+    first = best_of(lambda text: next(iter_json_strings(text)), state, args.iterations)
+    scan = best_of(lambda text: sum(1 for _ in iter_json_strings(text)), state, args.iterations)
+    decode = best_of(json.loads, state, args.iterations)
+
+    print(f"\nPinterest state script: {len(state) / 1024 / 1024:.1f} MB, {args.pins} pins\n")
+    print(f"  {'iter_json_strings first value':<34} {first:8.3f} ms")
+    print(f"  {'iter_json_strings full scan':<34} {scan:8.2f} ms")
+    print(f"  {'json.loads':<34} {decode:8.2f} ms")
+
+
+if __name__ == '__main__':
+    main()
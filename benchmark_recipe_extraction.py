@@ -0,0 +1,152 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Benchmark for recipe page extraction.
+
+Times the CPU cost per page of the single-pass pipeline (one lxml tree shared
+by JSON-LD, manual extraction and trafilatura, which is skipped for complete
+JSON-LD recipes) against the previous shape of the pipeline, where the page
+was parsed for the structured data and again by trafilatura on every page.
+With beautifulsoup4 installed the original html.parser pipeline is timed too.
+
+The corpus is the pages saved in the page cache (http_cache table), the
+.html files of --pages-dir, or generated blog-style pages when neither has any.
+
+Usage:
+    python benchmark_recipe_extraction.py [--pages-dir DIR] [--generated 40] [--iterations 3]
+"""
+import argparse
+import glob
+import json
+import os
+import time
+import zlib
+
+import trafilatura
+from dotenv import load_dotenv
+
+from database import Database
+from recipe_extractor import RecipeExtractor, parse_html
+
+FILLER = ('<p>Esta receta es de las que se hacen en casa desde siempre: ingredientes sencillos, '
+          'fuego lento y paciencia. Os cuento cómo la preparamos y algunos trucos.</p>')
+
+
+def cached_pages():
+    """Bodies of the pages stored in the page cache"""
+    load_dotenv()
+    db = Database()
+    try:
+        with db.transaction() as conn:
+            cursor = conn.cursor()
+            cursor.execute('SELECT url, body FROM http_cache')
+            rows = cursor.fetchall()
+    finally:
+        db.close_connections()
+    return [(url, zlib.decompress(bytes(body))) for url, body in rows]
+
+
+def generated_pages(count: int):
+    """Blog-style recipe pages, half with a complete JSON-LD recipe"""
+    pages = []
+    for i in range(count):
+        ingredients = [f'{n + 1} ingrediente {i}-{n}' for n in range(12)]
+        steps = [f'Paso {n + 1} de la receta {i}' for n in range(8)]
+        head = ''
+        if i % 2 == 0:
+            head = '<script type="application/ld+json">%s</script>' % json.dumps({
+                '@context': 'https://schema.org', '@type': 'Recipe', 'name': f'Receta {i}',
+                'recipeIngredient': ingredients,
+                'recipeInstructions': [{'@type': 'HowToStep', 'text': step} for step in steps],
+            })
+        body = ''.join([
+            '<nav>' + '<a href="/cat">Categoría</a>' * 60 + '</nav>',
+            f'<article><h1>Receta {i}</h1>', FILLER * 120,
+            '<div class="recipe-ingredients"><ul>', ''.join(f'<li>{x}</li>' for x in ingredients), '</ul></div>',
+            '<ol class="recipe-instructions">', ''.join(f'<li>{x}</li>' for x in steps), '</ol></article>',
+            '<aside>' + '<div class="comment"><p>¡Qué rica!</p></div>' * 200 + '</aside>',
+        ])
+        html = f'<html><head><title>Receta {i}</title>{head}</head><body>{body}</body></html>'
+        pages.append((f'https://blog.example/receta-{i}', html.encode('utf-8')))
+    return pages
+
+
+def single_pass(extractor: RecipeExtractor, url: str, content: bytes):
+    return extractor._extract_from_tree(parse_html(content), url)
+
+
+def two_parses(extractor: RecipeExtractor, url: str, content: bytes):
+    tree = parse_html(content)
+    recipe = extractor._extract_json_ld(tree)
+    if not recipe or not recipe.get('title'):
+        recipe = extractor._manual_extraction(tree, url)
+    recipe['extracted_text'] = trafilatura.extract(content)
+    return recipe
+
+
+def beautifulsoup(extractor: RecipeExtractor, url: str, content: bytes):
+    import re
+    from bs4 import BeautifulSoup
+    soup = BeautifulSoup(content, 'html.parser')
+    recipe = {}
+    for script in soup.find_all('script', type='application/ld+json'):
+        try:
+            data = json.loads(script.string)
+        except (TypeError, json.JSONDecodeError):
+            continue
+        if isinstance(data, dict) and data.get('@type') == 'Recipe':
+            recipe = extractor._parse_recipe_schema(data)
+            break
+    if not recipe.get('title'):
+        section = soup.find(['div', 'section', 'ul'], class_=re.compile(r'ingredient', re.I))
+        recipe = {'title': (soup.find('h1') or soup.find('title')).get_text().strip(),
+                  'ingredients': [item.get_text().strip() for item in section.find_all(['li', 'p'])] if section else []}
+    recipe['extracted_text'] = trafilatura.extract(content)
+    return recipe
+
+
+def timed(pipeline, extractor, pages, iterations: int) -> float:
+    """Mean CPU milliseconds per page"""
+    started = time.process_time()
+    for _ in range(iterations):
+        for url, content in pages:
+            pipeline(extractor, url, content)
+    return (time.process_time() - started) * 1000 / (iterations * len(pages))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--pages-dir', help='directory of saved .html pages')
+    parser.add_argument('--generated', type=int, default=40, help='generated pages when there is no corpus')
+    parser.add_argument('--iterations', type=int, default=3)
+    args = parser.parse_args()
+
+    if args.pages_dir:
+        pages = [(path, open(path, 'rb').read()) for path in sorted(glob.glob(os.path.join(args.pages_dir, '*.html')))]
+        source = args.pages_dir
+    else:
+        pages, source = cached_pages(), 'page cache'
+    if not pages:
+        pages, source = generated_pages(args.generated), 'generated pages'
+
+    extractor = RecipeExtractor()
+    complete = sum(1 for url, content in pages if extractor._is_complete(extractor._extract_json_ld(parse_html(content))))
+    print(f"{len(pages)} pages from {source}, {complete} with a complete JSON-LD recipe "
+          f"(avg {sum(len(c) for _, c in pages) / len(pages) / 1024:.0f} KB)\n")
+
+    pipelines = [('single pass', single_pass), ('parse + trafilatura on bytes', two_parses)]
+    try:
+        import bs4  # noqa: F401
+        pipelines.append(('BeautifulSoup html.parser', beautifulsoup))
+    except ImportError:
+        pass
+
+    baseline = None
+    for name, pipeline in pipelines:
+        ms = timed(pipeline, extractor, pages, args.iterations)
+        baseline = baseline or ms
+        print(f"  {name:<32} {ms:8.2f} ms/page  ({ms / baseline:.2f}x)")
+
+
+if __name__ == '__main__':
+    main()
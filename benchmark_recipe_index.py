@@ -0,0 +1,77 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Benchmark for relevance-ranked recipe selection.
+
+Builds a RecipeIndex over a generated recipe library and times the index
+build and the top-k ranking of a family profile, with and without ratings
+and recent menus, as the library grows.
+
+Usage:
+    python benchmark_recipe_index.py [--sizes 1000,10000,50000] [--iterations 20]
+"""
+import argparse
+import time
+
+from recipe_index import RecipeIndex
+
+WORDS = ['pollo', 'arroz', 'tomate', 'pasta', 'lentejas', 'merluza', 'patata', 'huevo', 'queso', 'pimiento',
+         'garbanzos', 'calabacín', 'cebolla', 'ternera', 'salmón', 'espinacas']
+CUISINES = ['española', 'italiana', 'mexicana', 'japonesa']
+
+ADULTS = [{'ingredientes_favoritos': 'pollo, pasta, salmón', 'ingredientes_no_gustan': 'queso',
+           'alergias': 'huevo', 'cocinas_favoritas': 'italiana'}]
+CHILDREN = [{'ingredientes_favoritos': 'arroz', 'verduras_rechazadas': 'espinacas'}]
+
+
+def title(i: int) -> str:
+    """Title of generated recipe i (two ingredient words)"""
+    return f'{WORDS[i % len(WORDS)].capitalize()} con {WORDS[i * 5 % len(WORDS)]} {i}'
+
+
+def library(size: int):
+    """Generated recipes with the columns the index reads"""
+    return [{'id': i, 'title': title(i), 'cuisine_type': CUISINES[i % len(CUISINES)],
+             'ingredients': [WORDS[i * k % len(WORDS)] for k in (1, 3, 7, 11)]}
+            for i in range(1, size + 1)]
+
+
+def history(size: int):
+    """Day ratings and recent menus naming a few of the generated recipes"""
+    day = lambda name: {'menu_adultos': {'dias': {'lunes': {'comida': {'nombre': name}}}}}
+    ratings = [{'rating': 1 + i % 5, 'menu_type': 'adultos', 'day_name': 'lunes',
+                'menu_data': day(title(i))} for i in range(1, min(size, 200) + 1)]
+    recent = [day(title(i)) for i in range(1, 5)]
+    return ratings, recent
+
+
+def best_of(function, iterations: int) -> float:
+    """Fastest of `iterations` runs, in milliseconds"""
+    timings = []
+    for _ in range(iterations):
+        started = time.perf_counter()
+        function()
+        timings.append(time.perf_counter() - started)
+    return min(timings) * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--sizes', default='1000,10000,50000', help='comma-separated library sizes')
+    parser.add_argument('--iterations', type=int, default=20, help='runs per measurement (best is kept)')
+    parser.add_argument('--top-k', type=int, default=20)
+    args = parser.parse_args()
+
+    print(f"{'recipes':>8}{'build (ms)':>14}{'rank (ms)':>12}{'+ history (ms)':>17}")
+    for size in (int(size) for size in args.sizes.split(',')):
+        recipes = library(size)
+        ratings, recent = history(size)
+        index = RecipeIndex(db=None, top_k=args.top_k)
+        build = best_of(lambda: index.build(recipes), max(1, args.iterations // 10))
+        rank = best_of(lambda: index.rank(ADULTS, CHILDREN), args.iterations)
+        ranked = best_of(lambda: index.rank(ADULTS, CHILDREN, ratings, recent), args.iterations)
+        print(f"{size:>8}{build:>14.1f}{rank:>12.2f}{ranked:>17.2f}")
+
+
+if __name__ == '__main__':
+    main()
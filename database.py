@@ -7,17 +7,342 @@ Supports both SQLite (local) and PostgreSQL (production)
 import os
 import sqlite3
 import json
-from typing import Dict, List, Optional
-from datetime import datetime
+import threading
+import time
+import unicodedata
+import zlib
+from collections import deque
+from contextlib import contextmanager
+from functools import lru_cache
+from typing import Callable, Dict, List, Optional, Sequence
+from datetime import datetime, timedelta, timezone
+
+from models import Adult, Child, Recipe, to_json
 
 try:
-    from psycopg2.pool import SimpleConnectionPool
-    from psycopg2.extras import RealDictCursor
+    from psycopg2 import extensions as pg_extensions
+    from psycopg2.pool import ThreadedConnectionPool, PoolError
+    from psycopg2.extras import execute_values
     POSTGRES_AVAILABLE = True
 except ImportError:
+    ThreadedConnectionPool = object
     POSTGRES_AVAILABLE = False
 
 
+# Pragmas applied to every persistent SQLite connection. WAL lets readers and
+# the writer of both gunicorn workers proceed concurrently; busy_timeout makes
+# a writer wait for the lock instead of failing with "database is locked".
+SQLITE_PRAGMAS = (
+    ('journal_mode', 'WAL'),
+    ('synchronous', 'NORMAL'),
+    ('cache_size', '-20000'),      # ~20 MB page cache
+    ('mmap_size', '268435456'),    # 256 MB memory-mapped reads
+    ('temp_store', 'MEMORY'),
+    ('busy_timeout', '30000'),
+)
+SQLITE_CACHED_STATEMENTS = 256
+
+ADULT_COLUMNS = (
+    'nombre', 'edad', 'objetivo_alimentario', 'estilo_alimentacion',
+    'cocinas_favoritas', 'nivel_picante', 'ingredientes_favoritos', 'ingredientes_no_gustan',
+    'alergias', 'intolerancias', 'restricciones_religiosas', 'flexibilidad_comer',
+    'preocupacion_principal', 'tiempo_max_cocinar', 'nivel_cocina', 'tipo_desayuno',
+    'le_gustan_snacks', 'plato_favorito', 'plato_menos_favorito', 'comentarios',
+)
+
+CHILD_COLUMNS = (
+    'nombre', 'edad', 'come_solo', 'nivel_exigencia', 'cocinas_gustan',
+    'ingredientes_favoritos', 'ingredientes_rechaza', 'texturas_no_gustan', 'alergias',
+    'intolerancias', 'verduras_aceptadas', 'verduras_rechazadas', 'nivel_picante',
+    'desayuno_preferido', 'snacks_favoritos', 'acepta_comida_nueva', 'plato_favorito',
+    'plato_nunca_comeria', 'comentarios_padres',
+)
+
+RECIPE_INSERT_COLUMNS = (
+    'title, url, ingredients, instructions, prep_time, cook_time, servings, '
+    'cuisine_type, meal_type, difficulty, image_url, extracted_data, title_key'
+)
+
+MENU_SUMMARY_COLUMNS = 'id, week_start_date, rating, created_at'
+
+# Versioned schema migrations applied by init_database, recorded in
+# schema_migrations. Append new versions; never edit one that has shipped.
+# Each entry: (version, description, required (table, column) or None, steps),
+# where a step is a SQL string or a callable taking (db, cursor) for data moves.
+# A migration whose required table/column does not exist yet is retried on the
+# next start-up (the cleaning tables are created outside this module).
+SCHEMA_MIGRATIONS = [
+    (1, 'weekly_menus access paths', None, [
+        # get_latest_menu: ORDER BY created_at DESC LIMIT 1
+        'CREATE INDEX IF NOT EXISTS idx_weekly_menus_created_at ON weekly_menus (created_at)',
+        # get_menu_by_week_start / save_weekly_menu lookups and get_all_menus ordering
+        'CREATE INDEX IF NOT EXISTS idx_weekly_menus_week_start ON weekly_menus (week_start_date)',
+        # get_highly_rated_menus: WHERE rating >= ? ORDER BY rating DESC, created_at DESC
+        'CREATE INDEX IF NOT EXISTS idx_weekly_menus_rating_created ON weekly_menus (rating, created_at)',
+    ]),
+    (2, 'menu_day_ratings history', None, [
+        # get_menu_day_rating is already served by UNIQUE(menu_id, day_name, menu_type);
+        # get_all_menu_ratings orders the whole table by created_at
+        'CREATE INDEX IF NOT EXISTS idx_menu_day_ratings_created_at ON menu_day_ratings (created_at)',
+    ]),
+    (3, 'cleaning calendar lookups', ('cleaning_assignments', 'fecha_especifica'), [
+        'CREATE INDEX IF NOT EXISTS idx_cleaning_assignments_fecha ON cleaning_assignments (fecha_especifica)',
+        'CREATE INDEX IF NOT EXISTS idx_cleaning_assignments_week_dia ON cleaning_assignments (week_start, dia_semana)',
+    ]),
+    (4, 'move raw_response out of weekly_menus.metadata', None, [
+        lambda db, cursor: db._move_raw_responses_out_of_metadata(cursor),
+    ]),
+    (5, 'cache generation counters', None, [
+        # Bumped on every profile write so all workers drop their cached copies
+        '''CREATE TABLE IF NOT EXISTS cache_generations (
+            name TEXT PRIMARY KEY,
+            generation INTEGER NOT NULL DEFAULT 0
+        )''',
+    ]),
+    (6, 'weekly_menus version stamp', None, [
+        # Bumped on every menu update; the menu read endpoints derive their ETags from it
+        lambda db, cursor: db._add_column(cursor, 'weekly_menus', 'version', 'INTEGER NOT NULL DEFAULT 1'),
+    ]),
+    (7, 'background job queue', None, [
+        # claim_next_job: WHERE status = 'queued' ORDER BY id
+        'CREATE INDEX IF NOT EXISTS idx_jobs_status ON jobs (status, id)',
+    ]),
+]
+
+# Raw LLM responses are stored zlib-compressed in menu_raw_responses
+RAW_RESPONSE_ENCODING = 'zlib'
+
+# Change notifications kept in the events table for /api/events (older ones are pruned)
+EVENT_LOG_SIZE = 1000
+
+# How often the per-process event poller looks for events committed by other workers
+EVENT_POLL_INTERVAL = 1.0
+
+# Window used to compute the checkouts/sec pool metric
+POOL_METRICS_WINDOW = 60
+
+_POOL_INIT_LOCK = threading.Lock()
+
+
+@lru_cache(maxsize=1024)
+def compile_sql(sql: str, dialect: str, returning_id: bool = False) -> str:
+    """
+    Compile a statement written once with qmark (?) placeholders for a dialect.
+    
+    'sqlite' statements are used as written. 'postgres' statements get %s
+    placeholders (literal % escaped) and, when returning_id is set, a
+    RETURNING id clause. Results are cached, so each statement is rewritten
+    once per dialect and later calls are a dict lookup.
+    """
+    if dialect == 'postgres':
+        sql = sql.replace('%', '%%').replace('?', '%s')
+        if returning_id:
+            sql = f'{sql.rstrip()} RETURNING id'
+    return sql
+
+
+def qmarks(count: int) -> str:
+    """'?, ?, ...' placeholder list for an IN (...) or VALUES (...) clause"""
+    return ', '.join('?' * count)
+
+
+class LazyMenu(dict):
+    """
+    weekly_menus row whose JSON columns (menu_data, metadata) are kept as raw
+    strings and only decoded the first time they are read. Reading through
+    [], get(), items(), values(), iteration, copying or JSON serialization
+    all see the decoded value.
+    """
+    
+    LAZY_COLUMNS = ('menu_data', 'metadata')
+    
+    def __init__(self, row):
+        super().__init__(row)
+        self._pending = {key for key in self.LAZY_COLUMNS if key in self}
+    
+    def _decode(self, key):
+        if key in self._pending:
+            self._pending.discard(key)
+            raw = dict.__getitem__(self, key)
+            dict.__setitem__(self, key, json.loads(raw) if raw else {})
+    
+    def _decode_all(self):
+        for key in list(self._pending):
+            self._decode(key)
+    
+    def __getitem__(self, key):
+        self._decode(key)
+        return dict.__getitem__(self, key)
+    
+    def __setitem__(self, key, value):
+        self._pending.discard(key)
+        dict.__setitem__(self, key, value)
+    
+    def __delitem__(self, key):
+        self._pending.discard(key)
+        dict.__delitem__(self, key)
+    
+    def __iter__(self):
+        # Overriding __iter__ makes dict(menu) and {**menu} go through __getitem__
+        return iter(dict.keys(self))
+    
+    def __eq__(self, other):
+        self._decode_all()
+        return dict.__eq__(self, other)
+    
+    __hash__ = None
+    
+    def __repr__(self):
+        self._decode_all()
+        return dict.__repr__(self)
+    
+    def __reduce_ex__(self, protocol):
+        self._decode_all()
+        return (dict, (dict(self.items()),))
+    
+    def get(self, key, default=None):
+        self._decode(key)
+        return dict.get(self, key, default)
+    
+    def pop(self, key, *default):
+        self._decode(key)
+        self._pending.discard(key)
+        return dict.pop(self, key, *default)
+    
+    def setdefault(self, key, default=None):
+        self._decode(key)
+        return dict.setdefault(self, key, default)
+    
+    def items(self):
+        self._decode_all()
+        return dict.items(self)
+    
+    def values(self):
+        self._decode_all()
+        return dict.values(self)
+    
+    def copy(self):
+        self._decode_all()
+        return dict(dict.items(self))
+
+
+def normalize_title(title: Optional[str]) -> str:
+    """Lowercase, strip accents and collapse whitespace so equivalent titles compare equal"""
+    text = unicodedata.normalize('NFKD', title or '')
+    text = ''.join(char for char in text if not unicodedata.combining(char))
+    return ' '.join(text.lower().split())
+
+
+class MonitoredConnectionPool(ThreadedConnectionPool):
+    """
+    Thread-safe PostgreSQL pool built on psycopg2's ThreadedConnectionPool.
+    
+    Unlike the stock pool it waits (up to wait_timeout seconds) for a free
+    connection instead of raising "connection pool exhausted", keeps up to
+    maxconn idle connections around for idle_timeout seconds before closing
+    them down to minconn, and records usage metrics.
+    """
+    
+    def __init__(self, minconn: int, maxconn: int, *args,
+                 idle_timeout: float = 300, wait_timeout: float = 30, **kwargs):
+        self.idle_timeout = idle_timeout
+        self.wait_timeout = wait_timeout
+        self._slots = threading.BoundedSemaphore(int(maxconn))
+        self._stats_lock = threading.Lock()
+        self._waiting = 0
+        self._total_checkouts = 0
+        self._recent_checkouts = deque()
+        self._idle_since = {}  # id(conn) -> time the connection went idle
+        super().__init__(minconn, maxconn, *args, **kwargs)
+    
+    def getconn(self, key=None):
+        """Get a free connection, waiting for one if the pool is exhausted"""
+        if not self._slots.acquire(blocking=False):
+            with self._stats_lock:
+                self._waiting += 1
+            try:
+                acquired = self._slots.acquire(timeout=self.wait_timeout)
+            finally:
+                with self._stats_lock:
+                    self._waiting -= 1
+            if not acquired:
+                raise PoolError(f"no connection available after {self.wait_timeout}s")
+        
+        try:
+            with self._lock:
+                self._reap_idle()
+                conn = self._getconn(key)
+                self._idle_since.pop(id(conn), None)
+        except Exception:
+            self._slots.release()
+            raise
+        
+        now = time.monotonic()
+        with self._stats_lock:
+            self._total_checkouts += 1
+            self._recent_checkouts.append(now)
+            while self._recent_checkouts and now - self._recent_checkouts[0] > POOL_METRICS_WINDOW:
+                self._recent_checkouts.popleft()
+        return conn
+    
+    def putconn(self, conn=None, key=None, close=False):
+        """Return a connection, keeping it idle (up to maxconn) unless closed"""
+        try:
+            with self._lock:
+                if close or self.closed or conn.closed or len(self._pool) < self.minconn:
+                    self._putconn(conn, key, close)
+                    return
+                
+                key = key if key is not None else self._rused.get(id(conn))
+                if key is None:
+                    raise PoolError("trying to put unkeyed connection")
+                
+                status = conn.info.transaction_status
+                if status == pg_extensions.TRANSACTION_STATUS_UNKNOWN:
+                    # Server connection lost
+                    conn.close()
+                else:
+                    if status != pg_extensions.TRANSACTION_STATUS_IDLE:
+                        conn.rollback()
+                    self._pool.append(conn)
+                    self._idle_since[id(conn)] = time.monotonic()
+                del self._used[key]
+                del self._rused[id(conn)]
+        finally:
+            self._slots.release()
+    
+    def _reap_idle(self):
+        """Close connections idle for longer than idle_timeout, down to minconn (lock held)"""
+        now = time.monotonic()
+        for conn in list(self._pool):
+            if len(self._pool) <= self.minconn:
+                break
+            idle_since = self._idle_since.get(id(conn))
+            if idle_since is not None and now - idle_since > self.idle_timeout:
+                self._pool.remove(conn)
+                self._idle_since.pop(id(conn), None)
+                conn.close()
+    
+    def metrics(self) -> Dict:
+        """Snapshot of pool usage"""
+        now = time.monotonic()
+        with self._lock:
+            in_use = len(self._used)
+            idle = len(self._pool)
+        with self._stats_lock:
+            recent = sum(1 for t in self._recent_checkouts if now - t <= POOL_METRICS_WINDOW)
+            return {
+                'backend': 'postgresql',
+                'min': self.minconn,
+                'max': self.maxconn,
+                'in_use': in_use,
+                'idle': idle,
+                'waiting': self._waiting,
+                'total_checkouts': self._total_checkouts,
+                'checkouts_per_sec': round(recent / POOL_METRICS_WINDOW, 3),
+            }
+
+
 class Database:
     """Database abstraction layer supporting SQLite and PostgreSQL"""
     
@@ -50,9 +375,45 @@ class Database:
         
         print(f"[Database] Is PostgreSQL: {self.is_postgres}")
         
+        # Dialect every statement is compiled for by compile_sql
+        self.dialect = 'postgres' if self.is_postgres else 'sqlite'
+        
+        # SQLite connection pool mode: one long-lived connection per thread
+        # (and per process, so forked gunicorn workers never share a handle)
+        self.sqlite_persistent = os.getenv('SQLITE_PERSISTENT_CONNECTIONS', 'true').lower() in ('1', 'true', 'yes')
+        self._local = threading.local()
+        
         if self.is_postgres and not POSTGRES_AVAILABLE:
             raise ImportError("psycopg2 is required for PostgreSQL support")
         
+        # PostgreSQL pool sizing (gunicorn gthread workers share one pool per process)
+        self.pool_min = int(os.getenv('PG_POOL_MIN', '2'))
+        self.pool_max = int(os.getenv('PG_POOL_MAX', '10'))
+        self.pool_idle_timeout = float(os.getenv('PG_POOL_IDLE_TIMEOUT', '300'))
+        self.pool_wait_timeout = float(os.getenv('PG_POOL_WAIT_TIMEOUT', '30'))
+        
+        # Read-through profile cache, validated against cache_generations
+        self.profile_cache_enabled = os.getenv('PROFILE_CACHE_ENABLED', 'true').lower() in ('1', 'true', 'yes')
+        self.profile_cache_check_interval = float(os.getenv('PROFILE_CACHE_CHECK_INTERVAL', '2'))
+        self._cache = {}
+        self._cache_generations = {}
+        self._cache_checked_at = 0.0
+        self._cache_lock = threading.Lock()
+        
+        # Wakes /api/events streams in this process when an event is committed
+        # here or the event poller sees one from another worker
+        self._event_condition = threading.Condition()
+        self._event_version = 0
+        self._event_waiters = 0
+        self._event_poller = None
+        
+        # Pre-warm the pool at startup instead of inside the first request
+        if self.is_postgres:
+            try:
+                self._create_pool()
+            except Exception:
+                pass
+        
         # Initialize database tables with error handling
         try:
             print("[Database] Initializing database tables...")
@@ -65,37 +426,219 @@ class Database:
     def get_connection(self):
         """Get database connection"""
         if self.is_postgres:
-            # PostgreSQL connection pool with timeout
             if not hasattr(self, '_pool'):
-                try:
-                    self._pool = SimpleConnectionPool(
-                        1, 10, self.db_url,
-                        connect_timeout=10,
-                        options="-c statement_timeout=30000"
-                    )
-                    print("[Database] PostgreSQL connection pool created successfully")
-                except Exception as e:
-                    print(f"[Database] Error creating PostgreSQL pool: {e}")
-                    raise
+                self._create_pool()
             return self._pool.getconn()
         else:
             # SQLite connection
             db_path = self.db_url.replace('sqlite:///', '')
-            conn = sqlite3.connect(db_path)
-            conn.row_factory = sqlite3.Row
-            return conn
+            if not self.sqlite_persistent:
+                conn = sqlite3.connect(db_path)
+                conn.row_factory = sqlite3.Row
+                return conn
+            
+            connections = self._thread_connections()
+            key = (os.getpid(), db_path)
+            entry = connections.get(key)
+            if entry is not None and entry[1] == 0 and not self._is_usable(entry[0]):
+                entry = None
+            if entry is None:
+                entry = [self._open_sqlite_connection(db_path), 0]
+                connections[key] = entry
+            entry[1] += 1
+            return entry[0]
+    
+    def _create_pool(self):
+        """Create the PostgreSQL connection pool, opening pool_min connections up front"""
+        with _POOL_INIT_LOCK:
+            if hasattr(self, '_pool'):
+                return
+            try:
+                self._pool = MonitoredConnectionPool(
+                    self.pool_min, self.pool_max, self.db_url,
+                    idle_timeout=self.pool_idle_timeout,
+                    wait_timeout=self.pool_wait_timeout,
+                    connect_timeout=10,
+                    options="-c statement_timeout=30000"
+                )
+                print(f"[Database] PostgreSQL connection pool created successfully "
+                      f"(min={self.pool_min}, max={self.pool_max})")
+            except Exception as e:
+                print(f"[Database] Error creating PostgreSQL pool: {e}")
+                raise
+    
+    def pool_metrics(self) -> Dict:
+        """Connection pool usage metrics (in-use, idle, waiting, checkouts/sec)"""
+        if self.is_postgres:
+            if not hasattr(self, '_pool'):
+                return {'backend': 'postgresql', 'initialized': False}
+            return self._pool.metrics()
+        return {
+            'backend': 'sqlite',
+            'persistent_connections': self.sqlite_persistent,
+        }
+    
+    def _thread_connections(self) -> Dict:
+        """Persistent SQLite connections owned by the current thread"""
+        connections = getattr(self._local, 'connections', None)
+        if connections is None:
+            connections = self._local.connections = {}
+        return connections
+    
+    def _open_sqlite_connection(self, db_path: str):
+        """Open a long-lived SQLite connection with WAL and tuned pragmas"""
+        conn = sqlite3.connect(db_path, timeout=30, cached_statements=SQLITE_CACHED_STATEMENTS)
+        conn.row_factory = sqlite3.Row
+        for pragma, value in SQLITE_PRAGMAS:
+            conn.execute(f'PRAGMA {pragma}={value}')
+        return conn
+    
+    @staticmethod
+    def _is_usable(conn) -> bool:
+        """Check that a cached SQLite connection has not been closed behind our back"""
+        try:
+            conn.in_transaction
+            return True
+        except sqlite3.ProgrammingError:
+            return False
     
     def _close_connection(self, conn):
         """Close or return connection to pool"""
         if conn:
             if self.is_postgres:
                 self._pool.putconn(conn)
+            elif self.sqlite_persistent:
+                for entry in self._thread_connections().values():
+                    if entry[0] is conn:
+                        entry[1] = max(entry[1] - 1, 0)
+                        # Discard anything the caller did not commit, exactly as close() would
+                        if entry[1] == 0 and self._is_usable(conn) and conn.in_transaction:
+                            conn.rollback()
+                        return
+                conn.close()
             else:
                 conn.close()
     
+    def close_connections(self):
+        """Close the persistent SQLite connections held by the current thread"""
+        connections = self._thread_connections()
+        for conn, _ in connections.values():
+            try:
+                conn.close()
+            except sqlite3.Error:
+                pass
+        connections.clear()
+    
+    @contextmanager
+    def transaction(self, savepoint: bool = False):
+        """
+        Unit of work: yields a connection that every Database method called
+        inside the block joins, committed once on success and rolled back on error.
+        The connection is always released, even when the block raises.
+    
+        Usage:
+            with db.transaction():
+                menu_id = db.save_weekly_menu(week_start, menu)
+                db.extract_and_save_recipes_from_menu(menu)
+    
+        Args:
+            savepoint: When nested inside another transaction, wrap the block in a
+                       SAVEPOINT so a failure only undoes this block
+        """
+        active = getattr(self._local, 'transaction', None)
+        if active is not None:
+            if not savepoint:
+                # Join the enclosing unit of work; it commits or rolls back
+                yield active
+                return
+    
+            self._local.savepoints = getattr(self._local, 'savepoints', 0) + 1
+            name = f'sp_{self._local.savepoints}'
+            cursor = active.cursor()
+            cursor.execute(f'SAVEPOINT {name}')
+            try:
+                yield active
+                cursor.execute(f'RELEASE SAVEPOINT {name}')
+            except Exception:
+                cursor.execute(f'ROLLBACK TO SAVEPOINT {name}')
+                cursor.execute(f'RELEASE SAVEPOINT {name}')
+                raise
+            finally:
+                self._local.savepoints -= 1
+            return
+    
+        conn = self.get_connection()
+        self._local.transaction = conn
+        self._local.events_pending = False
+        try:
+            yield conn
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        finally:
+            self._local.transaction = None
+            self._close_connection(conn)
+        
+        if self._local.events_pending:
+            self._notify_event_listeners()
+    
+    # ==================== QUERY LAYER ====================
+    
+    def _cursor(self, conn):
+        """Cursor returning plain tuples; _map_rows turns them into dicts"""
+        cursor = conn.cursor()
+        if not self.is_postgres:
+            # Skip building a sqlite3.Row per row, column names come from description
+            cursor.row_factory = None
+        return cursor
+    
+    def _execute(self, cursor, sql: str, params: Sequence = ()):
+        """Execute a qmark statement compiled for this database's dialect"""
+        cursor.execute(compile_sql(sql, self.dialect), params)
+        return cursor
+    
+    def _executemany(self, cursor, sql: str, rows: List[Sequence]):
+        """executemany() a qmark statement compiled for this database's dialect"""
+        cursor.executemany(compile_sql(sql, self.dialect), rows)
+        return cursor
+    
+    def _insert(self, cursor, sql: str, params: Sequence = ()) -> int:
+        """Execute an INSERT and return the new row id"""
+        cursor.execute(compile_sql(sql, self.dialect, returning_id=True), params)
+        if self.is_postgres:
+            return cursor.fetchone()[0]
+        return cursor.lastrowid
+    
+    @staticmethod
+    def _map_rows(cursor, rows, row_factory: Callable = dict) -> List:
+        """
+        Build one row_factory((column, value) pairs) per tuple row. dict is the
+        default; any mapping or slotted class taking key/value pairs works.
+        """
+        columns = [column[0] for column in cursor.description]
+        return [row_factory(zip(columns, row)) for row in rows]
+    
+    def _fetch_all(self, sql: str, params: Sequence = (), row_factory: Callable = dict) -> List:
+        """Run a SELECT and map every row with row_factory"""
+        with self.transaction() as conn:
+            cursor = self._execute(self._cursor(conn), sql, params)
+            return self._map_rows(cursor, cursor.fetchall(), row_factory)
+    
+    def _fetch_one(self, sql: str, params: Sequence = (), row_factory: Callable = dict):
+        """Run a SELECT and map its first row, or return None"""
+        with self.transaction() as conn:
+            cursor = self._execute(self._cursor(conn), sql, params)
+            row = cursor.fetchone()
+            return self._map_rows(cursor, [row], row_factory)[0] if row else None
+    
     def init_database(self):
         """Initialize database tables"""
-        conn = self.get_connection()
+        with self.transaction() as conn:
+            self._create_tables(conn)
+    
+    def _create_tables(self, conn):
+        """Create tables and seed default preferences on the given connection"""
         cursor = conn.cursor()
         
         if self.is_postgres:
@@ -168,6 +711,7 @@ class Database:
                     difficulty TEXT,
                     image_url TEXT,
                     extracted_data TEXT,
+                    title_key TEXT,
                     created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
                 )
             ''')
@@ -207,6 +751,78 @@ class Database:
                     UNIQUE(menu_id, day_name, menu_type)
                 )
             ''')
+            
+            cursor.execute('''
+                CREATE TABLE IF NOT EXISTS menu_raw_responses (
+                    menu_id INTEGER PRIMARY KEY,
+                    encoding TEXT NOT NULL,
+                    raw_size INTEGER,
+                    data BYTEA NOT NULL,
+                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+                )
+            ''')
+            
+            cursor.execute('''
+                CREATE TABLE IF NOT EXISTS events (
+                    id SERIAL PRIMARY KEY,
+                    event_type TEXT NOT NULL,
+                    data TEXT,
+                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+                )
+            ''')
+            
+            cursor.execute('''
+                CREATE TABLE IF NOT EXISTS jobs (
+                    id SERIAL PRIMARY KEY,
+                    job_type TEXT NOT NULL,
+                    status TEXT NOT NULL DEFAULT 'queued',
+                    payload TEXT,
+                    result TEXT,
+                    error TEXT,
+                    attempts INTEGER NOT NULL DEFAULT 0,
+                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                    started_at TIMESTAMP,
+                    finished_at TIMESTAMP
+                )
+            ''')
+            
+            cursor.execute('''
+                CREATE TABLE IF NOT EXISTS job_stages (
+                    job_id INTEGER NOT NULL,
+                    stage TEXT NOT NULL,
+                    status TEXT NOT NULL,
+                    attempts INTEGER NOT NULL DEFAULT 1,
+                    error TEXT,
+                    started_at TIMESTAMP,
+                    finished_at TIMESTAMP,
+                    PRIMARY KEY (job_id, stage)
+                )
+            ''')
+            
+            cursor.execute('''
+                CREATE TABLE IF NOT EXISTS llm_cache (
+                    cache_key TEXT PRIMARY KEY,
+                    model TEXT,
+                    data BYTEA NOT NULL,
+                    created_at REAL NOT NULL,
+                    last_used_at REAL NOT NULL
+                )
+            ''')
+            
+            cursor.execute('''
+                CREATE TABLE IF NOT EXISTS http_cache (
+                    cache_key TEXT PRIMARY KEY,
+                    url TEXT NOT NULL,
+                    final_url TEXT,
+                    etag TEXT,
+                    last_modified TEXT,
+                    content_type TEXT,
+                    body BYTEA NOT NULL,
+                    size INTEGER NOT NULL,
+                    fetched_at REAL NOT NULL,
+                    last_used_at REAL NOT NULL
+                )
+            ''')
         else:
             # SQLite table creation
             cursor.execute('''
@@ -277,6 +893,7 @@ class Database:
                     difficulty TEXT,
                     image_url TEXT,
                     extracted_data TEXT,
+                    title_key TEXT,
                     created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
                 )
             ''')
@@ -316,288 +933,399 @@ class Database:
                     UNIQUE(menu_id, day_name, menu_type)
                 )
             ''')
+            
+            cursor.execute('''
+                CREATE TABLE IF NOT EXISTS menu_raw_responses (
+                    menu_id INTEGER PRIMARY KEY,
+                    encoding TEXT NOT NULL,
+                    raw_size INTEGER,
+                    data BLOB NOT NULL,
+                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+                )
+            ''')
+            
+            cursor.execute('''
+                CREATE TABLE IF NOT EXISTS events (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    event_type TEXT NOT NULL,
+                    data TEXT,
+                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+                )
+            ''')
+            
+            cursor.execute('''
+                CREATE TABLE IF NOT EXISTS jobs (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    job_type TEXT NOT NULL,
+                    status TEXT NOT NULL DEFAULT 'queued',
+                    payload TEXT,
+                    result TEXT,
+                    error TEXT,
+                    attempts INTEGER NOT NULL DEFAULT 0,
+                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                    started_at TIMESTAMP,
+                    finished_at TIMESTAMP
+                )
+            ''')
+            
+            cursor.execute('''
+                CREATE TABLE IF NOT EXISTS job_stages (
+                    job_id INTEGER NOT NULL,
+                    stage TEXT NOT NULL,
+                    status TEXT NOT NULL,
+                    attempts INTEGER NOT NULL DEFAULT 1,
+                    error TEXT,
+                    started_at TIMESTAMP,
+                    finished_at TIMESTAMP,
+                    PRIMARY KEY (job_id, stage)
+                )
+            ''')
+            
+            cursor.execute('''
+                CREATE TABLE IF NOT EXISTS llm_cache (
+                    cache_key TEXT PRIMARY KEY,
+                    model TEXT,
+                    data BLOB NOT NULL,
+                    created_at REAL NOT NULL,
+                    last_used_at REAL NOT NULL
+                )
+            ''')
+            
+            cursor.execute('''
+                CREATE TABLE IF NOT EXISTS http_cache (
+                    cache_key TEXT PRIMARY KEY,
+                    url TEXT NOT NULL,
+                    final_url TEXT,
+                    etag TEXT,
+                    last_modified TEXT,
+                    content_type TEXT,
+                    body BLOB NOT NULL,
+                    size INTEGER NOT NULL,
+                    fetched_at REAL NOT NULL,
+                    last_used_at REAL NOT NULL
+                )
+            ''')
         
         # Initialize default preferences if table is empty
         cursor.execute('SELECT COUNT(*) FROM menu_preferences')
-        count = cursor.fetchone()[0] if self.is_postgres else cursor.fetchone()[0]
-        if count == 0:
-            if self.is_postgres:
-                cursor.execute('''
-                    INSERT INTO menu_preferences 
-                    (include_weekend, include_breakfast, include_lunch, include_dinner, excluded_days)
-                    VALUES (TRUE, TRUE, TRUE, TRUE, '[]')
-                ''')
-            else:
-                cursor.execute('''
-                    INSERT INTO menu_preferences 
-                    (include_weekend, include_breakfast, include_lunch, include_dinner, excluded_days)
-                    VALUES (1, 1, 1, 1, '[]')
-                ''')
+        if cursor.fetchone()[0] == 0:
+            self._execute(cursor, '''
+                INSERT INTO menu_preferences 
+                (include_weekend, include_breakfast, include_lunch, include_dinner, excluded_days)
+                VALUES (?, ?, ?, ?, ?)
+            ''', (True, True, True, True, '[]'))
+        
+        self._migrate_recipe_title_keys(cursor)
+        self._apply_schema_migrations(cursor)
+    
+    def _apply_schema_migrations(self, cursor):
+        """Apply pending SCHEMA_MIGRATIONS and record them in schema_migrations"""
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS schema_migrations (
+                version INTEGER PRIMARY KEY,
+                description TEXT,
+                applied_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            )
+        ''')
+        cursor.execute('SELECT version FROM schema_migrations')
+        applied = {row[0] for row in cursor.fetchall()}
+        
+        for version, description, required, steps in SCHEMA_MIGRATIONS:
+            if version in applied:
+                continue
+            if required and not self._column_exists(cursor, *required):
+                continue
+            for step in steps:
+                if callable(step):
+                    step(self, cursor)
+                else:
+                    cursor.execute(step)
+            self._execute(cursor, 'INSERT INTO schema_migrations (version, description) VALUES (?, ?)',
+                          (version, description))
+            print(f"[Database] Applied migration {version}: {description}")
+    
+    def _column_exists(self, cursor, table: str, column: str) -> bool:
+        """Check whether a table has the given column"""
+        if self.is_postgres:
+            self._execute(cursor, '''
+                SELECT 1 FROM information_schema.columns
+                WHERE table_name = ? AND column_name = ?
+            ''', (table, column))
+            return cursor.fetchone() is not None
+        cursor.execute(f'PRAGMA table_info({table})')
+        return column in [row[1] for row in cursor.fetchall()]
+    
+    def _add_column(self, cursor, table: str, column: str, definition: str):
+        """Add a column unless it already exists"""
+        if not self._column_exists(cursor, table, column):
+            cursor.execute(f'ALTER TABLE {table} ADD COLUMN {column} {definition}')
+    
+    def _migrate_recipe_title_keys(self, cursor):
+        """Add, backfill and index recipes.title_key for O(log n) title lookups"""
+        if not self._column_exists(cursor, 'recipes', 'title_key'):
+            cursor.execute('ALTER TABLE recipes ADD COLUMN title_key TEXT')
+        
+        # Backfill rows created before the column existed or inserted by other tools
+        cursor.execute('SELECT id, title FROM recipes WHERE title_key IS NULL')
+        rows = [(normalize_title(row[1]), row[0]) for row in cursor.fetchall()]
+        if rows:
+            self._executemany(cursor, 'UPDATE recipes SET title_key = ? WHERE id = ?', rows)
+            print(f"[Database] Backfilled title_key for {len(rows)} recipes")
+        
+        cursor.execute('CREATE INDEX IF NOT EXISTS idx_recipes_title_key ON recipes (title_key)')
+    
+    # ==================== PROFILE CACHE ====================
+    
+    def _cached(self, name: str, loader: Callable[[], List]) -> List:
+        """
+        Read-through cache for rarely changing tables (family profiles).
+        
+        Entries are tagged with the table's generation from cache_generations.
+        Writes bump the generation in the same transaction, so every gunicorn
+        worker drops its copy once it re-reads the counters (at most every
+        profile_cache_check_interval seconds); the writing process drops its
+        copy immediately. Reads inside a transaction bypass the cache so they
+        see that transaction's own changes. Cached models are shared: treat
+        them as read-only.
+        """
+        if not self.profile_cache_enabled or getattr(self._local, 'transaction', None) is not None:
+            return loader()
+        
+        generation = self._cache_generation(name)
+        entry = self._cache.get(name)
+        if entry is not None and entry[0] == generation:
+            return list(entry[1])
+        
+        value = loader()
+        self._cache[name] = (generation, value)
+        return list(value)
+    
+    def _cache_generation(self, name: str) -> int:
+        """Current generation of a cached table, re-read from the database when stale"""
+        with self._cache_lock:
+            now = time.monotonic()
+            if now - self._cache_checked_at >= self.profile_cache_check_interval:
+                rows = self._fetch_all('SELECT name, generation FROM cache_generations')
+                self._cache_generations = {row['name']: row['generation'] for row in rows}
+                self._cache_checked_at = now
+            return self._cache_generations.get(name, 0)
+    
+    def _bump_generation(self, cursor, name: str):
+        """Invalidate every worker's cached copy of a table (call inside the write transaction)"""
+        self._execute(cursor, '''
+            INSERT INTO cache_generations (name, generation) VALUES (?, 1)
+            ON CONFLICT (name) DO UPDATE SET generation = cache_generations.generation + 1
+        ''', (name,))
+    
+    def clear_cache(self):
+        """Drop every cached entry in this process (e.g. after pointing db_url elsewhere)"""
+        with self._cache_lock:
+            self._cache.clear()
+            self._cache_generations = {}
+            self._cache_checked_at = 0.0
+    
+    def _invalidate_cache(self, name: str):
+        """Drop this process's cached copy of a table and force a generation re-read"""
+        with self._cache_lock:
+            self._cache.pop(name, None)
+            self._cache_checked_at = 0.0
+    
+    def _update_profile(self, table: str, columns: Sequence[str], profile_id: int, profile: Dict) -> bool:
+        """Update the given profile columns (unknown keys are ignored)"""
+        updates = [(column, profile[column]) for column in columns if column in profile]
+        if not updates:
+            return False  # Nothing to update
+        
+        set_clause = ', '.join(f'{column} = ?' for column, _ in updates)
+        with self.transaction() as conn:
+            cursor = conn.cursor()
+            updated = self._execute(
+                cursor, f'UPDATE {table} SET {set_clause} WHERE id = ?',
+                [value for _, value in updates] + [profile_id]
+            ).rowcount > 0
+            if updated:
+                self._bump_generation(cursor, table)
+        
+        self._invalidate_cache(table)
+        return updated
+    
+    def _delete_profile(self, table: str, profile_id: int) -> bool:
+        """Delete a profile row"""
+        with self.transaction() as conn:
+            cursor = conn.cursor()
+            deleted = self._execute(cursor, f'DELETE FROM {table} WHERE id = ?', (profile_id,)).rowcount > 0
+            if deleted:
+                self._bump_generation(cursor, table)
         
-        conn.commit()
-        self._close_connection(conn)
+        self._invalidate_cache(table)
+        return deleted
     
     # ==================== ADULT PROFILES ====================
     
     def add_adult(self, profile: Dict) -> int:
         """Add adult profile"""
-        conn = self.get_connection()
-        cursor = conn.cursor()
-        
-        if self.is_postgres:
-            cursor.execute('''
-                INSERT INTO adults (nombre, edad, objetivo_alimentario, estilo_alimentacion,
-                    cocinas_favoritas, nivel_picante, ingredientes_favoritos, ingredientes_no_gustan,
-                    alergias, intolerancias, restricciones_religiosas, flexibilidad_comer,
-                    preocupacion_principal, tiempo_max_cocinar, nivel_cocina, tipo_desayuno,
-                    le_gustan_snacks, plato_favorito, plato_menos_favorito, comentarios)
-                VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
-                RETURNING id
-            ''', (
-                profile.get('nombre'), profile.get('edad'), profile.get('objetivo_alimentario'),
-                profile.get('estilo_alimentacion'), profile.get('cocinas_favoritas'),
-                profile.get('nivel_picante'), profile.get('ingredientes_favoritos'),
-                profile.get('ingredientes_no_gustan'), profile.get('alergias'),
-                profile.get('intolerancias'), profile.get('restricciones_religiosas'),
-                profile.get('flexibilidad_comer'), profile.get('preocupacion_principal'),
-                profile.get('tiempo_max_cocinar'), profile.get('nivel_cocina'),
-                profile.get('tipo_desayuno'), profile.get('le_gustan_snacks'),
-                profile.get('plato_favorito'), profile.get('plato_menos_favorito'),
-                profile.get('comentarios')
-            ))
-            adult_id = cursor.fetchone()[0]
-        else:
-            cursor.execute('''
-                INSERT INTO adults (nombre, edad, objetivo_alimentario, estilo_alimentacion,
-                    cocinas_favoritas, nivel_picante, ingredientes_favoritos, ingredientes_no_gustan,
-                    alergias, intolerancias, restricciones_religiosas, flexibilidad_comer,
-                    preocupacion_principal, tiempo_max_cocinar, nivel_cocina, tipo_desayuno,
-                    le_gustan_snacks, plato_favorito, plato_menos_favorito, comentarios)
-                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-            ''', (
-                profile.get('nombre'), profile.get('edad'), profile.get('objetivo_alimentario'),
-                profile.get('estilo_alimentacion'), profile.get('cocinas_favoritas'),
-                profile.get('nivel_picante'), profile.get('ingredientes_favoritos'),
-                profile.get('ingredientes_no_gustan'), profile.get('alergias'),
-                profile.get('intolerancias'), profile.get('restricciones_religiosas'),
-                profile.get('flexibilidad_comer'), profile.get('preocupacion_principal'),
-                profile.get('tiempo_max_cocinar'), profile.get('nivel_cocina'),
-                profile.get('tipo_desayuno'), profile.get('le_gustan_snacks'),
-                profile.get('plato_favorito'), profile.get('plato_menos_favorito'),
-                profile.get('comentarios')
-            ))
-            adult_id = cursor.lastrowid
+        with self.transaction() as conn:
+            cursor = conn.cursor()
+            adult_id = self._insert_adult(cursor, profile)
+            self._bump_generation(cursor, 'adults')
         
-        conn.commit()
-        self._close_connection(conn)
+        self._invalidate_cache('adults')
         return adult_id
     
-    def get_all_adults(self) -> List[Dict]:
-        """Get all adult profiles"""
-        conn = self.get_connection()
-        try:
-            if self.is_postgres:
-                cursor = conn.cursor(cursor_factory=RealDictCursor)
-                cursor.execute('SELECT * FROM adults ORDER BY nombre')
-            else:
-                cursor = conn.cursor()
-                cursor.execute('SELECT * FROM adults ORDER BY nombre')
-            
-            rows = cursor.fetchall()
-            return [dict(row) for row in rows]
-        finally:
-            self._close_connection(conn)
+    def _insert_adult(self, cursor, profile: Dict) -> int:
+        """Insert an adult profile row and return its id"""
+        return self._insert(
+            cursor,
+            f'INSERT INTO adults ({", ".join(ADULT_COLUMNS)}) VALUES ({qmarks(len(ADULT_COLUMNS))})',
+            tuple(profile.get(column) for column in ADULT_COLUMNS)
+        )
+    
+    def get_all_adults(self) -> List[Adult]:
+        """Get all adult profiles (served from the profile cache)"""
+        return self._cached('adults', lambda: self._fetch_all(
+            'SELECT * FROM adults ORDER BY nombre', row_factory=Adult.from_row
+        ))
+    
+    def update_adult(self, adult_id: int, profile: Dict) -> bool:
+        """Update adult profile"""
+        return self._update_profile('adults', ADULT_COLUMNS, adult_id, profile)
     
     def delete_adult(self, adult_id: int) -> bool:
         """Delete adult profile"""
-        conn = self.get_connection()
-        cursor = conn.cursor()
-        
-        if self.is_postgres:
-            cursor.execute('DELETE FROM adults WHERE id = %s', (adult_id,))
-        else:
-            cursor.execute('DELETE FROM adults WHERE id = ?', (adult_id,))
-        
-        conn.commit()
-        success = cursor.rowcount > 0
-        self._close_connection(conn)
-        return success
+        return self._delete_profile('adults', adult_id)
     
     # ==================== CHILDREN PROFILES ====================
     
     def add_child(self, profile: Dict) -> int:
         """Add child profile"""
-        conn = self.get_connection()
-        cursor = conn.cursor()
-        
-        if self.is_postgres:
-            cursor.execute('''
-                INSERT INTO children (nombre, edad, come_solo, nivel_exigencia, cocinas_gustan,
-                    ingredientes_favoritos, ingredientes_rechaza, texturas_no_gustan, alergias,
-                    intolerancias, verduras_aceptadas, verduras_rechazadas, nivel_picante,
-                    desayuno_preferido, snacks_favoritos, acepta_comida_nueva, plato_favorito,
-                    plato_nunca_comeria, comentarios_padres)
-                VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
-                RETURNING id
-            ''', (
-                profile.get('nombre'), profile.get('edad'), profile.get('come_solo'),
-                profile.get('nivel_exigencia'), profile.get('cocinas_gustan'),
-                profile.get('ingredientes_favoritos'), profile.get('ingredientes_rechaza'),
-                profile.get('texturas_no_gustan'), profile.get('alergias'),
-                profile.get('intolerancias'), profile.get('verduras_aceptadas'),
-                profile.get('verduras_rechazadas'), profile.get('nivel_picante'),
-                profile.get('desayuno_preferido'), profile.get('snacks_favoritos'),
-                profile.get('acepta_comida_nueva'), profile.get('plato_favorito'),
-                profile.get('plato_nunca_comeria'), profile.get('comentarios_padres')
-            ))
-            child_id = cursor.fetchone()[0]
-        else:
-            cursor.execute('''
-                INSERT INTO children (nombre, edad, come_solo, nivel_exigencia, cocinas_gustan,
-                    ingredientes_favoritos, ingredientes_rechaza, texturas_no_gustan, alergias,
-                    intolerancias, verduras_aceptadas, verduras_rechazadas, nivel_picante,
-                    desayuno_preferido, snacks_favoritos, acepta_comida_nueva, plato_favorito,
-                    plato_nunca_comeria, comentarios_padres)
-                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-            ''', (
-                profile.get('nombre'), profile.get('edad'), profile.get('come_solo'),
-                profile.get('nivel_exigencia'), profile.get('cocinas_gustan'),
-                profile.get('ingredientes_favoritos'), profile.get('ingredientes_rechaza'),
-                profile.get('texturas_no_gustan'), profile.get('alergias'),
-                profile.get('intolerancias'), profile.get('verduras_aceptadas'),
-                profile.get('verduras_rechazadas'), profile.get('nivel_picante'),
-                profile.get('desayuno_preferido'), profile.get('snacks_favoritos'),
-                profile.get('acepta_comida_nueva'), profile.get('plato_favorito'),
-                profile.get('plato_nunca_comeria'), profile.get('comentarios_padres')
-            ))
-            child_id = cursor.lastrowid
+        with self.transaction() as conn:
+            cursor = conn.cursor()
+            child_id = self._insert_child(cursor, profile)
+            self._bump_generation(cursor, 'children')
         
-        conn.commit()
-        self._close_connection(conn)
+        self._invalidate_cache('children')
         return child_id
     
-    def get_all_children(self) -> List[Dict]:
-        """Get all children profiles"""
-        conn = self.get_connection()
-        try:
-            if self.is_postgres:
-                cursor = conn.cursor(cursor_factory=RealDictCursor)
-                cursor.execute('SELECT * FROM children ORDER BY nombre')
-            else:
-                cursor = conn.cursor()
-                cursor.execute('SELECT * FROM children ORDER BY nombre')
-            
-            rows = cursor.fetchall()
-            return [dict(row) for row in rows]
-        finally:
-            self._close_connection(conn)
+    def _insert_child(self, cursor, profile: Dict) -> int:
+        """Insert a child profile row and return its id"""
+        return self._insert(
+            cursor,
+            f'INSERT INTO children ({", ".join(CHILD_COLUMNS)}) VALUES ({qmarks(len(CHILD_COLUMNS))})',
+            tuple(profile.get(column) for column in CHILD_COLUMNS)
+        )
+    
+    def get_all_children(self) -> List[Child]:
+        """Get all children profiles (served from the profile cache)"""
+        return self._cached('children', lambda: self._fetch_all(
+            'SELECT * FROM children ORDER BY nombre', row_factory=Child.from_row
+        ))
+    
+    def update_child(self, child_id: int, profile: Dict) -> bool:
+        """Update child profile"""
+        return self._update_profile('children', CHILD_COLUMNS, child_id, profile)
     
     def delete_child(self, child_id: int) -> bool:
         """Delete child profile"""
-        conn = self.get_connection()
-        cursor = conn.cursor()
-        
-        if self.is_postgres:
-            cursor.execute('DELETE FROM children WHERE id = %s', (child_id,))
-        else:
-            cursor.execute('DELETE FROM children WHERE id = ?', (child_id,))
-        
-        conn.commit()
-        success = cursor.rowcount > 0
-        self._close_connection(conn)
-        return success
+        return self._delete_profile('children', child_id)
     
     # ==================== RECIPES ====================
     
     def add_recipe(self, recipe: Dict) -> int:
         """Add recipe"""
-        conn = None
         try:
-            conn = self.get_connection()
-            cursor = conn.cursor()
-            
-            ingredients_json = json.dumps(recipe.get('ingredients', []))
-            extracted_data_json = json.dumps(recipe.get('extracted_data', {}))
-            
-            if self.is_postgres:
-                cursor.execute('''
-                    INSERT INTO recipes (title, url, ingredients, instructions, prep_time,
-                        cook_time, servings, cuisine_type, meal_type, difficulty, image_url, extracted_data)
-                    VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
-                    RETURNING id
-                ''', (
-                    recipe.get('title'), recipe.get('url'), ingredients_json,
-                    recipe.get('instructions'), recipe.get('prep_time'),
-                    recipe.get('cook_time'), recipe.get('servings'),
-                    recipe.get('cuisine_type'), recipe.get('meal_type'),
-                    recipe.get('difficulty'), recipe.get('image_url'), extracted_data_json
-                ))
-                recipe_id = cursor.fetchone()[0]
-            else:
-                cursor.execute('''
-                    INSERT INTO recipes (title, url, ingredients, instructions, prep_time,
-                        cook_time, servings, cuisine_type, meal_type, difficulty, image_url, extracted_data)
-                    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-                ''', (
-                    recipe.get('title'), recipe.get('url'), ingredients_json,
-                    recipe.get('instructions'), recipe.get('prep_time'),
-                    recipe.get('cook_time'), recipe.get('servings'),
-                    recipe.get('cuisine_type'), recipe.get('meal_type'),
-                    recipe.get('difficulty'), recipe.get('image_url'), extracted_data_json
-                ))
-                recipe_id = cursor.lastrowid
+            with self.transaction() as conn:
+                cursor = conn.cursor()
+                recipe_id = self._insert(
+                    cursor,
+                    f'INSERT INTO recipes ({RECIPE_INSERT_COLUMNS}) VALUES ({qmarks(13)})',
+                    self._recipe_params(recipe)
+                )
+                self._bump_generation(cursor, 'recipes')
             
-            conn.commit()
             print(f"[Database] Recipe saved: '{recipe.get('title')}' (ID: {recipe_id})")
             return recipe_id
         except Exception as e:
             print(f"[Database] Error saving recipe '{recipe.get('title')}': {str(e)}")
-            if conn:
-                conn.rollback()
             raise
-        finally:
-            self._close_connection(conn)
     
-    def get_all_recipes(self) -> List[Dict]:
+    @staticmethod
+    def _recipe_params(recipe: Dict) -> tuple:
+        """Row values for RECIPE_INSERT_COLUMNS"""
+        return (
+            recipe.get('title'), recipe.get('url'), json.dumps(recipe.get('ingredients', [])),
+            recipe.get('instructions'), recipe.get('prep_time'),
+            recipe.get('cook_time'), recipe.get('servings'),
+            recipe.get('cuisine_type'), recipe.get('meal_type'),
+            recipe.get('difficulty'), recipe.get('image_url'),
+            json.dumps(recipe.get('extracted_data', {})),
+            normalize_title(recipe.get('title'))
+        )
+    
+    def _insert_recipes(self, cursor, recipes: List[Dict]):
+        """Insert many recipes with a single batched statement"""
+        rows = [self._recipe_params(recipe) for recipe in recipes]
+        if self.is_postgres:
+            execute_values(cursor, f'INSERT INTO recipes ({RECIPE_INSERT_COLUMNS}) VALUES %s', rows)
+        else:
+            self._executemany(cursor, f'INSERT INTO recipes ({RECIPE_INSERT_COLUMNS}) VALUES ({qmarks(13)})', rows)
+        self._bump_generation(cursor, 'recipes')
+    
+    @staticmethod
+    def _decode_recipe(pairs) -> Recipe:
+        """Row factory for recipes: build a Recipe with its JSON columns decoded"""
+        recipe = Recipe.from_row(pairs)
+        recipe.ingredients = json.loads(recipe.ingredients or '[]')
+        recipe.extracted_data = json.loads(recipe.extracted_data or '{}')
+        return recipe
+    
+    def get_all_recipes(self) -> List[Recipe]:
         """Get all recipes"""
-        conn = self.get_connection()
-        try:
-            if self.is_postgres:
-                cursor = conn.cursor(cursor_factory=RealDictCursor)
-                cursor.execute('SELECT * FROM recipes ORDER BY title')
-            else:
-                cursor = conn.cursor()
-                cursor.execute('SELECT * FROM recipes ORDER BY title')
-            
-            rows = cursor.fetchall()
-            
-            recipes = []
-            for row in rows:
-                recipe = dict(row)
-                recipe['ingredients'] = json.loads(recipe.get('ingredients', '[]'))
-                recipe['extracted_data'] = json.loads(recipe.get('extracted_data', '{}'))
-                recipes.append(recipe)
-            
-            return recipes
-        finally:
-            self._close_connection(conn)
+        return self._fetch_all('SELECT * FROM recipes ORDER BY title', row_factory=self._decode_recipe)
+    
+    def get_recipes_stamp(self) -> Dict:
+        """
+        Count, highest id and write generation of the recipes table; changes
+        whenever a recipe is added, updated or deleted
+        """
+        return self._fetch_one('''
+            SELECT COUNT(*) AS count, MAX(id) AS max_id,
+                   (SELECT generation FROM cache_generations WHERE name = 'recipes') AS generation
+            FROM recipes
+        ''')
+    
+    def get_recipe_index_rows(self) -> List[Recipe]:
+        """Recipes with only the columns RecipeIndex needs (no instructions or extracted_data)"""
+        return self._fetch_all('SELECT id, title, title_key, ingredients, cuisine_type, meal_type, difficulty '
+                               'FROM recipes', row_factory=self._decode_recipe)
+    
+    def get_recipes_by_ids(self, recipe_ids: List[int]) -> List[Recipe]:
+        """Recipes with the given ids, in the order of recipe_ids (missing ids are skipped)"""
+        if not recipe_ids:
+            return []
+        recipes = self._fetch_all(f'SELECT * FROM recipes WHERE id IN ({qmarks(len(recipe_ids))})',
+                                  list(recipe_ids), row_factory=self._decode_recipe)
+        by_id = {recipe.id: recipe for recipe in recipes}
+        return [by_id[recipe_id] for recipe_id in recipe_ids if recipe_id in by_id]
+    
+    def update_recipe(self, recipe_id: int, recipe: Dict) -> bool:
+        """Replace every stored column of a recipe (e.g. after re-parsing its page)"""
+        assignments = ', '.join(f'{column} = ?' for column in RECIPE_INSERT_COLUMNS.split(', '))
+        with self.transaction() as conn:
+            cursor = conn.cursor()
+            updated = self._execute(cursor, f'UPDATE recipes SET {assignments} WHERE id = ?',
+                                    (*self._recipe_params(recipe), recipe_id)).rowcount > 0
+            if updated:
+                self._bump_generation(cursor, 'recipes')
+        return updated
     
     def delete_recipe(self, recipe_id: int) -> bool:
         """Delete recipe"""
-        conn = self.get_connection()
-        try:
+        with self.transaction() as conn:
             cursor = conn.cursor()
-            
-            if self.is_postgres:
-                cursor.execute('DELETE FROM recipes WHERE id = %s', (recipe_id,))
-            else:
-                cursor.execute('DELETE FROM recipes WHERE id = ?', (recipe_id,))
-            
-            conn.commit()
-            success = cursor.rowcount > 0
-            return success
-        finally:
-            self._close_connection(conn)
+            deleted = self._execute(cursor, 'DELETE FROM recipes WHERE id = ?', (recipe_id,)).rowcount > 0
+            if deleted:
+                self._bump_generation(cursor, 'recipes')
+        return deleted
     
     # ==================== WEEKLY MENUS ====================
     
@@ -605,174 +1333,164 @@ class Database:
         """
         Save weekly menu. If a menu already exists for this week_start_date, update it.
         """
-        conn = self.get_connection()
-        cursor = conn.cursor()
+        # The raw LLM response is kept compressed in menu_raw_responses so hot
+        # menu reads never load it; metadata only records that it exists
+        metadata = dict(metadata or {})
+        raw_response = metadata.pop('raw_response', None)
+        if raw_response:
+            metadata['has_raw_response'] = True
         
         menu_json = json.dumps(menu_data)
-        metadata_json = json.dumps(metadata or {})
-        
-        # Check if menu already exists for this week
-        if self.is_postgres:
-            cursor.execute('SELECT id FROM weekly_menus WHERE week_start_date = %s', (week_start_date,))
-        else:
-            cursor.execute('SELECT id FROM weekly_menus WHERE week_start_date = ?', (week_start_date,))
-        
-        existing = cursor.fetchone()
+        metadata_json = json.dumps(metadata)
         
-        if existing:
-            # Update existing menu
-            menu_id = existing[0] if self.is_postgres else existing['id']
-            if self.is_postgres:
-                cursor.execute('''
-                    UPDATE weekly_menus 
-                    SET menu_data = %s, metadata = %s, created_at = CURRENT_TIMESTAMP
-                    WHERE id = %s
-                ''', (menu_json, metadata_json, menu_id))
-            else:
-                cursor.execute('''
+        with self.transaction() as conn:
+            cursor = conn.cursor()
+            
+            # Check if menu already exists for this week
+            existing = self._execute(
+                cursor, 'SELECT id FROM weekly_menus WHERE week_start_date = ?', (week_start_date,)
+            ).fetchone()
+            
+            if existing:
+                # Update existing menu
+                menu_id = existing[0]
+                self._execute(cursor, '''
                     UPDATE weekly_menus 
-                    SET menu_data = ?, metadata = ?, created_at = CURRENT_TIMESTAMP
+                    SET menu_data = ?, metadata = ?, created_at = CURRENT_TIMESTAMP, version = version + 1
                     WHERE id = ?
                 ''', (menu_json, metadata_json, menu_id))
-        else:
-            # Insert new menu
-            if self.is_postgres:
-                cursor.execute('''
-                    INSERT INTO weekly_menus (week_start_date, menu_data, metadata)
-                    VALUES (%s, %s, %s)
-                    RETURNING id
-                ''', (week_start_date, menu_json, metadata_json))
-                menu_id = cursor.fetchone()[0]
             else:
-                cursor.execute('''
+                # Insert new menu
+                menu_id = self._insert(cursor, '''
                     INSERT INTO weekly_menus (week_start_date, menu_data, metadata)
                     VALUES (?, ?, ?)
                 ''', (week_start_date, menu_json, metadata_json))
-                menu_id = cursor.lastrowid
+            
+            if raw_response:
+                self._save_raw_response(cursor, menu_id, raw_response)
+            
+            self._publish_event(cursor, 'menu_updated', {'menu_id': menu_id, 'week_start_date': week_start_date})
         
-        conn.commit()
-        self._close_connection(conn)
         return menu_id
     
-    def get_latest_menu(self) -> Optional[Dict]:
-        """Get most recent menu"""
-        conn = self.get_connection()
+    def _save_raw_response(self, cursor, menu_id: int, raw_response: str):
+        """Store (or replace) the compressed raw LLM response for a menu"""
+        raw_bytes = raw_response.encode('utf-8')
+        data = zlib.compress(raw_bytes, 6)
+        self._execute(cursor, '''
+            INSERT INTO menu_raw_responses (menu_id, encoding, raw_size, data)
+            VALUES (?, ?, ?, ?)
+            ON CONFLICT (menu_id)
+            DO UPDATE SET encoding = excluded.encoding, raw_size = excluded.raw_size,
+                          data = excluded.data, created_at = CURRENT_TIMESTAMP
+        ''', (menu_id, RAW_RESPONSE_ENCODING, len(raw_bytes), data))
+    
+    def get_menu_raw_response(self, menu_id: int) -> Optional[str]:
+        """Get the raw LLM response stored for a menu (decompressed), or None"""
+        row = self._fetch_one('SELECT encoding, data FROM menu_raw_responses WHERE menu_id = ?', (menu_id,))
+        if not row:
+            return None
+        data = bytes(row['data'])
+        if row['encoding'] == RAW_RESPONSE_ENCODING:
+            data = zlib.decompress(data)
+        return data.decode('utf-8')
+    
+    def _move_raw_responses_out_of_metadata(self, cursor):
+        """Migration step: move raw_response from existing metadata into menu_raw_responses"""
+        cursor.execute("SELECT id, metadata FROM weekly_menus WHERE metadata LIKE '%raw_response%'")
+        moved = 0
+        for menu_id, metadata_json in [(row[0], row[1]) for row in cursor.fetchall()]:
+            try:
+                metadata = json.loads(metadata_json)
+            except (TypeError, ValueError):
+                continue
+            if not isinstance(metadata, dict) or 'raw_response' not in metadata:
+                continue
+            
+            raw_response = metadata.pop('raw_response')
+            if raw_response:
+                metadata['has_raw_response'] = True
+                self._save_raw_response(cursor, menu_id, raw_response)
+            self._execute(cursor, 'UPDATE weekly_menus SET metadata = ? WHERE id = ?',
+                          (json.dumps(metadata), menu_id))
+            moved += 1
         
-        if self.is_postgres:
-            cursor = conn.cursor(cursor_factory=RealDictCursor)
-            cursor.execute('''
-                SELECT * FROM weekly_menus 
-                ORDER BY created_at DESC 
-                LIMIT 1
-            ''')
-        else:
-            cursor = conn.cursor()
-            cursor.execute('''
-                SELECT * FROM weekly_menus 
-                ORDER BY created_at DESC 
-                LIMIT 1
-            ''')
+        if moved:
+            print(f"[Database] Moved raw_response of {moved} menus to menu_raw_responses")
+    
+    def _decode_menu_row(self, menu: Dict) -> Dict:
+        """Decode the JSON columns of a weekly_menus row in place"""
+        # Handle None values properly
+        menu_data_str = menu.get('menu_data') or '{}'
+        metadata_str = menu.get('metadata') or '{}'
         
-        row = cursor.fetchone()
+        menu['menu_data'] = json.loads(menu_data_str) if menu_data_str else {}
+        menu['metadata'] = json.loads(metadata_str) if metadata_str else {}
         
-        if row:
-            menu = dict(row)
-            # Handle None values properly
-            menu_data_str = menu.get('menu_data') or '{}'
-            metadata_str = menu.get('metadata') or '{}'
-            
-            menu['menu_data'] = json.loads(menu_data_str) if menu_data_str else {}
-            menu['metadata'] = json.loads(metadata_str) if metadata_str else {}
-            
-            # Ensure week_start_date is always a string in YYYY-MM-DD format
-            if 'week_start_date' in menu:
-                week_date = menu['week_start_date']
-                if hasattr(week_date, 'strftime'):
-                    # It's a datetime object, format it
-                    menu['week_start_date'] = week_date.strftime('%Y-%m-%d')
-                else:
-                    # It's already a string, ensure it's clean
-                    menu['week_start_date'] = str(week_date).split('T')[0]
-            
-            self._close_connection(conn)
-            return menu
-        self._close_connection(conn)
-        return None
+        return self._format_week_start(menu)
+    
+    @staticmethod
+    def _format_week_start(menu: Dict) -> Dict:
+        """Ensure week_start_date is always a string in YYYY-MM-DD format"""
+        if 'week_start_date' in menu:
+            week_date = menu['week_start_date']
+            if hasattr(week_date, 'strftime'):
+                # It's a datetime object, format it
+                menu['week_start_date'] = week_date.strftime('%Y-%m-%d')
+            else:
+                # It's already a string, ensure it's clean
+                menu['week_start_date'] = str(week_date).split('T')[0]
+        
+        return menu
+    
+    def get_latest_menu(self) -> Optional[Dict]:
+        """Get most recent menu"""
+        row = self._fetch_one('''
+            SELECT * FROM weekly_menus 
+            ORDER BY created_at DESC, id DESC 
+            LIMIT 1
+        ''')
+        return self._decode_menu_row(row) if row else None
     
     def get_menu_by_week_start(self, week_start_date: str) -> Optional[Dict]:
         """Get menu for specific week start date"""
-        conn = self.get_connection()
-        try:
-            if self.is_postgres:
-                cursor = conn.cursor(cursor_factory=RealDictCursor)
-                cursor.execute('SELECT * FROM weekly_menus WHERE week_start_date = %s', (week_start_date,))
-            else:
-                cursor = conn.cursor()
-                cursor.execute('SELECT * FROM weekly_menus WHERE week_start_date = ?', (week_start_date,))
-            
-            row = cursor.fetchone()
-            
-            if row:
-                menu = dict(row)
-                # Handle None values properly
-                menu_data_str = menu.get('menu_data') or '{}'
-                metadata_str = menu.get('metadata') or '{}'
-                
-                menu['menu_data'] = json.loads(menu_data_str) if menu_data_str else {}
-                menu['metadata'] = json.loads(metadata_str) if metadata_str else {}
-                
-                # Ensure week_start_date is always a string in YYYY-MM-DD format
-                if 'week_start_date' in menu:
-                    week_date = menu['week_start_date']
-                    if hasattr(week_date, 'strftime'):
-                        # It's a datetime object, format it
-                        menu['week_start_date'] = week_date.strftime('%Y-%m-%d')
-                    else:
-                        # It's already a string, ensure it's clean
-                        menu['week_start_date'] = str(week_date).split('T')[0]
-                
-                return menu
-            return None
-        finally:
-            self._close_connection(conn)
+        row = self._fetch_one('SELECT * FROM weekly_menus WHERE week_start_date = ? ORDER BY id LIMIT 1',
+                              (week_start_date,))
+        return self._decode_menu_row(row) if row else None
     
-    def get_all_menus(self) -> List[Dict]:
-        """Get all weekly menus"""
-        conn = self.get_connection()
-        
-        if self.is_postgres:
-            cursor = conn.cursor(cursor_factory=RealDictCursor)
-            cursor.execute('SELECT * FROM weekly_menus ORDER BY week_start_date DESC')
+    def get_menu_stamp(self, week_start_date: Optional[str] = None) -> Optional[Dict]:
+        """
+        id, week_start_date and version of the menu get_menu_by_week_start (or,
+        without a date, get_latest_menu) would return, without reading menu_data.
+        Used for ETag checks on the polled menu endpoints.
+        """
+        if week_start_date is None:
+            row = self._fetch_one('SELECT id, week_start_date, version FROM weekly_menus '
+                                  'ORDER BY created_at DESC, id DESC LIMIT 1')
         else:
-            cursor = conn.cursor()
-            cursor.execute('SELECT * FROM weekly_menus ORDER BY week_start_date DESC')
-        
-        rows = cursor.fetchall()
-        
-        menus = []
-        for row in rows:
-            menu = dict(row)
-            # Handle None values properly
-            menu_data_str = menu.get('menu_data') or '{}'
-            metadata_str = menu.get('metadata') or '{}'
-            
-            menu['menu_data'] = json.loads(menu_data_str) if menu_data_str else {}
-            menu['metadata'] = json.loads(metadata_str) if metadata_str else {}
-            
-            # Ensure week_start_date is always a string in YYYY-MM-DD format
-            if 'week_start_date' in menu:
-                week_date = menu['week_start_date']
-                if hasattr(week_date, 'strftime'):
-                    # It's a datetime object, format it
-                    menu['week_start_date'] = week_date.strftime('%Y-%m-%d')
-                else:
-                    # It's already a string, ensure it's clean
-                    menu['week_start_date'] = str(week_date).split('T')[0]
-            
-            menus.append(menu)
+            row = self._fetch_one('SELECT id, week_start_date, version FROM weekly_menus '
+                                  'WHERE week_start_date = ? ORDER BY id LIMIT 1', (week_start_date,))
+        return self._format_week_start(row) if row else None
+    
+    def get_all_menus(self, summary: bool = False) -> List[Dict]:
+        """
+        Get all weekly menus
         
-        self._close_connection(conn)
-        return menus
+        Args:
+            summary: If True, only select the lightweight columns
+                     (id, week_start_date, rating, created_at) for menu pickers.
+                     Otherwise menus are LazyMenu objects whose menu_data and
+                     metadata are only parsed when accessed.
+        """
+        columns = MENU_SUMMARY_COLUMNS if summary else '*'
+        rows = self._fetch_all(f'SELECT {columns} FROM weekly_menus ORDER BY week_start_date DESC',
+                               row_factory=dict if summary else LazyMenu)
+        return [self._format_week_start(row) for row in rows]
+    
+    def get_recent_menus(self, limit: int = 4) -> List[Dict]:
+        """menu_data of the latest weeks, newest first (used to vary recipes between weeks)"""
+        rows = self._fetch_all('SELECT menu_data FROM weekly_menus ORDER BY week_start_date DESC LIMIT ?', (limit,))
+        return [json.loads(row['menu_data'] or '{}') for row in rows]
     
     # ==================== MENU DAY RATINGS ====================
     
@@ -796,31 +1514,26 @@ class Database:
         if menu_type not in ['adultos', 'ninos']:
             return False
         
-        conn = self.get_connection()
-        cursor = conn.cursor()
-        
         try:
-            if self.is_postgres:
-                cursor.execute('''
+            with self.transaction(savepoint=True) as conn:
+                cursor = conn.cursor()
+                self._execute(cursor, '''
                     INSERT INTO menu_day_ratings (menu_id, week_start_date, day_name, menu_type, rating)
-                    VALUES (%s, %s, %s, %s, %s)
+                    VALUES (?, ?, ?, ?, ?)
                     ON CONFLICT (menu_id, day_name, menu_type) 
-                    DO UPDATE SET rating = %s, created_at = CURRENT_TIMESTAMP
-                ''', (menu_id, week_start_date, day_name, menu_type, rating, rating))
-            else:
-                cursor.execute('''
-                    INSERT OR REPLACE INTO menu_day_ratings (menu_id, week_start_date, day_name, menu_type, rating, created_at)
-                    VALUES (?, ?, ?, ?, ?, CURRENT_TIMESTAMP)
+                    DO UPDATE SET rating = excluded.rating, created_at = CURRENT_TIMESTAMP
                 ''', (menu_id, week_start_date, day_name, menu_type, rating))
-            
-            conn.commit()
+                self._publish_event(cursor, 'day_rating_changed', {
+                    'menu_id': menu_id,
+                    'week_start_date': week_start_date,
+                    'day_name': day_name,
+                    'menu_type': menu_type,
+                    'rating': rating
+                })
             return True
         except Exception as e:
             print(f"[Database] Error rating menu day: {e}")
-            conn.rollback()
             return False
-        finally:
-            self._close_connection(conn)
     
     def get_menu_day_rating(self, menu_id: int, day_name: str, menu_type: str) -> Optional[int]:
         """
@@ -829,27 +1542,11 @@ class Database:
         Returns:
             Rating (1-5) or None if not rated
         """
-        conn = self.get_connection()
-        cursor = conn.cursor()
-        
-        try:
-            if self.is_postgres:
-                cursor.execute('''
-                    SELECT rating FROM menu_day_ratings
-                    WHERE menu_id = %s AND day_name = %s AND menu_type = %s
-                ''', (menu_id, day_name, menu_type))
-            else:
-                cursor.execute('''
-                    SELECT rating FROM menu_day_ratings
-                    WHERE menu_id = ? AND day_name = ? AND menu_type = ?
-                ''', (menu_id, day_name, menu_type))
-            
-            row = cursor.fetchone()
-            if row:
-                return row[0] if self.is_postgres else row['rating']
-            return None
-        finally:
-            self._close_connection(conn)
+        row = self._fetch_one('''
+            SELECT rating FROM menu_day_ratings
+            WHERE menu_id = ? AND day_name = ? AND menu_type = ?
+        ''', (menu_id, day_name, menu_type))
+        return row['rating'] if row else None
     
     def get_all_menu_ratings(self, limit: int = 50) -> List[Dict]:
         """
@@ -858,69 +1555,35 @@ class Database:
         Returns:
             List of rating records with menu data
         """
-        conn = self.get_connection()
+        ratings = self._fetch_all('''
+            SELECT mdr.*, wm.menu_data
+            FROM menu_day_ratings mdr
+            JOIN weekly_menus wm ON mdr.menu_id = wm.id
+            ORDER BY mdr.created_at DESC
+            LIMIT ?
+        ''', (limit,))
         
-        try:
-            if self.is_postgres:
-                cursor = conn.cursor(cursor_factory=RealDictCursor)
-                cursor.execute('''
-                    SELECT mdr.*, wm.menu_data
-                    FROM menu_day_ratings mdr
-                    JOIN weekly_menus wm ON mdr.menu_id = wm.id
-                    ORDER BY mdr.created_at DESC
-                    LIMIT %s
-                ''', (limit,))
-            else:
-                conn.row_factory = sqlite3.Row
-                cursor = conn.cursor()
-                cursor.execute('''
-                    SELECT mdr.*, wm.menu_data
-                    FROM menu_day_ratings mdr
-                    JOIN weekly_menus wm ON mdr.menu_id = wm.id
-                    ORDER BY mdr.created_at DESC
-                    LIMIT ?
-                ''', (limit,))
-            
-            rows = cursor.fetchall()
-            ratings = []
-            for row in rows:
-                rating = dict(row)
-                if rating.get('menu_data'):
-                    try:
-                        rating['menu_data'] = json.loads(rating['menu_data'])
-                    except:
-                        pass
-                ratings.append(rating)
-            
-            return ratings
-        finally:
-            self._close_connection(conn)
+        for rating in ratings:
+            if rating.get('menu_data'):
+                try:
+                    rating['menu_data'] = json.loads(rating['menu_data'])
+                except:
+                    pass
+        
+        return ratings
     
     # ==================== MENU PREFERENCES ====================
     
     def get_menu_preferences(self) -> Dict:
         """Get menu preferences"""
-        conn = self.get_connection()
-        
-        if self.is_postgres:
-            cursor = conn.cursor(cursor_factory=RealDictCursor)
-            cursor.execute('SELECT * FROM menu_preferences ORDER BY id DESC LIMIT 1')
-        else:
-            cursor = conn.cursor()
-            cursor.execute('SELECT * FROM menu_preferences ORDER BY id DESC LIMIT 1')
-        
-        row = cursor.fetchone()
+        prefs = self._fetch_one('SELECT * FROM menu_preferences ORDER BY id DESC LIMIT 1')
         
-        if row:
-            prefs = dict(row)
+        if prefs:
             excluded_days = prefs.get('excluded_days', '[]')
             if isinstance(excluded_days, str):
                 prefs['excluded_days'] = json.loads(excluded_days)
-            self._close_connection(conn)
             return prefs
         
-        self._close_connection(conn)
-        
         # Return defaults if no preferences found
         return {
             'include_weekend': True,
@@ -932,25 +1595,10 @@ class Database:
     
     def save_menu_preferences(self, preferences: Dict):
         """Save menu preferences"""
-        conn = self.get_connection()
-        cursor = conn.cursor()
-        
         excluded_days_json = json.dumps(preferences.get('excluded_days', []))
         
-        if self.is_postgres:
-            cursor.execute('''
-                INSERT INTO menu_preferences 
-                (include_weekend, include_breakfast, include_lunch, include_dinner, excluded_days)
-                VALUES (%s, %s, %s, %s, %s)
-            ''', (
-                preferences.get('include_weekend', True),
-                preferences.get('include_breakfast', True),
-                preferences.get('include_lunch', True),
-                preferences.get('include_dinner', True),
-                excluded_days_json
-            ))
-        else:
-            cursor.execute('''
+        with self.transaction() as conn:
+            self._execute(conn.cursor(), '''
                 INSERT INTO menu_preferences 
                 (include_weekend, include_breakfast, include_lunch, include_dinner, excluded_days)
                 VALUES (?, ?, ?, ?, ?)
@@ -962,8 +1610,6 @@ class Database:
                 excluded_days_json
             ))
         
-        conn.commit()
-        self._close_connection(conn)
         return True
     
     # ==================== RECIPE EXTRACTION FROM MENU ====================
@@ -972,11 +1618,40 @@ class Database:
         """
         Extract recipes from menu data and save them to the recipes table.
         Returns list of recipe IDs that were created/updated.
-        """
-        recipe_ids = []
         
+        Candidate titles are resolved with one IN (...) lookup and the missing
+        recipes are inserted with one batched statement, all in one transaction.
+        """
         if not menu_data:
-            return recipe_ids
+            return []
+        
+        candidates = self._collect_menu_recipes(menu_data)
+        if not candidates:
+            return []
+        
+        # First occurrence of each title wins, matching the old one-by-one behaviour
+        unique = {}
+        for recipe in candidates:
+            unique.setdefault(normalize_title(recipe['title']), recipe)
+        
+        with self.transaction() as conn:
+            cursor = conn.cursor()
+            found = self._find_recipe_ids_by_titles(cursor, [r['title'] for r in unique.values()])
+            missing = [recipe for key, recipe in unique.items() if key not in found]
+            
+            if missing:
+                self._insert_recipes(cursor, missing)
+                found.update(self._find_recipe_ids_by_titles(cursor, [r['title'] for r in missing]))
+                for recipe in missing:
+                    print(f"[Database] Saved recipe '{recipe['title']}' from menu "
+                          f"(ID: {found.get(normalize_title(recipe['title']))})")
+        
+        return [found[normalize_title(recipe['title'])] for recipe in candidates]
+    
+    @staticmethod
+    def _collect_menu_recipes(menu_data: Dict) -> List[Dict]:
+        """Build recipe rows for every meal in the menu that names a receta_base"""
+        recipes = []
         
         # Extract recipes from menu_adultos and menu_ninos
         for menu_type in ['menu_adultos', 'menu_ninos']:
@@ -1004,60 +1679,49 @@ class Database:
                     # Check if this meal has a recipe_base that's not "Original"
                     recipe_base = meal.get('receta_base', '')
                     if recipe_base and recipe_base.lower() != 'original':
-                        # Check if recipe already exists
-                        existing_recipe = self._find_recipe_by_title(recipe_base)
-                        
-                        if existing_recipe:
-                            recipe_ids.append(existing_recipe['id'])
-                        else:
-                            # Create new recipe from menu meal
-                            recipe_data = {
-                                'title': recipe_base,
-                                'ingredients': meal.get('ingredientes', []),
-                                'instructions': meal.get('instrucciones', ''),
-                                'prep_time': meal.get('tiempo_prep'),
+                        recipes.append({
+                            'title': recipe_base,
+                            'ingredients': meal.get('ingredientes', []),
+                            'instructions': meal.get('instrucciones', ''),
+                            'prep_time': meal.get('tiempo_prep'),
+                            'meal_type': meal_type,
+                            'cuisine_type': '',  # Could be extracted from menu context
+                            'servings': 4,  # Default
+                            'extracted_data': {
+                                'source': 'menu_generated',
+                                'from_menu': True,
                                 'meal_type': meal_type,
-                                'cuisine_type': '',  # Could be extracted from menu context
-                                'servings': 4,  # Default
-                                'extracted_data': {
-                                    'source': 'menu_generated',
-                                    'from_menu': True,
-                                    'meal_type': meal_type,
-                                    'day': day_name,
-                                    'calorias': meal.get('calorias'),
-                                    'nutrientes': meal.get('nutrientes', {}),
-                                    'notas': meal.get('notas', ''),
-                                    'porque_seleccionada': meal.get('porque_seleccionada', '')
-                                }
+                                'day': day_name,
+                                'calorias': meal.get('calorias'),
+                                'nutrientes': meal.get('nutrientes', {}),
+                                'notas': meal.get('notas', ''),
+                                'porque_seleccionada': meal.get('porque_seleccionada', '')
                             }
-                            recipe_id = self.add_recipe(recipe_data)
-                            recipe_ids.append(recipe_id)
-                            print(f"[Database] Saved recipe '{recipe_base}' from menu (ID: {recipe_id})")
+                        })
         
-        return recipe_ids
+        return recipes
     
-    def _find_recipe_by_title(self, title: str) -> Optional[Dict]:
-        """Find a recipe by title (case-insensitive)"""
-        conn = self.get_connection()
-        
-        if self.is_postgres:
-            cursor = conn.cursor(cursor_factory=RealDictCursor)
-            cursor.execute('SELECT * FROM recipes WHERE LOWER(title) = LOWER(%s) LIMIT 1', (title,))
-        else:
-            conn.row_factory = sqlite3.Row
-            cursor = conn.cursor()
-            cursor.execute('SELECT * FROM recipes WHERE LOWER(title) = LOWER(?) LIMIT 1', (title,))
+    def _find_recipe_ids_by_titles(self, cursor, titles: List[str]) -> Dict[str, int]:
+        """
+        Resolve many titles to recipe ids with a single indexed query (lowest id wins).
+        Returns a dict keyed by normalize_title(title).
+        """
+        if not titles:
+            return {}
         
-        row = cursor.fetchone()
+        keys = list(dict.fromkeys(normalize_title(title) for title in titles))
+        self._execute(cursor, f'SELECT id, title_key FROM recipes WHERE title_key IN ({qmarks(len(keys))}) ORDER BY id',
+                      keys)
         
-        if row:
-            recipe = dict(row)
-            recipe['ingredients'] = json.loads(recipe.get('ingredients', '[]'))
-            recipe['extracted_data'] = json.loads(recipe.get('extracted_data', '{}'))
-            self._close_connection(conn)
-            return recipe
-        self._close_connection(conn)
-        return None
+        ids = {}
+        for row in cursor.fetchall():
+            ids.setdefault(row[1], row[0])
+        return ids
+    
+    def _find_recipe_by_title(self, title: str) -> Optional[Recipe]:
+        """Find a recipe by title (case, accent and whitespace insensitive)"""
+        return self._fetch_one('SELECT * FROM recipes WHERE title_key = ? ORDER BY id LIMIT 1',
+                               (normalize_title(title),), row_factory=self._decode_recipe)
     
     def rate_menu(self, menu_id: int, rating: int) -> bool:
         """
@@ -1067,24 +1731,13 @@ class Database:
         if rating < 1 or rating > 5:
             return False
         
-        conn = self.get_connection()
-        cursor = conn.cursor()
-        
-        if self.is_postgres:
-            cursor.execute('''
+        with self.transaction() as conn:
+            self._execute(conn.cursor(), '''
                 UPDATE weekly_menus 
-                SET rating = %s 
-                WHERE id = %s
-            ''', (rating, menu_id))
-        else:
-            cursor.execute('''
-                UPDATE weekly_menus 
-                SET rating = ? 
+                SET rating = ?, version = version + 1 
                 WHERE id = ?
             ''', (rating, menu_id))
         
-        conn.commit()
-        self._close_connection(conn)
         return True
     
     def get_highly_rated_menus(self, min_rating: int = 4, limit: int = 10) -> List[Dict]:
@@ -1092,35 +1745,350 @@ class Database:
         Get menus with high ratings to use as examples for AI learning.
         Returns list of menu data with ratings >= min_rating.
         """
-        conn = self.get_connection()
+        menus = self._fetch_all('''
+            SELECT week_start_date, menu_data, rating, created_at
+            FROM weekly_menus 
+            WHERE rating >= ? 
+            ORDER BY rating DESC, created_at DESC 
+            LIMIT ?
+        ''', (min_rating, limit))
         
-        if self.is_postgres:
-            cursor = conn.cursor(cursor_factory=RealDictCursor)
-            cursor.execute('''
-                SELECT week_start_date, menu_data, rating, created_at
-                FROM weekly_menus 
-                WHERE rating >= %s 
-                ORDER BY rating DESC, created_at DESC 
-                LIMIT %s
-            ''', (min_rating, limit))
-        else:
-            conn.row_factory = sqlite3.Row
-            cursor = conn.cursor()
-            cursor.execute('''
-                SELECT week_start_date, menu_data, rating, created_at
-                FROM weekly_menus 
-                WHERE rating >= ? 
-                ORDER BY rating DESC, created_at DESC 
-                LIMIT ?
-            ''', (min_rating, limit))
+        for menu in menus:
+            menu['menu_data'] = json.loads(menu.get('menu_data') or '{}')
         
-        rows = cursor.fetchall()
+        return menus
+    
+    # ==================== CLEANING ASSIGNMENTS ====================
+    
+    def update_assignment_completion(self, assignment_id: int, completado: bool, notas: str = None) -> bool:
+        """Update assignment completion status"""
+        with self.transaction() as conn:
+            cursor = conn.cursor()
+            updated = self._execute(cursor, '''
+                UPDATE cleaning_assignments 
+                SET completado = ?, notas = ?
+                WHERE id = ?
+            ''', (completado, notas, assignment_id)).rowcount > 0
+            if updated:
+                self._publish_event(cursor, 'cleaning_assignment_updated', {
+                    'assignment_id': assignment_id,
+                    'completado': bool(completado)
+                })
         
-        menus = []
+        return updated
+    
+    # ==================== CHANGE EVENTS ====================
+    
+    def publish_event(self, event_type: str, data: Optional[Dict] = None) -> int:
+        """
+        Record a change notification for /api/events subscribers. Inside a
+        transaction it is only delivered if that transaction commits.
+        """
+        with self.transaction() as conn:
+            return self._publish_event(conn.cursor(), event_type, data)
+    
+    def _publish_event(self, cursor, event_type: str, data: Optional[Dict] = None) -> int:
+        """Insert an event row and prune the log; listeners are woken on commit"""
+        event_id = self._insert(cursor, 'INSERT INTO events (event_type, data) VALUES (?, ?)',
+                                (event_type, json.dumps(data or {})))
+        if event_id > EVENT_LOG_SIZE:
+            self._execute(cursor, 'DELETE FROM events WHERE id <= ?', (event_id - EVENT_LOG_SIZE,))
+        self._local.events_pending = True
+        return event_id
+    
+    def _notify_event_listeners(self):
+        """Wake the event streams waiting in this process"""
+        with self._event_condition:
+            self._event_version += 1
+            self._event_condition.notify_all()
+    
+    def get_events_since(self, last_id: int, limit: int = 100) -> List[Dict]:
+        """Events with id > last_id, oldest first"""
+        events = self._fetch_all('SELECT id, event_type, data, created_at FROM events WHERE id > ? ORDER BY id LIMIT ?',
+                                 (last_id, limit))
+        for event in events:
+            event['data'] = json.loads(event['data'] or '{}')
+            event['created_at'] = str(event['created_at'])
+        return events
+    
+    def get_latest_event_id(self) -> int:
+        """Id of the newest event (0 when there are none)"""
+        row = self._fetch_one('SELECT MAX(id) AS id FROM events')
+        return (row and row['id']) or 0
+    
+    def wait_for_events(self, last_id: int, timeout: float) -> List[Dict]:
+        """
+        Events after last_id, waiting up to timeout seconds for one to arrive.
+        Waiting streams do not query the table: events committed by this process
+        wake them immediately, and one poller thread per process checks for
+        events from other workers every EVENT_POLL_INTERVAL seconds.
+        """
+        with self._event_condition:
+            version = self._event_version
+        events = self.get_events_since(last_id)
+        if events:
+            return events
+        with self._event_condition:
+            if self._event_poller is None:
+                self._event_poller = threading.Thread(target=self._poll_events, name='event-poller', daemon=True)
+                self._event_poller.start()
+            self._event_waiters += 1
+            try:
+                self._event_condition.wait_for(lambda: self._event_version != version, timeout)
+            finally:
+                self._event_waiters -= 1
+        return self.get_events_since(last_id)
+    
+    def _poll_events(self):
+        """Wake the waiting streams when the newest event id changes; exits once nobody waits"""
+        seen = None
+        while True:
+            with self._event_condition:
+                if not self._event_waiters:
+                    self._event_poller = None
+                    return
+            try:
+                latest = self.get_latest_event_id()
+            except Exception as e:
+                print(f"[Database] Event poll error: {e}")
+                latest = seen
+            if seen is not None and latest != seen:
+                self._notify_event_listeners()
+            seen = latest
+            time.sleep(EVENT_POLL_INTERVAL)
+    
+    # ==================== BACKGROUND JOBS ====================
+    
+    def create_job(self, job_type: str, payload: Optional[Dict] = None) -> int:
+        """Queue a job for the JobQueue workers and return its id"""
+        with self.transaction() as conn:
+            return self._insert(conn.cursor(), 'INSERT INTO jobs (job_type, status, payload) VALUES (?, ?, ?)',
+                                (job_type, 'queued', json.dumps(payload or {})))
+    
+    def claim_next_job(self, job_types: Sequence[str]) -> Optional[Dict]:
+        """
+        Mark the oldest queued job of one of job_types as running and return it.
+        The status check in the UPDATE means only one worker (in any process)
+        wins a given job; a loser simply tries the next candidate.
+        """
+        if not job_types:
+            return None
+        while True:
+            with self.transaction() as conn:
+                cursor = conn.cursor()
+                self._execute(cursor, f'''
+                    SELECT id FROM jobs
+                    WHERE status = 'queued' AND job_type IN ({qmarks(len(job_types))})
+                    ORDER BY id LIMIT 1
+                ''', tuple(job_types))
+                row = cursor.fetchone()
+                if row is None:
+                    return None
+                claimed = self._execute(cursor, '''
+                    UPDATE jobs SET status = 'running', started_at = CURRENT_TIMESTAMP, attempts = attempts + 1
+                    WHERE id = ? AND status = 'queued'
+                ''', (row[0],)).rowcount > 0
+            if claimed:
+                return self.get_job(row[0], include_payload=True)
+    
+    def finish_job(self, job_id: int, status: str, result=None, error: str = None) -> bool:
+        """Record the outcome of a running job and notify /api/events subscribers"""
+        if status not in ('succeeded', 'failed'):
+            raise ValueError(f'Invalid final job status: {status}')
+        with self.transaction() as conn:
+            cursor = conn.cursor()
+            updated = self._execute(cursor, '''
+                UPDATE jobs SET status = ?, result = ?, error = ?, finished_at = CURRENT_TIMESTAMP
+                WHERE id = ? AND status = 'running'
+            ''', (status, json.dumps(result, default=to_json) if result is not None else None,
+                  error, job_id)).rowcount > 0
+            if updated:
+                self._publish_event(cursor, 'job_finished', {'job_id': job_id, 'status': status})
+        return updated
+    
+    def get_job(self, job_id: int, include_payload: bool = False) -> Optional[Dict]:
+        """Job status row with its decoded result (and payload when asked)"""
+        columns = 'id, job_type, status, result, error, attempts, created_at, started_at, finished_at'
+        if include_payload:
+            columns += ', payload'
+        job = self._fetch_one(f'SELECT {columns} FROM jobs WHERE id = ?', (job_id,))
+        if job is None:
+            return None
+        for key in ('result', 'payload'):
+            if key in job:
+                job[key] = json.loads(job[key]) if job[key] else None
+        for key in ('created_at', 'started_at', 'finished_at'):
+            if job[key] is not None:
+                job[key] = str(job[key])
+        return job
+    
+    def set_job_stage(self, job_id: int, stage: str, status: str, attempts: int = 1, error: str = None):
+        """
+        Record the progress of one stage of a job (e.g. a recipe import's fetch,
+        parse and save): running, retrying, succeeded or failed. started_at is
+        kept from the first call, finished_at is set by the final statuses.
+        """
+        # Same UTC text format as CURRENT_TIMESTAMP in the jobs table
+        now = datetime.now(timezone.utc).strftime('%Y-%m-%d %H:%M:%S')
+        finished_at = now if status in ('succeeded', 'failed') else None
+        with self.transaction() as conn:
+            self._execute(conn.cursor(), '''
+                INSERT INTO job_stages (job_id, stage, status, attempts, error, started_at, finished_at)
+                VALUES (?, ?, ?, ?, ?, ?, ?)
+                ON CONFLICT (job_id, stage) DO UPDATE SET
+                    status = excluded.status, attempts = excluded.attempts,
+                    error = excluded.error, finished_at = excluded.finished_at
+            ''', (job_id, stage, status, attempts, error, now, finished_at))
+    
+    def get_job_stages(self, job_ids: Sequence[int]) -> Dict[int, List[Dict]]:
+        """Stage rows of the given jobs, by job id, in the order they started"""
+        stages = {job_id: [] for job_id in job_ids}
+        if not job_ids:
+            return stages
+        rows = self._fetch_all(f'''
+            SELECT job_id, stage, status, attempts, error, started_at, finished_at
+            FROM job_stages WHERE job_id IN ({qmarks(len(job_ids))})
+            ORDER BY job_id, started_at
+        ''', tuple(job_ids))
         for row in rows:
-            menu = dict(row)
-            menu['menu_data'] = json.loads(menu.get('menu_data', '{}'))
-            menus.append(menu)
+            for key in ('started_at', 'finished_at'):
+                if row[key] is not None:
+                    row[key] = str(row[key])
+            stages[row.pop('job_id')].append(row)
+        return stages
+    
+    def fail_stale_jobs(self, job_types: Sequence[str], max_runtime: float) -> int:
+        """
+        Fail jobs that have been running for longer than max_runtime seconds,
+        i.e. whose worker process died mid-job (restart, deploy, OOM kill).
+        """
+        if not job_types:
+            return 0
+        # CURRENT_TIMESTAMP is stored in UTC
+        cutoff = (datetime.now(timezone.utc) - timedelta(seconds=max_runtime)).strftime('%Y-%m-%d %H:%M:%S')
+        with self.transaction() as conn:
+            cursor = conn.cursor()
+            stale = self._execute(cursor, f'''
+                SELECT id FROM jobs
+                WHERE status = 'running' AND job_type IN ({qmarks(len(job_types))}) AND started_at < ?
+            ''', (*job_types, cutoff)).fetchall()
+            for (job_id,) in stale:
+                self._execute(cursor, '''
+                    UPDATE jobs SET status = 'failed', error = ?, finished_at = CURRENT_TIMESTAMP
+                    WHERE id = ? AND status = 'running'
+                ''', ('El trabajo se interrumpió (reinicio del servidor)', job_id))
+                self._publish_event(cursor, 'job_finished', {'job_id': job_id, 'status': 'failed'})
+        return len(stale)
+    
+    # ==================== LLM RESPONSE CACHE ====================
+    
+    def get_llm_response(self, cache_key: str, max_age: float) -> Optional[Dict]:
+        """
+        Cached MenuGenerator result for a request hash, or None when missing or
+        older than max_age seconds. A hit refreshes last_used_at for LRU eviction.
+        """
+        row = self._fetch_one('SELECT data, created_at FROM llm_cache WHERE cache_key = ?', (cache_key,))
+        if row is None:
+            return None
         
-        self._close_connection(conn)
-        return menus
+        now = time.time()
+        with self.transaction() as conn:
+            cursor = conn.cursor()
+            if row['created_at'] < now - max_age:
+                self._execute(cursor, 'DELETE FROM llm_cache WHERE cache_key = ?', (cache_key,))
+                return None
+            self._execute(cursor, 'UPDATE llm_cache SET last_used_at = ? WHERE cache_key = ?', (now, cache_key))
+        return json.loads(zlib.decompress(bytes(row['data'])).decode('utf-8'))
+    
+    def save_llm_response(self, cache_key: str, model: str, result: Dict, max_entries: int, max_age: float):
+        """Store a result (zlib-compressed JSON), then drop expired and least recently used entries"""
+        now = time.time()
+        data = zlib.compress(json.dumps(result, default=to_json).encode('utf-8'), 6)
+        with self.transaction() as conn:
+            cursor = conn.cursor()
+            self._execute(cursor, '''
+                INSERT INTO llm_cache (cache_key, model, data, created_at, last_used_at)
+                VALUES (?, ?, ?, ?, ?)
+                ON CONFLICT (cache_key)
+                DO UPDATE SET model = excluded.model, data = excluded.data,
+                              created_at = excluded.created_at, last_used_at = excluded.last_used_at
+            ''', (cache_key, model, data, now, now))
+            self._execute(cursor, 'DELETE FROM llm_cache WHERE created_at < ?', (now - max_age,))
+            
+            count = self._execute(cursor, 'SELECT COUNT(*) FROM llm_cache').fetchone()[0]
+            if count > max_entries:
+                self._execute(cursor, '''
+                    DELETE FROM llm_cache WHERE cache_key IN (
+                        SELECT cache_key FROM llm_cache ORDER BY last_used_at LIMIT ?
+                    )
+                ''', (count - max_entries,))
+    
+    def clear_llm_cache(self) -> int:
+        """Remove every cached LLM response; returns how many were dropped"""
+        with self.transaction() as conn:
+            return self._execute(conn.cursor(), 'DELETE FROM llm_cache').rowcount
+    
+    # ==================== HTTP PAGE CACHE ====================
+    
+    def get_cached_page(self, cache_key: str) -> Optional[Dict]:
+        """
+        Cached page for a canonical-URL hash (body decompressed), or None.
+        A hit refreshes last_used_at for LRU eviction.
+        """
+        row = self._fetch_one('''
+            SELECT url, final_url, etag, last_modified, content_type, body, fetched_at
+            FROM http_cache WHERE cache_key = ?
+        ''', (cache_key,))
+        if row is None:
+            return None
+        
+        with self.transaction() as conn:
+            self._execute(conn.cursor(), 'UPDATE http_cache SET last_used_at = ? WHERE cache_key = ?',
+                          (time.time(), cache_key))
+        row['body'] = zlib.decompress(bytes(row['body']))
+        return row
+    
+    def save_cached_page(self, cache_key: str, page: Dict, max_bytes: int):
+        """
+        Store a fetched page (url, final_url, etag, last_modified, content_type, body)
+        zlib-compressed, then evict least recently used pages until the compressed
+        total fits in max_bytes.
+        """
+        now = time.time()
+        body = zlib.compress(page['body'], 6)
+        with self.transaction() as conn:
+            cursor = conn.cursor()
+            self._execute(cursor, '''
+                INSERT INTO http_cache (cache_key, url, final_url, etag, last_modified, content_type,
+                                        body, size, fetched_at, last_used_at)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+                ON CONFLICT (cache_key)
+                DO UPDATE SET url = excluded.url, final_url = excluded.final_url, etag = excluded.etag,
+                              last_modified = excluded.last_modified, content_type = excluded.content_type,
+                              body = excluded.body, size = excluded.size,
+                              fetched_at = excluded.fetched_at, last_used_at = excluded.last_used_at
+            ''', (cache_key, page['url'], page.get('final_url'), page.get('etag'), page.get('last_modified'),
+                  page.get('content_type'), body, len(body), now, now))
+            
+            total = self._execute(cursor, 'SELECT COALESCE(SUM(size), 0) FROM http_cache').fetchone()[0]
+            if total > max_bytes:
+                evict = []
+                rows = self._execute(cursor, 'SELECT cache_key, size FROM http_cache ORDER BY last_used_at').fetchall()
+                for key, size in rows:
+                    if total <= max_bytes:
+                        break
+                    evict.append(key)
+                    total -= size
+                self._execute(cursor, f'DELETE FROM http_cache WHERE cache_key IN ({qmarks(len(evict))})', evict)
+    
+    def touch_cached_page(self, cache_key: str):
+        """Mark a cached page as just revalidated (the server answered 304 Not Modified)"""
+        now = time.time()
+        with self.transaction() as conn:
+            self._execute(conn.cursor(), 'UPDATE http_cache SET fetched_at = ?, last_used_at = ? WHERE cache_key = ?',
+                          (now, now, cache_key))
+    
+    def clear_page_cache(self) -> int:
+        """Remove every cached page; returns how many were dropped"""
+        with self.transaction() as conn:
+            return self._execute(conn.cursor(), 'DELETE FROM http_cache').rowcount
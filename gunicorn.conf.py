@@ -0,0 +1,11 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Gunicorn hooks for Family Kitchen Menu System (loaded with --config in Procfile / railway.toml)
+"""
+
+
+def post_worker_init(worker):
+    """Start the background job workers in every gunicorn worker process"""
+    from app import start_background_workers
+    start_background_workers()
@@ -0,0 +1,117 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Background job queue for Family Kitchen Menu System
+Runs long tasks (AI menu generation) outside the request cycle, backed by the jobs table
+"""
+import os
+import threading
+import traceback
+from typing import Callable, Dict, Optional
+
+from database import Database
+
+
+class JobQueue:
+    """
+    Worker pool that runs jobs stored in the jobs table.
+    
+    Requests call submit() and return the job id straight away; clients poll
+    Database.get_job (or listen for 'job_finished' on /api/events). Jobs live
+    in the database, so any gunicorn worker can report on a job that another
+    one is running, and idle workers of every process pick up queued work.
+    Each process calls start() when it boots (see gunicorn.conf.py) so jobs
+    left queued by a restart are drained without waiting for a new submit().
+    """
+    
+    def __init__(self, db: Database, workers: Optional[int] = None,
+                 poll_interval: float = 5.0, max_runtime: float = 900.0):
+        self.db = db
+        self.workers = int(os.getenv('JOB_WORKERS', '2')) if workers is None else workers
+        self.poll_interval = poll_interval
+        self.max_runtime = max_runtime
+        self._handlers: Dict[str, Callable[[int, Dict], Dict]] = {}
+        self._threads = []
+        self._pid = None
+        self._stop = threading.Event()
+        self._lock = threading.Lock()
+        self._wakeup = threading.Condition()
+    
+    def register(self, job_type: str, handler: Callable[[int, Dict], Dict]):
+        """Run handler(job_id, payload) for jobs of job_type; its return value is the job result"""
+        self._handlers[job_type] = handler
+    
+    def submit(self, job_type: str, payload: Optional[Dict] = None) -> int:
+        """Queue a job and wake a worker; returns the job id"""
+        if job_type not in self._handlers:
+            raise ValueError(f'Unknown job type: {job_type}')
+        job_id = self.db.create_job(job_type, payload)
+        self.start()
+        with self._wakeup:
+            self._wakeup.notify()
+        return job_id
+    
+    def start(self):
+        """Start the worker threads once per process (gunicorn forks after import)"""
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            self._pid = os.getpid()
+            self._stop = threading.Event()
+            self._threads = [
+                threading.Thread(target=self._work, args=(self._stop,), name=f'job-worker-{i}', daemon=True)
+                for i in range(self.workers)
+            ]
+            for thread in self._threads:
+                thread.start()
+    
+    def stop(self, timeout: float = 5.0):
+        """Stop this process's worker threads once their current job is done"""
+        with self._lock:
+            threads, self._threads, self._pid = self._threads, [], None
+            self._stop.set()
+        with self._wakeup:
+            self._wakeup.notify_all()
+        for thread in threads:
+            thread.join(timeout)
+    
+    def _work(self, stop: threading.Event):
+        """Worker loop: run queued jobs, sleeping until woken or poll_interval passes"""
+        while not stop.is_set():
+            try:
+                if self.run_next():
+                    continue
+                self.db.fail_stale_jobs(list(self._handlers), self.max_runtime)
+            except Exception as e:
+                print(f"[JobQueue] Worker error: {e}")
+            with self._wakeup:
+                if not stop.is_set():
+                    self._wakeup.wait(self.poll_interval)
+    
+    def run_next(self) -> bool:
+        """Claim and run one queued job; False when there was nothing to do"""
+        job = self.db.claim_next_job(list(self._handlers))
+        if job is None:
+            return False
+        
+        print(f"[JobQueue] Running job {job['id']} ({job['job_type']})")
+        try:
+            result = self._handlers[job['job_type']](job['id'], job['payload'] or {})
+        except Exception as e:
+            traceback.print_exc()
+            self.db.finish_job(job['id'], 'failed', error=str(e))
+            return True
+        
+        # Handlers report expected failures the same way the API does: {'success': False, 'error': ...}
+        if isinstance(result, dict) and result.get('success') is False:
+            self.db.finish_job(job['id'], 'failed', result, result.get('error') or 'Error desconocido')
+        else:
+            self.db.finish_job(job['id'], 'succeeded', result)
+        return True
+    
+    def run_pending(self) -> int:
+        """Run every queued job in the calling thread; returns how many ran"""
+        count = 0
+        while self.run_next():
+            count += 1
+        return count
@@ -0,0 +1,335 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Incremental and tolerant JSON parsing for Family Kitchen Menu System
+Finds complete sub-objects of a JSON document while it is still being streamed,
+decodes the slightly broken JSON that LLMs write, and streams the string values
+out of large embedded documents without building them
+"""
+import json
+import re
+from json.decoder import JSONDecodeError, scanstring
+from typing import Any, Callable, Iterator, List, Optional, Tuple
+
+Path = Tuple  # keys and array indexes from the root, e.g. ('menu_adultos', 'dias', 'lunes')
+
+
+class IncrementalJSONParser:
+    """
+    Feed a JSON document chunk by chunk and get back the source text of every
+    object or array whose path matches `watch` as soon as its closing bracket
+    arrives. Only structure is tracked (brackets, keys, strings); values are
+    not decoded here, so the caller decides how tolerant decoding should be.
+    
+    Text before the first '{' or '[' (prose, a ```json fence) and after the
+    root value closes is ignored. Watched containers nested inside another
+    watched container are not reported separately.
+    """
+    
+    def __init__(self, watch: Callable[[Path], bool]):
+        self.watch = watch
+        self._stack: List[list] = []  # [kind, path, key or index, expecting_key]
+        self._in_string = False
+        self._escape = False
+        self._key_chars: Optional[List[str]] = None
+        self._capture: Optional[List[str]] = None
+        self._capture_depth = 0
+        self.done = False
+    
+    def feed(self, chunk: str) -> List[Tuple[Path, str]]:
+        """Scan the next chunk; returns (path, text) for each watched container it completed"""
+        completed = []
+        capture_from = 0
+        
+        for i, char in enumerate(chunk):
+            if self.done:
+                break
+            
+            if self._in_string:
+                if self._key_chars is not None and (self._escape or char != '"'):
+                    self._key_chars.append(char)
+                if self._escape:
+                    self._escape = False
+                elif char == '\\':
+                    self._escape = True
+                elif char == '"':
+                    self._in_string = False
+                    if self._key_chars is not None:
+                        self._stack[-1][2] = self._decode_key(''.join(self._key_chars))
+                        self._key_chars = None
+                continue
+            
+            if not self._stack:
+                # Outside the document: wait for the root container
+                if char not in '{[':
+                    continue
+            
+            if char == '"':
+                self._in_string = True
+                top = self._stack[-1]
+                if top[0] == '{' and top[3]:
+                    self._key_chars = []
+            elif char in '{[':
+                path = self._child_path()
+                self._stack.append([char, path, 0 if char == '[' else None, char == '{'])
+                if self._capture is None and self.watch(path):
+                    self._capture = []
+                    self._capture_depth = len(self._stack)
+                    capture_from = i
+            elif char in '}]':
+                if self._capture is not None and len(self._stack) == self._capture_depth:
+                    self._capture.append(chunk[capture_from:i + 1])
+                    completed.append((self._stack[-1][1], ''.join(self._capture)))
+                    self._capture = None
+                self._stack.pop()
+                if not self._stack:
+                    self.done = True
+            elif char == ':':
+                self._stack[-1][3] = False
+            elif char == ',':
+                top = self._stack[-1]
+                if top[0] == '{':
+                    top[2], top[3] = None, True
+                else:
+                    top[2] += 1
+        
+        if self._capture is not None:
+            self._capture.append(chunk[capture_from:])
+        return completed
+    
+    def _child_path(self) -> Path:
+        """Path of a value starting at the current position"""
+        if not self._stack:
+            return ()
+        kind, path, key, _ = self._stack[-1]
+        return path + (key,)
+    
+    @staticmethod
+    def _decode_key(raw: str) -> str:
+        try:
+            return json.loads(f'"{raw}"')
+        except ValueError:
+            return raw
+
+
+_SKIP = re.compile(r'(?:\s+|//[^\n]*|/\*(?:[^*]|\*(?!/))*(?:\*/|\Z))*')
+_FENCE = re.compile(r'```[ \t]*(?:json)?[ \t]*\n', re.IGNORECASE)
+_BARE_KEY = re.compile(r'[^\s:,{}\[\]"/]+')
+_BARE_VALUE = re.compile(r'[^,{}\[\]\n"]*')
+_NUMBER = re.compile(r'-?(?:0|[1-9]\d*)(?:\.\d+)?(?:[eE][-+]?\d+)?')
+_LITERALS = {'true': True, 'false': False, 'null': None, 'True': True, 'False': False, 'None': None}
+_MISSING = object()
+
+
+class TolerantJSONParser:
+    """
+    Single-pass decoder for JSON as LLMs write it. In one left-to-right scan it:
+    
+    - skips prose and ```json fences before the document and anything after it
+    - ignores // and /* */ comments and trailing or repeated commas
+    - keeps quotes that are not followed by , : } ] or a newline as part of
+      the string ("el "mejor" plato")
+    - accepts invalid escapes, raw newlines, unquoted keys and bare words
+      (350 kcal) as strings, and Python True/False/None
+    - closes whatever is still open when the text is truncated, dropping a
+      key that never got its value (check `truncated` afterwards)
+    
+    Valid JSON decodes exactly as json.loads would. Strings go through the
+    C scanstring, so the cost stays close to a single json.loads.
+    """
+    
+    def __init__(self):
+        self.truncated = False
+    
+    def parse(self, text: str) -> Any:
+        """Decode the first JSON object or array in text; JSONDecodeError if there is none"""
+        self.truncated = False
+        self._text = text
+        self._end = len(text)
+        
+        fence = _FENCE.search(text)
+        starts = [i for i in (text.find('{', fence.end() if fence else 0),
+                              text.find('[', fence.end() if fence else 0)) if i >= 0]
+        if not starts:
+            raise JSONDecodeError('No JSON object found', text, 0)
+        pos = min(starts)
+        
+        root = {} if text[pos] == '{' else []
+        stack = [root]
+        key = _MISSING  # key of the member being read in the innermost object
+        pos += 1
+        
+        while stack:
+            pos = _SKIP.match(text, pos).end()
+            if pos >= self._end:
+                self.truncated = True
+                break
+            top = stack[-1]
+            char = text[pos]
+            
+            if char in '}]':
+                stack.pop()
+                key = _MISSING
+                pos += 1
+                continue
+            if char == ',':
+                if key is not _MISSING:
+                    key = _MISSING  # "key": , -> drop the member
+                pos += 1
+                continue
+            
+            if isinstance(top, dict) and key is _MISSING:
+                if char == '"':
+                    key, pos = self._string(pos + 1)
+                else:
+                    match = _BARE_KEY.match(text, pos)
+                    if not match:
+                        pos += 1  # stray character, e.g. a missing opening quote's partner
+                        continue
+                    key, pos = match.group(), match.end()
+                pos = _SKIP.match(text, pos).end()
+                if pos < self._end and text[pos] == ':':
+                    pos += 1
+                continue
+            
+            if char in '{[':
+                value = {} if char == '{' else []
+                pos += 1
+            elif char == '"':
+                value, pos = self._string(pos + 1)
+            else:
+                value, pos = self._bare(pos)
+                if value is _MISSING:
+                    continue
+            
+            if isinstance(top, dict):
+                top[key] = value
+                key = _MISSING
+            else:
+                top.append(value)
+            if char in '{[':
+                stack.append(value)
+        
+        if self.truncated and key is not _MISSING and isinstance(stack[-1], dict):
+            # The text ended between a key and its value
+            stack[-1].pop(key, None)
+        return root
+    
+    def _string(self, pos: int) -> Tuple[str, int]:
+        """Decode a string whose opening quote is just before pos; returns (value, position after it)"""
+        text = self._text
+        parts = []
+        while True:
+            try:
+                value, end = scanstring(text, pos, False)
+            except JSONDecodeError as e:
+                if e.msg.startswith('Unterminated string'):
+                    self.truncated = True
+                    tail = text[pos:]
+                    if tail.endswith('\\') and not tail.endswith('\\\\'):
+                        tail = tail[:-1]
+                    parts.append(self._decode_fragment(tail))
+                    return ''.join(parts), self._end
+                # Invalid escape: keep the backslash as a literal character
+                backslash = e.pos if text[e.pos] == '\\' else e.pos - 1
+                parts.append(self._decode_fragment(text[pos:backslash]) + '\\')
+                pos = backslash + 1
+                continue
+            
+            # A closing quote is followed by a delimiter; anything else means the
+            # model forgot to escape a quote inside the string
+            after = end
+            while after < self._end and text[after] in ' \t\r':
+                after += 1
+            if after >= self._end or text[after] in ',:}]\n/':
+                parts.append(value)
+                return ''.join(parts), end
+            parts.append(value + '"')
+            pos = end
+    
+    @staticmethod
+    def _decode_fragment(raw: str) -> str:
+        """Decode escapes of a string fragment, leaving it as-is if it cannot be decoded"""
+        try:
+            return scanstring(raw + '"', 0, False)[0]
+        except JSONDecodeError:
+            return raw
+    
+    def _bare(self, pos: int) -> Tuple[Any, int]:
+        """Number, literal or unquoted word starting at pos (_MISSING for nothing usable)"""
+        match = _BARE_VALUE.match(self._text, pos)
+        end = match.end()
+        raw = match.group()
+        comment = raw.find('//')
+        if comment >= 0:
+            raw, end = raw[:comment], pos + comment
+        raw = raw.strip()
+        if end >= self._end:
+            self.truncated = True
+        
+        if not raw or raw.strip('.…') == '':
+            # Nothing, or an ellipsis standing for "more items"
+            return _MISSING, max(end, pos + 1)
+        if raw in _LITERALS:
+            return _LITERALS[raw], end
+        number = _NUMBER.fullmatch(raw)
+        if number:
+            return (float(raw) if any(c in raw for c in '.eE') else int(raw)), end
+        if end >= self._end and any(literal.startswith(raw) for literal in _LITERALS):
+            return _MISSING, end  # truncated literal
+        return raw, end
+
+
+def loads_tolerant(text: str) -> Any:
+    """Decode the first JSON object or array in an LLM response (see TolerantJSONParser)"""
+    return TolerantJSONParser().parse(text)
+
+
+_STRUCTURE = re.compile(r'["{}\[\]:,]')
+
+
+def iter_json_strings(text: str, max_depth: int = 0) -> Iterator[Tuple[int, str]]:
+    """
+    Stream the string values of a JSON document as (depth, value), where depth
+    is the number of objects enclosing the value. Nothing is built: the text is
+    scanned token by token and only strings are decoded (C scanstring), so a
+    multi-megabyte script costs one scan and the caller can stop at any point.
+    
+    Object keys are skipped, values nested deeper than max_depth objects are
+    not reported (0: no limit) and malformed input simply ends the stream.
+    """
+    objects: List[bool] = []  # True for each open object, False for arrays
+    depth = 0
+    expecting_key = False
+    pos = 0
+    search = _STRUCTURE.search
+    while True:
+        match = search(text, pos)
+        if match is None:
+            return
+        char = match.group()
+        pos = match.end()
+        if char == '"':
+            try:
+                value, pos = scanstring(text, pos, False)
+            except ValueError:
+                return
+            if not expecting_key and (not max_depth or depth <= max_depth):
+                yield depth, value
+        elif char == '{':
+            objects.append(True)
+            depth += 1
+            expecting_key = True
+        elif char == '[':
+            objects.append(False)
+            expecting_key = False
+        elif char in '}]':
+            if not objects:
+                return
+            if objects.pop():
+                depth -= 1
+            expecting_key = False
+        elif char == ',':
+            expecting_key = bool(objects) and objects[-1]
+        else:  # ':'
+            expecting_key = False
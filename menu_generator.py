@@ -1,71 +1,67 @@
 import anthropic
 import os
 import json
-from typing import List, Dict, Optional
+import hashlib
+import unicodedata
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import Callable, List, Dict, Optional
 from datetime import datetime, timedelta
 import httpx
-import re
 
-def repair_json_string(json_str: str) -> str:
-    """
-    Repair JSON string by fixing common issues like unescaped quotes.
-    Uses a state machine to properly escape quotes inside string values.
-    """
-    result = []
-    i = 0
-    in_string = False
-    escape_next = False
-    
-    while i < len(json_str):
-        char = json_str[i]
-        
-        if escape_next:
-            result.append(char)
-            escape_next = False
-        elif char == '\\':
-            result.append(char)
-            escape_next = True
-        elif char == '"':
-            # Check if this is the start or end of a string
-            # Look ahead to see if this might be inside a string value
-            if in_string:
-                # We're inside a string, check if this quote should be escaped
-                # Look ahead to see if there's a colon or comma after potential closing quote
-                lookahead = i + 1
-                while lookahead < len(json_str) and json_str[lookahead] in ' \t\n\r':
-                    lookahead += 1
-                
-                if lookahead < len(json_str):
-                    next_char = json_str[lookahead]
-                    # If next char is : or , or } or ], this might be a closing quote
-                    # But if it's a letter or other char, it's likely an unescaped quote inside the string
-                    if next_char in ':,\n}]':
-                        # This looks like a closing quote
-                        result.append(char)
-                        in_string = False
-                    else:
-                        # This looks like an unescaped quote inside the string
-                        result.append('\\"')
-                else:
-                    # End of string, this is a closing quote
-                    result.append(char)
-                    in_string = False
-            else:
-                # Starting a new string
-                result.append(char)
-                in_string = True
-        else:
-            result.append(char)
-        
-        i += 1
-    
-    return ''.join(result)
+from json_stream import IncrementalJSONParser, TolerantJSONParser, loads_tolerant
+from models import to_json
+
+
+WEEK_DAYS = ['lunes', 'martes', 'miercoles', 'jueves', 'viernes', 'sabado', 'domingo']
+
+MEALS_BY_MENU_TYPE = {
+    'adultos': ['desayuno', 'comida', 'cena'],
+    'ninos': ['desayuno', 'comida', 'merienda', 'cena'],
+}
+
+# Main ingredient suggested for each day in parallel mode, so independently
+# generated days do not all converge on the same dishes
+DAY_FOCUS = ['legumbres', 'pescado blanco', 'pollo', 'huevos y verduras', 'pescado azul', 'carne', 'arroz o pasta']
+
+
+def estimate_tokens(text: str) -> int:
+    """Rough token count used to budget prompts (about 3.5 characters per token for Spanish text)"""
+    return (len(text) * 2 + 6) // 7
+
+
+def fit_to_budget(entries: List[str], budget: int) -> List[str]:
+    """Leading entries whose combined estimated size fits in `budget` tokens"""
+    kept = []
+    used = 0
+    for entry in entries:
+        used += estimate_tokens(entry)
+        if used > budget:
+            break
+        kept.append(entry)
+    return kept
+
+
+def normalize_name(name: str) -> str:
+    """Lowercase, accent-free form used to compare day and dish names ('Miércoles' -> 'miercoles')"""
+    decomposed = unicodedata.normalize('NFKD', str(name).strip().lower())
+    return ''.join(c for c in decomposed if not unicodedata.combining(c))
+
+
+def is_menu_day_path(path: tuple) -> bool:
+    """True for menu_adultos.dias.<day> and menu_ninos.dias.<day>"""
+    return len(path) == 3 and path[0] in ('menu_adultos', 'menu_ninos') and path[1] == 'dias'
 
 
 class MenuGenerator:
     """AI-powered menu generator using Claude"""
     
-    def __init__(self, api_key: Optional[str] = None):
+    def __init__(self, api_key: Optional[str] = None, response_cache=None):
+        """
+        Args:
+            api_key: Anthropic API key (defaults to ANTHROPIC_API_KEY)
+            response_cache: Optional store with get_llm_response/save_llm_response
+                            (the Database) for reusing results of identical requests
+        """
         self.api_key = api_key or os.getenv('ANTHROPIC_API_KEY')
         if not self.api_key:
             raise ValueError("API key de Anthropic no encontrada. Configura ANTHROPIC_API_KEY")
@@ -78,6 +74,17 @@ class MenuGenerator:
             api_key=self.api_key,
             http_client=http_client
         )
+        
+        # Content-addressed cache of parsed results, keyed by the full request
+        cache_enabled = os.getenv('LLM_CACHE_ENABLED', 'true').lower() in ('1', 'true', 'yes')
+        self.response_cache = response_cache if cache_enabled else None
+        self.cache_ttl = float(os.getenv('LLM_CACHE_TTL', '86400'))
+        self.cache_max_entries = int(os.getenv('LLM_CACHE_MAX_ENTRIES', '200'))
+        
+        # Prompt size budgets (estimated tokens): the cached family context (profiles +
+        # recipe library) and the ratings history in the per-request part
+        self.context_token_budget = int(os.getenv('MENU_PROMPT_CONTEXT_TOKENS', '6000'))
+        self.history_token_budget = int(os.getenv('MENU_PROMPT_HISTORY_TOKENS', '1500'))
     
     def generate_weekly_menu(self, 
                             adults: List[Dict], 
@@ -86,7 +93,10 @@ class MenuGenerator:
                             preferences: Optional[Dict] = None,
                             day_settings: Optional[Dict] = None,
                             highly_rated_menus: Optional[List[Dict]] = None,
-                            historical_ratings: Optional[List[Dict]] = None) -> Dict:
+                            historical_ratings: Optional[List[Dict]] = None,
+                            on_day: Optional[Callable[[str, str, Dict], None]] = None,
+                            use_cache: bool = True,
+                            recommended: Optional[List[str]] = None) -> Dict:
         """
         Generate a personalized weekly menu for the family
         
@@ -97,13 +107,22 @@ class MenuGenerator:
             preferences: Optional additional preferences (budget, cooking time, etc.)
             day_settings: Optional dict with cooking settings per day
                          Example: {"lunes": {"meals": ["desayuno", "cena"], "no_cooking": False}}
+            on_day: Optional callback(menu_type, day_name, day_menu). When given, the
+                    response is streamed and each day is passed on as soon as it is complete;
+                    the full menu is still parsed and returned at the end
+            use_cache: False to skip cached results and ask Claude for a new menu
+                       (the new result still replaces the cached one)
+            recommended: Optional recipe titles ranked with ratings and recent menus,
+                         best first (sent outside the cached family context)
         
         Returns:
             Dictionary with weekly menu and recommendations
         """
         
-        # Build the prompt with family information
-        prompt = self._build_menu_prompt(adults, children, recipes, preferences, day_settings, historical_ratings)
+        # Build the prompt: cacheable family context + this week's instructions
+        family_context = self._build_family_context(adults, children, recipes)
+        prompt = self._build_menu_prompt(adults, children, recipes, preferences, day_settings,
+                                         historical_ratings=historical_ratings, recommended=recommended)
         
         # Call Claude API
         try:
@@ -111,34 +130,44 @@ class MenuGenerator:
             print(f"[MenuGenerator] Perfiles: {len(adults)} adultos, {len(children)} niños")
             print(f"[MenuGenerator] Recetas disponibles: {len(recipes) if recipes else 0}")
             
-            message = self.client.messages.create(
-                model="claude-sonnet-4-20250514",
-                max_tokens=16000,  # Increased for detailed nutritional info
-                temperature=0.7,
-                messages=[
-                    {
-                        "role": "user",
-                        "content": prompt
-                    }
-                ]
-            )
+            request = self._build_request(family_context, prompt, max_tokens=16000)  # Increased for detailed nutritional info
+            
+            cached = self._cached_result(request, use_cache)
+            if cached:
+                print(f"[MenuGenerator] Menú servido desde la caché")
+                if on_day:
+                    for menu_type in ('adultos', 'ninos'):
+                        days = (cached['menu'].get(f'menu_{menu_type}') or {}).get('dias') or {}
+                        for day_name, day_menu in days.items():
+                            on_day(menu_type, day_name, day_menu)
+                return cached
+            
+            if on_day:
+                response_text = self._stream_menu_response(request, on_day)
+            else:
+                message = self.client.messages.create(**request)
+                self._log_usage(message)
+                response_text = message.content[0].text
             
             print(f"[MenuGenerator] Respuesta recibida de Claude API")
             
             # Parse response
-            response_text = message.content[0].text
             print(f"[MenuGenerator] Longitud de respuesta: {len(response_text)} caracteres")
             
             # Try to extract JSON from response
             menu_data = self._parse_menu_response(response_text, adults, children)
             print(f"[MenuGenerator] Menú parseado correctamente")
             
-            return {
+            result = {
                 'success': True,
                 'menu': menu_data,
                 'raw_response': response_text,
                 'generated_at': datetime.now().isoformat()
             }
+            # Unparsed (text) and cut-off menus are not worth replaying
+            if menu_data.get('formato') != 'texto' and not menu_data.get('truncated'):
+                self._cache_result(request, result)
+            return result
             
         except anthropic.APIError as e:
             error_msg = f"Error de API de Anthropic: {e.message if hasattr(e, 'message') else str(e)}"
@@ -167,6 +196,258 @@ class MenuGenerator:
                 'menu': None
             }
     
+    def _build_request(self, family_context: str, prompt: str, max_tokens: int) -> Dict:
+        """
+        Claude request with the family context as a cached system prefix
+        (Anthropic prompt caching) and the per-call instructions as the user message
+        """
+        return dict(
+            model="claude-sonnet-4-20250514",
+            max_tokens=max_tokens,
+            temperature=0.7,
+            system=[
+                {
+                    "type": "text",
+                    "text": family_context,
+                    "cache_control": {"type": "ephemeral"}
+                }
+            ],
+            messages=[
+                {
+                    "role": "user",
+                    "content": prompt
+                }
+            ]
+        )
+    
+    def _log_usage(self, message):
+        """Log input tokens and how many were written to / read from the prompt cache"""
+        usage = getattr(message, 'usage', None)
+        if usage is None:
+            return
+        print(f"[MenuGenerator] Tokens: input={usage.input_tokens}, "
+              f"cache_write={getattr(usage, 'cache_creation_input_tokens', None) or 0}, "
+              f"cache_read={getattr(usage, 'cache_read_input_tokens', None) or 0}, "
+              f"output={usage.output_tokens}")
+    
+    def _cache_key(self, request: Dict) -> str:
+        """Content address of a Claude request: the full prompt plus the parameters that shape the answer"""
+        material = json.dumps(
+            {key: request.get(key) for key in ('model', 'temperature', 'max_tokens', 'system', 'messages')},
+            sort_keys=True, ensure_ascii=False
+        )
+        return hashlib.sha256(material.encode('utf-8')).hexdigest()
+    
+    def _cached_result(self, request: Dict, use_cache: bool = True) -> Optional[Dict]:
+        """Result previously stored for an identical request, or None"""
+        if not use_cache or self.response_cache is None:
+            return None
+        try:
+            result = self.response_cache.get_llm_response(self._cache_key(request), self.cache_ttl)
+        except Exception as e:
+            print(f"[MenuGenerator] Cache read error: {e}")
+            return None
+        if result is not None:
+            result['cached'] = True
+        return result
+    
+    def _cache_result(self, request: Dict, result: Dict):
+        """Remember a successfully parsed result for identical future requests"""
+        if self.response_cache is None:
+            return
+        try:
+            self.response_cache.save_llm_response(self._cache_key(request), request['model'], result,
+                                                  self.cache_max_entries, self.cache_ttl)
+        except Exception as e:
+            print(f"[MenuGenerator] Cache write error: {e}")
+    
+    def _stream_menu_response(self, request: Dict, on_day: Callable[[str, str, Dict], None]) -> str:
+        """
+        Stream the weekly menu response and call on_day(menu_type, day_name, day_menu)
+        for every menu_adultos.dias.<day> / menu_ninos.dias.<day> object as soon as it closes.
+        Returns the complete response text.
+        """
+        parser = IncrementalJSONParser(is_menu_day_path)
+        chunks = []
+        
+        with self.client.messages.stream(**request) as stream:
+            for text in stream.text_stream:
+                chunks.append(text)
+                for path, fragment in parser.feed(text):
+                    try:
+                        day_menu = loads_tolerant(fragment)
+                    except json.JSONDecodeError:
+                        print(f"[MenuGenerator] Could not parse streamed day {'.'.join(path)}, waiting for full response")
+                        continue
+                    try:
+                        on_day(path[0][len('menu_'):], path[2], day_menu)
+                    except Exception as e:
+                        # A failing listener must not abort the generation
+                        print(f"[MenuGenerator] on_day callback error: {e}")
+            if hasattr(stream, 'get_final_message'):
+                self._log_usage(stream.get_final_message())
+        
+        return ''.join(chunks)
+    
+    def generate_weekly_menu_parallel(self,
+                                      adults: List[Dict],
+                                      children: List[Dict],
+                                      recipes: Optional[List[Dict]] = None,
+                                      preferences: Optional[Dict] = None,
+                                      day_settings: Optional[Dict] = None,
+                                      historical_ratings: Optional[List[Dict]] = None,
+                                      on_day: Optional[Callable[[str, str, Dict], None]] = None,
+                                      use_cache: bool = True,
+                                      recommended: Optional[List[str]] = None) -> Dict:
+        """
+        Generate the weekly menu as one generate_single_day_menu call per day and
+        menu type, run concurrently (MENU_FANOUT_WORKERS threads, default 7), so the
+        wall-clock time is close to that of a single day. Every day gets the same
+        family context plus a different main ingredient; after merging, meals that
+        repeat a dish from an earlier day are regenerated once. The shopping list is
+        built from the merged ingredients.
+        
+        Same arguments and result shape as generate_weekly_menu.
+        """
+        preferences = preferences or {}
+        day_settings = day_settings or {}
+        menu_types = [menu_type for menu_type, profiles in (('adultos', adults), ('ninos', children)) if profiles]
+        plan = self._plan_week(preferences, day_settings)
+        workers = int(os.getenv('MENU_FANOUT_WORKERS', '7'))
+        
+        print(f"[MenuGenerator] Generación paralela: {len(plan)} días x {len(menu_types)} menús, {workers} hilos")
+        
+        def generate_day(day_name, menu_type, meals, day_focus, specific_meal=None, avoid_dishes=None):
+            return self.generate_single_day_menu(
+                adults=adults, children=children, recipes=recipes, preferences=preferences,
+                day_name=day_name, menu_type=menu_type, specific_meal=specific_meal,
+                historical_ratings=historical_ratings, meals=meals, day_focus=day_focus,
+                avoid_dishes=avoid_dishes, use_cache=use_cache, recommended=recommended
+            )
+        
+        menu = {f'menu_{menu_type}': {'dias': {}} for menu_type in menu_types}
+        raw_responses = []
+        errors = []
+        
+        with ThreadPoolExecutor(max_workers=max(1, workers)) as pool:
+            futures = {}
+            for menu_type in menu_types:
+                for day_name, day_meals, day_focus in plan:
+                    meals = [meal for meal in MEALS_BY_MENU_TYPE[menu_type] if meal in day_meals]
+                    if meals:
+                        futures[pool.submit(generate_day, day_name, menu_type, meals, day_focus)] = (menu_type, day_name, meals, day_focus)
+            
+            pending = futures
+            for attempt in range(2):
+                retry = {}
+                for future in as_completed(pending):
+                    menu_type, day_name, meals, day_focus = pending[future]
+                    result = future.result()
+                    day_menu = result.get('day_menu') if result['success'] else None
+                    if not isinstance(day_menu, dict) or not any(meal in day_menu for meal in meals):
+                        if attempt == 0:
+                            retry[pool.submit(generate_day, day_name, menu_type, meals, day_focus)] = pending[future]
+                        else:
+                            errors.append(f"{day_name} ({menu_type}): {result.get('error') or 'respuesta sin comidas'}")
+                        continue
+                    
+                    day_menu = {meal: day_menu[meal] for meal in meals if meal in day_menu}
+                    menu[f'menu_{menu_type}']['dias'][day_name] = day_menu
+                    raw_responses.append(f"### {menu_type} / {day_name}\n{result.get('raw_response', '')}")
+                    if on_day:
+                        try:
+                            on_day(menu_type, day_name, day_menu)
+                        except Exception as e:
+                            print(f"[MenuGenerator] on_day callback error: {e}")
+                if not retry:
+                    break
+                print(f"[MenuGenerator] Reintentando {len(retry)} días fallidos")
+                pending = retry
+            
+            if errors:
+                return {
+                    'success': False,
+                    'error': 'Error generando algunos días: ' + '; '.join(errors),
+                    'menu': None
+                }
+            
+            # Cross-day diversity check: regenerate meals that repeat an earlier day's dish
+            repeats = {}
+            for menu_type in menu_types:
+                days = menu[f'menu_{menu_type}']['dias']
+                seen = {}
+                duplicates = []
+                for day_name in WEEK_DAYS:
+                    for meal, dish in days.get(day_name, {}).items():
+                        name = dish.get('nombre') if isinstance(dish, dict) else None
+                        if not isinstance(name, str) or not name.strip():
+                            continue
+                        if normalize_name(name) in seen:
+                            duplicates.append((menu_type, day_name, meal))
+                        else:
+                            seen[normalize_name(name)] = name
+                for duplicate in duplicates:
+                    repeats[duplicate] = list(seen.values())
+            
+            if repeats:
+                print(f"[MenuGenerator] {len(repeats)} platos repetidos, regenerando")
+                focus = {day_name: day_focus for day_name, _, day_focus in plan}
+                futures = {
+                    pool.submit(generate_day, day_name, menu_type, [meal], focus.get(day_name), meal, avoid): (menu_type, day_name, meal)
+                    for (menu_type, day_name, meal), avoid in repeats.items()
+                }
+                for future in as_completed(futures):
+                    menu_type, day_name, meal = futures[future]
+                    result = future.result()
+                    replacement = (result.get('day_menu') or {}).get(meal) if result['success'] else None
+                    if isinstance(replacement, dict):
+                        menu[f'menu_{menu_type}']['dias'][day_name][meal] = replacement
+                        raw_responses.append(f"### {menu_type} / {day_name} / {meal}\n{result.get('raw_response', '')}")
+        
+        # Keep the usual day order and build the shopping lists from the merged days
+        for menu_type in menu_types:
+            section = menu[f'menu_{menu_type}']
+            section['dias'] = {day: section['dias'][day] for day in WEEK_DAYS if day in section['dias']}
+            ingredients = {}
+            for day_menu in section['dias'].values():
+                for dish in day_menu.values():
+                    for ingredient in (dish.get('ingredientes') or []) if isinstance(dish, dict) else []:
+                        if isinstance(ingredient, dict):
+                            ingredient = ingredient.get('nombre', '')
+                        if isinstance(ingredient, str) and ingredient.strip():
+                            ingredients.setdefault(ingredient.strip().lower(), ingredient.strip())
+            is_kids = menu_type == 'ninos'
+            section['lista_compras'] = self._generate_shopping_list_from_ingredients(
+                list(ingredients.values()), len(children if is_kids else adults), is_kids=is_kids)
+        
+        return {
+            'success': True,
+            'menu': menu,
+            'raw_response': '\n\n'.join(raw_responses),
+            'generated_at': datetime.now().isoformat()
+        }
+    
+    def _plan_week(self, preferences: Dict, day_settings: Dict) -> List[tuple]:
+        """(day_name, meals, day_focus) for every day to generate, honouring the menu preferences"""
+        excluded = {normalize_name(day) for day in preferences.get('excluded_days', [])}
+        if not preferences.get('include_weekend', True):
+            excluded.update(('sabado', 'domingo'))
+        
+        meals = ['merienda']
+        for meal, flag in (('desayuno', 'include_breakfast'), ('comida', 'include_lunch'), ('cena', 'include_dinner')):
+            if preferences.get(flag, True):
+                meals.append(meal)
+        
+        settings = {normalize_name(day): config for day, config in day_settings.items()}
+        plan = []
+        for index, day_name in enumerate(WEEK_DAYS):
+            config = settings.get(day_name) or {}
+            if day_name in excluded or config.get('no_cooking'):
+                continue
+            day_meals = [meal for meal in meals if not config.get('meals') or meal in config['meals']]
+            plan.append((day_name, day_meals, DAY_FOCUS[index]))
+        return plan
+    
     def generate_single_day_menu(self,
                                 adults: List[Dict],
                                 children: List[Dict],
@@ -175,7 +456,12 @@ class MenuGenerator:
                                 day_name: str = 'lunes',
                                 menu_type: str = 'adultos',
                                 specific_meal: Optional[str] = None,
-                                historical_ratings: Optional[List[Dict]] = None) -> Dict:
+                                historical_ratings: Optional[List[Dict]] = None,
+                                meals: Optional[List[str]] = None,
+                                day_focus: Optional[str] = None,
+                                avoid_dishes: Optional[List[str]] = None,
+                                use_cache: bool = True,
+                                recommended: Optional[List[str]] = None) -> Dict:
         """
         Generate menu for a single day (adults or children only)
         
@@ -188,27 +474,32 @@ class MenuGenerator:
             menu_type: 'adultos' or 'ninos'
             specific_meal: Optional specific meal to generate (desayuno, comida, merienda, cena)
             historical_ratings: Optional historical ratings for learning
+            meals: Optional meals to generate (defaults to every meal of menu_type)
+            day_focus: Optional main ingredient to build the day around
+            avoid_dishes: Optional dish names already planned for other days
+            use_cache: False to skip cached results ("give me something different")
+            recommended: Optional recipe titles ranked with ratings and recent menus
         
         Returns:
             Dictionary with day menu
         """
-        # Build prompt for single day
-        prompt = self._build_single_day_prompt(adults, children, recipes, preferences, day_name, menu_type, specific_meal, historical_ratings)
+        # Build prompt for single day (the family context is shared with the weekly prompt)
+        family_context = self._build_family_context(adults, children, recipes)
+        prompt = self._build_single_day_prompt(adults, children, recipes, preferences, day_name, menu_type, specific_meal,
+                                               historical_ratings, meals, day_focus, avoid_dishes, recommended)
         
         try:
             print(f"[MenuGenerator] Generating single day menu for {day_name} ({menu_type})...")
             
-            message = self.client.messages.create(
-                model="claude-sonnet-4-20250514",
-                max_tokens=8000,
-                temperature=0.7,
-                messages=[
-                    {
-                        "role": "user",
-                        "content": prompt
-                    }
-                ]
-            )
+            request = self._build_request(family_context, prompt, max_tokens=8000)
+            
+            cached = self._cached_result(request, use_cache)
+            if cached:
+                print(f"[MenuGenerator] Cache hit for {day_name} ({menu_type})")
+                return cached
+            
+            message = self.client.messages.create(**request)
+            self._log_usage(message)
             
             response_text = message.content[0].text
             print(f"[MenuGenerator] Response received, length: {len(response_text)}")
@@ -216,11 +507,14 @@ class MenuGenerator:
             # Parse response
             day_menu = self._parse_single_day_response(response_text, menu_type)
             
-            return {
+            result = {
                 'success': True,
                 'day_menu': day_menu,
                 'raw_response': response_text
             }
+            if day_menu:
+                self._cache_result(request, result)
+            return result
             
         except Exception as e:
             error_msg = f"Error generando menú: {str(e)}"
@@ -241,7 +535,11 @@ class MenuGenerator:
                                 day_name: str,
                                 menu_type: str,
                                 specific_meal: Optional[str] = None,
-                                historical_ratings: Optional[List[Dict]] = None) -> str:
+                                historical_ratings: Optional[List[Dict]] = None,
+                                meals: Optional[List[str]] = None,
+                                day_focus: Optional[str] = None,
+                                avoid_dishes: Optional[List[str]] = None,
+                                recommended: Optional[List[str]] = None) -> str:
         """Build prompt for single day menu generation"""
         
         if specific_meal:
@@ -260,30 +558,10 @@ class MenuGenerator:
 
 """
         
-        # Add family profiles (simplified) - only if not generating specific meal
-        if not specific_meal:
-            if menu_type == 'adultos' and adults:
-                prompt += "**PERFILES DE ADULTOS:**\n\n"
-                for adult in adults:
-                    prompt += f"- {adult.get('nombre', 'Sin nombre')}: "
-                    if adult.get('alergias'):
-                        prompt += f"ALERGIAS: {adult['alergias']}. "
-                    if adult.get('ingredientes_favoritos'):
-                        prompt += f"Le gusta: {adult['ingredientes_favoritos']}. "
-                    if adult.get('ingredientes_no_gustan'):
-                        prompt += f"No le gusta: {adult['ingredientes_no_gustan']}. "
-                    prompt += "\n"
-            elif menu_type == 'ninos' and children:
-                prompt += "**PERFILES DE NIÑOS:**\n\n"
-                for child in children:
-                    prompt += f"- {child.get('nombre', 'Sin nombre')}: "
-                    if child.get('alergias'):
-                        prompt += f"ALERGIAS: {child['alergias']}. "
-                    if child.get('ingredientes_favoritos'):
-                        prompt += f"Le encanta: {child['ingredientes_favoritos']}. "
-                    if child.get('ingredientes_rechaza'):
-                        prompt += f"RECHAZA: {child['ingredientes_rechaza']}. "
-                    prompt += "\n"
+        # Family profiles and the recipe library come from the cached system prefix
+        # (_build_family_context), so they are not repeated here
+        
+        prompt += self._recommended_section(recommended)
         
         # Add historical ratings - only if not generating specific meal
         if not specific_meal and historical_ratings:
@@ -321,6 +599,15 @@ class MenuGenerator:
                                     prompt += f"  • NO: {meal_name}\n"
                 prompt += "\n"
         
+        # Context shared by the days of a parallel weekly generation
+        if day_focus:
+            prompt += f"\n**🎯 INGREDIENTE PRINCIPAL DEL DÍA:** {day_focus} (úsalo en la comida o la cena)\n"
+        if avoid_dishes:
+            prompt += "\n**🔁 YA ESTÁN EN EL MENÚ DE LA SEMANA (no los repitas):**\n"
+            for dish in avoid_dishes:
+                prompt += f"  • {dish}\n"
+            prompt += "\n"
+        
         # Add meal types
         if specific_meal:
             prompt += f"""**GENERA SOLO esta comida:**\n
@@ -354,17 +641,10 @@ class MenuGenerator:
 **GENERA LA COMIDA AHORA:**
 """
         else:
-            if menu_type == 'adultos':
-                prompt += "**GENERA estas comidas para este día:**\n"
-                prompt += "- desayuno\n"
-                prompt += "- comida\n"
-                prompt += "- cena\n\n"
-            else:
-                prompt += "**GENERA estas comidas para este día:**\n"
-                prompt += "- desayuno\n"
-                prompt += "- comida\n"
-                prompt += "- merienda\n"
-                prompt += "- cena\n\n"
+            prompt += "**GENERA estas comidas para este día:**\n"
+            for meal in meals or MEALS_BY_MENU_TYPE.get(menu_type, MEALS_BY_MENU_TYPE['ninos']):
+                prompt += f"- {meal}\n"
+            prompt += "\n"
             
             prompt += """**FORMATO JSON (solo el día solicitado):**
 
@@ -402,55 +682,24 @@ class MenuGenerator:
     
     def _parse_single_day_response(self, response: str, menu_type: str) -> Dict:
         """Parse single day menu response"""
-        import re
-        
         try:
-            # Try to find JSON in response
-            json_match = re.search(r'```json\s*(.*?)\s*```', response, re.DOTALL)
-            if json_match:
-                json_str = json_match.group(1).strip()
-            else:
-                json_match = re.search(r'```\s*(.*?)\s*```', response, re.DOTALL)
-                if json_match:
-                    json_str = json_match.group(1).strip()
-                else:
-                    # Try to find JSON object
-                    brace_count = 0
-                    start_pos = -1
-                    for i, char in enumerate(response):
-                        if char == '{':
-                            if brace_count == 0:
-                                start_pos = i
-                            brace_count += 1
-                        elif char == '}':
-                            brace_count -= 1
-                            if brace_count == 0 and start_pos != -1:
-                                json_str = response[start_pos:i+1]
-                                break
-                    else:
-                        json_str = response
-            
-            # Clean JSON
-            json_str = re.sub(r'//.*?$', '', json_str, flags=re.MULTILINE)
-            json_str = re.sub(r',\s*}', '}', json_str)
-            json_str = re.sub(r',\s*]', ']', json_str)
-            
-            day_menu = json.loads(json_str)
-            return day_menu
-            
-        except Exception as e:
+            day_menu = loads_tolerant(response)
+        except json.JSONDecodeError as e:
             print(f"[MenuGenerator] Error parsing single day response: {e}")
             return {}
+        return day_menu if isinstance(day_menu, dict) else {}
     
-    def _build_menu_prompt(self, 
-                          adults: List[Dict], 
-                          children: List[Dict],
-                          recipes: Optional[List[Dict]],
-                          preferences: Optional[Dict],
-                          day_settings: Optional[Dict] = None,
-                          highly_rated_menus: Optional[List[Dict]] = None,
-                          historical_ratings: Optional[List[Dict]] = None) -> str:
-        """Build the enhanced prompt for Claude with nutrition and day settings"""
+    def _build_family_context(self,
+                              adults: List[Dict],
+                              children: List[Dict],
+                              recipes: Optional[List[Dict]]) -> str:
+        """
+        Stable prompt prefix shared by every menu request for this family: persona,
+        family profiles and recipe library. It is sent as a cached system block, so it
+        must not depend on the week, day, preferences or ratings: callers pass a
+        profile-only recipe selection, listed here by id, and give the rating-ranked
+        picks to the per-request prompt (recommended).
+        """
         
         prompt = """Eres un nutricionista y chef experto con especialización en:
 - Planificación de menús familiares equilibrados
@@ -458,7 +707,7 @@ class MenuGenerator:
 - Cocina mediterránea y española
 - Adaptación de recetas para niños selectivos
 
-Tu tarea es crear un menú semanal COMPLETO Y DETALLADO para una familia en Barcelona, España.
+Planificas las comidas de una familia en Barcelona, España.
 
 ═══════════════════════════════════════════════════════════════════
 
@@ -543,6 +792,89 @@ Tu tarea es crear un menú semanal COMPLETO Y DETALLADO para una familia en Barc
                 
                 prompt += "\n"
         
+        # Add available recipes with MORE DETAIL, as many as fit in the context budget
+        # (callers pass them best first, see RecipeIndex.select); the kept ones are
+        # listed by id so the prefix does not change when only their ranking does
+        if recipes:
+            entries = []
+            for recipe in recipes:
+                entry = f"• **{recipe.get('title', 'Sin título')}**\n"
+                if recipe.get('url'):
+                    entry += f"  URL: {recipe['url']}\n"
+                if recipe.get('cuisine_type'):
+                    entry += f"  Tipo cocina: {recipe['cuisine_type']}\n"
+                if recipe.get('prep_time'):
+                    entry += f"  Tiempo: {recipe['prep_time']} min\n"
+                if recipe.get('ingredients'):
+                    ings = recipe['ingredients'][:5]  # First 5 ingredients
+                    entry += f"  Ingredientes clave: {', '.join(ings)}\n"
+                entries.append(entry + "\n")
+            
+            kept = fit_to_budget(entries, self.context_token_budget - estimate_tokens(prompt))
+            entries = [entry for _, entry in sorted(zip([recipe.get('id') or 0 for recipe in recipes], kept),
+                                                    key=lambda pair: pair[0])]
+            if entries:
+                prompt += "\n**📖 BASE DE DATOS DE RECETAS DISPONIBLES:**\n"
+                prompt += "(Puedes inspirarte en estas recetas o adaptarlas para el menú)\n\n"
+                prompt += ''.join(entries)
+        
+        return prompt
+    
+    @staticmethod
+    def _recommended_section(recommended: Optional[List[str]]) -> str:
+        """Per-request list of the recipe titles ranked with ratings and recent menus, best first"""
+        if not recommended:
+            return ""
+        section = "\n**⭐ RECETAS RECOMENDADAS AHORA** (según valoraciones y menús recientes, de más a menos):\n"
+        section += ''.join(f"  • {title}\n" for title in recommended)
+        return section + "\n"
+    
+    def _rated_day_entries(self, ratings: List[Dict], avoid: bool = False) -> List[str]:
+        """One prompt entry per rated day: the day and rating followed by its dish names"""
+        entries = []
+        for rating in ratings:
+            menu_data = rating.get('menu_data', {})
+            day_name = rating.get('day_name', '')
+            menu_type = rating.get('menu_type', '')
+            rating_val = rating.get('rating', 0)
+            
+            if not (menu_data and day_name and menu_type):
+                continue
+            day_data = (menu_data.get(f'menu_{menu_type}') or {}).get('dias', {}).get(day_name, {})
+            if not day_data:
+                continue
+            
+            entry = f"- {day_name.capitalize()} ({menu_type}): {rating_val}⭐{' - EVITAR:' if avoid else ''}\n"
+            # Add meal names
+            for meal_type in ['desayuno', 'comida', 'merienda', 'cena']:
+                if meal_type in day_data:
+                    meal = day_data[meal_type]
+                    meal_name = meal.get('nombre', '') if isinstance(meal, dict) else meal
+                    if isinstance(meal_name, dict):
+                        meal_name = meal_name.get('name', '')
+                    if meal_name:
+                        entry += f"  • NO repetir: {meal_name}\n" if avoid else f"  • {meal_type}: {meal_name}\n"
+            entries.append(entry)
+        return entries
+    
+    def _build_menu_prompt(self, 
+                          adults: List[Dict], 
+                          children: List[Dict],
+                          recipes: Optional[List[Dict]],
+                          preferences: Optional[Dict],
+                          day_settings: Optional[Dict] = None,
+                          highly_rated_menus: Optional[List[Dict]] = None,
+                          historical_ratings: Optional[List[Dict]] = None,
+                          recommended: Optional[List[str]] = None) -> str:
+        """
+        Build the volatile part of the weekly prompt (task, day settings, preferences,
+        ratings and output format); the family and recipes go in _build_family_context
+        """
+        
+        prompt = """Tu tarea es crear un menú semanal COMPLETO Y DETALLADO para esta familia.
+
+"""
+        
         # Add day settings if provided
         if day_settings:
             prompt += "**📅 CONFIGURACIÓN DE DÍAS:**\n\n"
@@ -561,23 +893,6 @@ Tu tarea es crear un menú semanal COMPLETO Y DETALLADO para una familia en Barc
                     prompt += "  - Todas las comidas (desayuno, comida, merienda, cena)\n"
             prompt += "\n"
         
-        # Add available recipes with MORE DETAIL
-        if recipes:
-            prompt += "\n**📖 BASE DE DATOS DE RECETAS DISPONIBLES:**\n"
-            prompt += "(Puedes inspirarte en estas recetas o adaptarlas para el menú)\n\n"
-            for recipe in recipes[:20]:  # Increased to 20 recipes
-                prompt += f"• **{recipe.get('title', 'Sin título')}**\n"
-                if recipe.get('url'):
-                    prompt += f"  URL: {recipe['url']}\n"
-                if recipe.get('cuisine_type'):
-                    prompt += f"  Tipo cocina: {recipe['cuisine_type']}\n"
-                if recipe.get('prep_time'):
-                    prompt += f"  Tiempo: {recipe['prep_time']} min\n"
-                if recipe.get('ingredients'):
-                    ings = recipe['ingredients'][:5]  # First 5 ingredients
-                    prompt += f"  Ingredientes clave: {', '.join(ings)}\n"
-                prompt += "\n"
-        
         # Add menu preferences (days and meals)
         include_weekend = preferences.get('include_weekend', True) if preferences else True
         include_breakfast = preferences.get('include_breakfast', True) if preferences else True
@@ -626,70 +941,35 @@ Tu tarea es crear un menú semanal COMPLETO Y DETALLADO para una familia en Barc
                     prompt += f"- {key}: {value}\n"
                 prompt += "\n"
         
-        # Add historical ratings for learning
+        prompt += self._recommended_section(recommended)
+        
+        # Add historical ratings for learning, trimmed to the history budget
         if historical_ratings:
-            prompt += "**⭐ HISTORIAL DE CALIFICACIONES (APRENDE DE ESTO):**\n\n"
-            prompt += "La familia ha calificado estos menús anteriores. Usa esta información para entender sus gustos:\n\n"
-            
             # Group by rating
             high_ratings = [r for r in historical_ratings if r.get('rating', 0) >= 4]
             low_ratings = [r for r in historical_ratings if r.get('rating', 0) <= 2]
             
-            if high_ratings:
-                prompt += "**✅ MENÚS QUE LES GUSTARON (4-5 estrellas):**\n"
-                for rating in high_ratings[:10]:  # Top 10
-                    menu_data = rating.get('menu_data', {})
-                    day_name = rating.get('day_name', '')
-                    menu_type = rating.get('menu_type', '')
-                    rating_val = rating.get('rating', 0)
-                    
-                    if menu_data and day_name and menu_type:
-                        menu_key = f'menu_{menu_type}'
-                        if menu_key in menu_data and 'dias' in menu_data[menu_key]:
-                            day_data = menu_data[menu_key]['dias'].get(day_name, {})
-                            if day_data:
-                                prompt += f"- {day_name.capitalize()} ({menu_type}): {rating_val}⭐\n"
-                                # Add meal names
-                                for meal_type in ['desayuno', 'comida', 'merienda', 'cena']:
-                                    if meal_type in day_data:
-                                        meal = day_data[meal_type]
-                                        meal_name = meal.get('nombre', '')
-                                        if isinstance(meal_name, dict):
-                                            meal_name = meal_name.get('name', '')
-                                        if meal_name:
-                                            prompt += f"  • {meal_type}: {meal_name}\n"
-                prompt += "\n"
+            liked = fit_to_budget(self._rated_day_entries(high_ratings[:10]), self.history_token_budget // 2)  # Top 10
+            disliked = fit_to_budget(self._rated_day_entries(low_ratings[:5], avoid=True),  # Top 5 worst
+                                     self.history_token_budget - estimate_tokens(''.join(liked)))
             
-            if low_ratings:
-                prompt += "**❌ MENÚS QUE NO LES GUSTARON (1-2 estrellas):**\n"
-                prompt += "EVITA generar menús similares a estos:\n"
-                for rating in low_ratings[:5]:  # Top 5 worst
-                    menu_data = rating.get('menu_data', {})
-                    day_name = rating.get('day_name', '')
-                    menu_type = rating.get('menu_type', '')
-                    rating_val = rating.get('rating', 0)
-                    
-                    if menu_data and day_name and menu_type:
-                        menu_key = f'menu_{menu_type}'
-                        if menu_key in menu_data and 'dias' in menu_data[menu_key]:
-                            day_data = menu_data[menu_key]['dias'].get(day_name, {})
-                            if day_data:
-                                prompt += f"- {day_name.capitalize()} ({menu_type}): {rating_val}⭐ - EVITAR:\n"
-                                # Add meal names to avoid
-                                for meal_type in ['desayuno', 'comida', 'merienda', 'cena']:
-                                    if meal_type in day_data:
-                                        meal = day_data[meal_type]
-                                        meal_name = meal.get('nombre', '')
-                                        if isinstance(meal_name, dict):
-                                            meal_name = meal_name.get('name', '')
-                                        if meal_name:
-                                            prompt += f"  • NO repetir: {meal_name}\n"
-                prompt += "\n"
-            
-            prompt += "**IMPORTANTE:**\n"
-            prompt += "- Repite estilos y tipos de comida que recibieron 4-5 estrellas\n"
-            prompt += "- Evita completamente los platos que recibieron 1-2 estrellas\n"
-            prompt += "- Aprende de los ingredientes y combinaciones que funcionaron bien\n\n"
+            if liked or disliked:
+                prompt += "**⭐ HISTORIAL DE CALIFICACIONES (APRENDE DE ESTO):**\n\n"
+                prompt += "La familia ha calificado estos menús anteriores. Usa esta información para entender sus gustos:\n\n"
+                
+                if liked:
+                    prompt += "**✅ MENÚS QUE LES GUSTARON (4-5 estrellas):**\n"
+                    prompt += ''.join(liked) + "\n"
+                
+                if disliked:
+                    prompt += "**❌ MENÚS QUE NO LES GUSTARON (1-2 estrellas):**\n"
+                    prompt += "EVITA generar menús similares a estos:\n"
+                    prompt += ''.join(disliked) + "\n"
+                
+                prompt += "**IMPORTANTE:**\n"
+                prompt += "- Repite estilos y tipos de comida que recibieron 4-5 estrellas\n"
+                prompt += "- Evita completamente los platos que recibieron 1-2 estrellas\n"
+                prompt += "- Aprende de los ingredientes y combinaciones que funcionaron bien\n\n"
         
         # Enhanced instructions
         prompt += """
@@ -1050,153 +1330,44 @@ Devuelve SOLO JSON válido (sin markdown, sin ```json```), con esta estructura E
         return menu_data
     
     def _parse_menu_response(self, response: str, adults: List[Dict] = None, children: List[Dict] = None) -> Dict:
-        """Parse Claude's response to extract menu data"""
-        
-        # Try to find JSON in the response
+        """
+        Parse Claude's response to extract menu data. TolerantJSONParser copes with
+        code fences, comments, trailing commas, unescaped quotes and truncated output
+        in one pass; anything without a JSON object is returned as text. A menu
+        recovered from truncated output is marked with 'truncated': True.
+        """
         try:
-            # First, try to find JSON between ```json and ```
-            json_match = re.search(r'```json\s*(.*?)\s*```', response, re.DOTALL)
-            
-            if json_match:
-                json_str = json_match.group(1).strip()
-                print(f"[MenuGenerator] Found JSON in code block, length: {len(json_str)}")
-            else:
-                # Try to find JSON between ``` and ``` (without json label)
-                json_match = re.search(r'```\s*(.*?)\s*```', response, re.DOTALL)
-                if json_match:
-                    json_str = json_match.group(1).strip()
-                    # Check if it looks like JSON (starts with { or [)
-                    if json_str.startswith('{') or json_str.startswith('['):
-                        print(f"[MenuGenerator] Found JSON in code block (no label), length: {len(json_str)}")
-                    else:
-                        json_str = None
-                else:
-                    json_str = None
-                
-                # If still no JSON found, try to find any {...} structure
-                # Use a more robust approach to find the complete JSON object
-                if not json_str:
-                    # Try to find the outermost JSON object by counting braces
-                    brace_count = 0
-                    start_pos = -1
-                    for i, char in enumerate(response):
-                        if char == '{':
-                            if brace_count == 0:
-                                start_pos = i
-                            brace_count += 1
-                        elif char == '}':
-                            brace_count -= 1
-                            if brace_count == 0 and start_pos != -1:
-                                json_str = response[start_pos:i+1]
-                                print(f"[MenuGenerator] Found JSON structure by brace counting, length: {len(json_str)}")
-                                break
-                    
-                    # Fallback to regex if brace counting didn't work
-                    if not json_str:
-                        json_match = re.search(r'\{[^{}]*(?:\{[^{}]*\}[^{}]*)*\}', response, re.DOTALL)
-                        if json_match:
-                            json_str = json_match.group(0)
-                            print(f"[MenuGenerator] Found JSON structure via regex, length: {len(json_str)}")
+            parser = TolerantJSONParser()
+            menu_data = parser.parse(response)
             
-            if json_str:
-                # Clean up the JSON string
-                # Remove comments (// and /* */)
-                json_str = re.sub(r'//.*?$', '', json_str, flags=re.MULTILINE)  # Single-line comments
-                json_str = re.sub(r'/\*.*?\*/', '', json_str, flags=re.DOTALL)  # Multi-line comments
-                
-                # Remove trailing commas before closing braces/brackets
-                json_str = re.sub(r',\s*}', '}', json_str)
-                json_str = re.sub(r',\s*]', ']', json_str)
-                
-                # Try to fix unescaped quotes in string values
-                # This is tricky - we need to be careful not to break valid JSON
-                # Pattern: find string values that might have unescaped quotes
-                # We'll use a state machine approach
-                try:
-                    # First attempt: parse as-is
-                    menu_data = json.loads(json_str)
-                    # Normalize shopping lists after parsing
-                    menu_data = self._normalize_shopping_lists(menu_data, len(adults) if adults else 0, len(children) if children else 0)
-                except json.JSONDecodeError as e:
-                    print(f"[MenuGenerator] First parse attempt failed: {e}")
-                    print(f"[MenuGenerator] Error at position {e.pos}, trying to fix...")
-                    
-                    # Try to fix common issues around the error position
-                    error_pos = e.pos
-                    if error_pos < len(json_str):
-                        # Get context around error
-                        start = max(0, error_pos - 100)
-                        end = min(len(json_str), error_pos + 100)
-                        context = json_str[start:end]
-                        print(f"[MenuGenerator] Context around error: {context}")
-                        
-                        # Try to fix unescaped quotes - look for patterns like: "text"more text"
-                        # This is a heuristic fix
-                        fixed_json = json_str
-                        
-                        # Find string values and check for unescaped quotes
-                        # Pattern: "key": "value" where value might contain unescaped quotes
-                        # We'll try to escape quotes that appear to be inside string values
-                        # This is risky but worth trying
-                        
-                        # More conservative approach: try parsing with json5-like fixes
-                        # Remove any obvious syntax errors
-                        fixed_json = re.sub(r',(\s*[}\]])', r'\1', fixed_json)  # Remove trailing commas
-                        fixed_json = re.sub(r'//.*?$', '', fixed_json, flags=re.MULTILINE)  # Remove comments
-                        fixed_json = re.sub(r'/\*.*?\*/', '', fixed_json, flags=re.DOTALL)  # Remove block comments
-                        
-                        # Try to repair unescaped quotes using state machine
-                        try:
-                            repaired_json = repair_json_string(fixed_json)
-                            menu_data = json.loads(repaired_json)
-                            print(f"[MenuGenerator] Successfully parsed after repair")
-                            print(f"[MenuGenerator] Menu keys: {list(menu_data.keys())}")
-                            # Normalize shopping lists after parsing
-                            menu_data = self._normalize_shopping_lists(menu_data, len(adults) if 'adults' in locals() else 0, len(children) if 'children' in locals() else 0)
-                            return menu_data
-                        except json.JSONDecodeError as e2:
-                            print(f"[MenuGenerator] Repair attempt also failed: {e2}")
-                            print(f"[MenuGenerator] Error at position {e2.pos}")
-                            # Return as text format so frontend can try to fix it
-                            return {
-                                'formato': 'texto',
-                                'contenido': response
-                            }
-                    else:
-                        # Return as text format
-                        return {
-                            'formato': 'texto',
-                            'contenido': response
-                        }
-                
-                # Remove any whitespace issues
-                json_str = json_str.strip()
-                
-                print(f"[MenuGenerator] Successfully parsed JSON menu")
-                print(f"[MenuGenerator] Menu keys: {list(menu_data.keys())}")
-                
-                # VALIDATION: Check if this is a single recipe instead of weekly menu
-                if self._is_single_recipe(menu_data):
-                    print(f"[MenuGenerator] WARNING: Claude returned single recipe instead of weekly menu")
-                    print(f"[MenuGenerator] Attempting to convert to weekly menu structure...")
-                    menu_data = self._convert_recipe_to_weekly_menu(menu_data, adults, children)
-                    print(f"[MenuGenerator] Converted to weekly menu with keys: {list(menu_data.keys())}")
-                
-                # Normalize shopping lists after parsing
-                menu_data = self._normalize_shopping_lists(menu_data, len(adults) if adults else 0, len(children) if children else 0)
-                return menu_data
-            else:
+            if not isinstance(menu_data, dict) or not menu_data:
                 # If no JSON found, return structured text
-                print(f"[MenuGenerator] No JSON found in response, returning as text")
+                print(f"[MenuGenerator] No JSON menu found in response, returning as text")
                 return {
                     'formato': 'texto',
                     'contenido': response
                 }
             
+            if parser.truncated:
+                print("[MenuGenerator] WARNING: response was truncated, keeping the part that arrived")
+            print(f"[MenuGenerator] Successfully parsed JSON menu")
+            print(f"[MenuGenerator] Menu keys: {list(menu_data.keys())}")
+            
+            # VALIDATION: Check if this is a single recipe instead of weekly menu
+            if self._is_single_recipe(menu_data):
+                print(f"[MenuGenerator] WARNING: Claude returned single recipe instead of weekly menu")
+                print(f"[MenuGenerator] Attempting to convert to weekly menu structure...")
+                menu_data = self._convert_recipe_to_weekly_menu(menu_data, adults, children)
+                print(f"[MenuGenerator] Converted to weekly menu with keys: {list(menu_data.keys())}")
+            
+            # Normalize shopping lists after parsing
+            menu_data = self._normalize_shopping_lists(menu_data, len(adults) if adults else 0, len(children) if children else 0)
+            if parser.truncated:
+                menu_data['truncated'] = True
+            return menu_data
+            
         except json.JSONDecodeError as e:
-            print(f"[MenuGenerator] JSON decode error: {str(e)}")
-            print(f"[MenuGenerator] Attempted to parse: {json_str[:200] if json_str else 'None'}...")
-            # If JSON parsing fails, return as text
+            print(f"[MenuGenerator] No JSON found in response, returning as text: {e}")
             return {
                 'formato': 'texto',
                 'contenido': response
@@ -1217,7 +1388,7 @@ Devuelve SOLO JSON válido (sin markdown, sin ```json```), con esta estructura E
         prompt = f"""Como nutricionista experto, sugiere mejoras para el plato "{meal_name}" 
 considerando los perfiles de esta familia:
 
-{json.dumps(family_profiles, indent=2, ensure_ascii=False)}
+{json.dumps(family_profiles, indent=2, ensure_ascii=False, default=to_json)}
 
 Proporciona:
 1. Sustituciones de ingredientes para hacerlo más saludable
@@ -1401,5 +1572,3 @@ Sé breve y práctico."""
                 "por_categoria": {k: len(v) for k, v in categorized.items() if v}
             }
         }
-
-import re
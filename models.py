@@ -0,0 +1,159 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Row models for Family Kitchen Menu System
+Compact __slots__ dataclasses for the adults, children and recipes tables
+"""
+from collections.abc import Mapping
+from dataclasses import dataclass, field, fields
+from functools import lru_cache
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+
+@lru_cache(maxsize=None)
+def _columns(cls) -> Tuple[str, ...]:
+    """Table columns of a model (every dataclass field except extra)"""
+    return tuple(f.name for f in fields(cls) if f.name != 'extra')
+
+
+class RowModel(Mapping):
+    """
+    Base for the slotted row models. Instances are mappings of the full row
+    (model['nombre'], model.get('edad'), iteration, items(), dict(model)) so
+    code written against the old row dicts keeps working, and to_json() gives
+    the plain dict for APIs without the internal columns. Columns the model
+    does not declare (added by later migrations or external scripts) are
+    kept in `extra` instead of being dropped.
+    """
+    
+    __slots__ = ()
+    
+    # Columns kept for the database's own use and left out of to_json()
+    internal_columns: Tuple[str, ...] = ()
+    
+    @classmethod
+    def from_row(cls, pairs: Iterable[Tuple[str, Any]]):
+        """Build a model from (column, value) pairs; usable as a Database row_factory"""
+        columns = _columns(cls)
+        values = {}
+        extra = {}
+        for key, value in pairs:
+            if key in columns:
+                values[key] = value
+            else:
+                extra[key] = value
+        return cls(**values, extra=extra)
+    
+    def to_json(self) -> Dict[str, Any]:
+        """Plain dict with every public column, ready for jsonify/json.dumps"""
+        data = {name: getattr(self, name) for name in _columns(type(self)) if name not in self.internal_columns}
+        if self.extra:
+            data.update(self.extra)
+        return data
+    
+    def __getitem__(self, key: str):
+        if key in _columns(type(self)):
+            return getattr(self, key)
+        return self.extra[key]
+    
+    def __setitem__(self, key: str, value):
+        if key in _columns(type(self)):
+            setattr(self, key, value)
+        else:
+            self.extra[key] = value
+    
+    def __contains__(self, key: str) -> bool:
+        return key in _columns(type(self)) or key in self.extra
+    
+    def __iter__(self):
+        yield from _columns(type(self))
+        yield from self.extra
+    
+    def __len__(self) -> int:
+        return len(_columns(type(self))) + len(self.extra)
+
+
+@dataclass(slots=True)
+class Adult(RowModel):
+    """Adult profile (adults table)"""
+    id: Optional[int] = None
+    nombre: Optional[str] = None
+    edad: Optional[int] = None
+    objetivo_alimentario: Optional[str] = None
+    estilo_alimentacion: Optional[str] = None
+    cocinas_favoritas: Optional[str] = None
+    nivel_picante: Optional[str] = None
+    ingredientes_favoritos: Optional[str] = None
+    ingredientes_no_gustan: Optional[str] = None
+    alergias: Optional[str] = None
+    intolerancias: Optional[str] = None
+    restricciones_religiosas: Optional[str] = None
+    flexibilidad_comer: Optional[str] = None
+    preocupacion_principal: Optional[str] = None
+    tiempo_max_cocinar: Optional[int] = None
+    nivel_cocina: Optional[str] = None
+    tipo_desayuno: Optional[str] = None
+    le_gustan_snacks: Optional[str] = None
+    plato_favorito: Optional[str] = None
+    plato_menos_favorito: Optional[str] = None
+    comentarios: Optional[str] = None
+    created_at: Any = None
+    extra: Dict[str, Any] = field(default_factory=dict, repr=False)
+
+
+@dataclass(slots=True)
+class Child(RowModel):
+    """Child profile (children table)"""
+    id: Optional[int] = None
+    nombre: Optional[str] = None
+    edad: Optional[int] = None
+    come_solo: Optional[str] = None
+    nivel_exigencia: Optional[str] = None
+    cocinas_gustan: Optional[str] = None
+    ingredientes_favoritos: Optional[str] = None
+    ingredientes_rechaza: Optional[str] = None
+    texturas_no_gustan: Optional[str] = None
+    alergias: Optional[str] = None
+    intolerancias: Optional[str] = None
+    verduras_aceptadas: Optional[str] = None
+    verduras_rechazadas: Optional[str] = None
+    nivel_picante: Optional[str] = None
+    desayuno_preferido: Optional[str] = None
+    snacks_favoritos: Optional[str] = None
+    acepta_comida_nueva: Optional[str] = None
+    plato_favorito: Optional[str] = None
+    plato_nunca_comeria: Optional[str] = None
+    comentarios_padres: Optional[str] = None
+    created_at: Any = None
+    extra: Dict[str, Any] = field(default_factory=dict, repr=False)
+
+
+@dataclass(slots=True)
+class Recipe(RowModel):
+    """Recipe (recipes table); ingredients and extracted_data are decoded JSON"""
+    id: Optional[int] = None
+    title: Optional[str] = None
+    url: Optional[str] = None
+    ingredients: List[Any] = field(default_factory=list)
+    instructions: Optional[str] = None
+    prep_time: Optional[int] = None
+    cook_time: Optional[int] = None
+    servings: Optional[int] = None
+    cuisine_type: Optional[str] = None
+    meal_type: Optional[str] = None
+    difficulty: Optional[str] = None
+    image_url: Optional[str] = None
+    extracted_data: Dict[str, Any] = field(default_factory=dict)
+    title_key: Optional[str] = None
+    created_at: Any = None
+    extra: Dict[str, Any] = field(default_factory=dict, repr=False)
+    
+    # Normalized title used for lookups (see database.normalize_title)
+    internal_columns = ('title_key',)
+
+
+def to_json(value):
+    """json.dumps default= hook: serialize row models nested in any structure"""
+    if isinstance(value, RowModel):
+        return value.to_json()
+    raise TypeError(f'Object of type {type(value).__name__} is not JSON serializable')
@@ -1,18 +1,252 @@
 import requests
-from bs4 import BeautifulSoup
+from requests.adapters import HTTPAdapter
+from lxml import html as lxml_html
 import trafilatura
+import os
 import re
 import json
-from typing import Dict, List, Optional
-from urllib.parse import urlparse
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import Dict, Iterator, List, Optional, Tuple
+from urllib.parse import parse_qsl, urlencode, urlparse, urlunparse
+from requests.structures import CaseInsensitiveDict
+
+from json_stream import iter_json_strings
+
+# Pinterest JSON scan: object nesting searched and images/videos kept per page
+PINTEREST_JSON_DEPTH = 5
+PINTEREST_MEDIA_LIMIT = 20
+IMAGE_HINTS = ('.jpg', '.jpeg', '.png', '.gif', '.webp', 'pinimg.com', 'image')
+VIDEO_FILES = ('.mp4', '.webm', '.mov', '.m3u8')
+VIDEO_HINTS = VIDEO_FILES + ('video', 'youtube.com', 'youtu.be', 'vimeo.com')
+
+# Answers worth retrying (rate limits, overloaded or restarting sites) and the longest wait
+TRANSIENT_HTTP_STATUS = frozenset({408, 425, 429, 500, 502, 503, 504})
+MAX_RETRY_DELAY = 60
+
+# Sites whose concurrency slot and next start time are remembered (least recently used are forgotten)
+MAX_TRACKED_HOSTS = 256
+
+# EXSLT regular expressions for class matching in XPath (re:test)
+XPATH_NS = {'re': 'http://exslt.org/regular-expressions'}
+
+# Query parameters that only track the visit and never change the page
+TRACKING_PARAMS = ('utm_', 'fbclid', 'gclid', 'mc_cid', 'mc_eid', 'igshid', 'ref', '_ga')
+
+
+def canonical_url(url: str) -> str:
+    """URL used as page cache key: lowercase scheme/host, no fragment, default port or tracking params"""
+    parts = urlparse(url.strip())
+    scheme = parts.scheme.lower() or 'https'
+    host = (parts.hostname or '').lower()
+    if parts.port and parts.port != {'http': 80, 'https': 443}.get(scheme):
+        host = f'{host}:{parts.port}'
+    query = sorted((key, value) for key, value in parse_qsl(parts.query, keep_blank_values=True)
+                   if not key.lower().startswith(TRACKING_PARAMS))
+    return urlunparse((scheme, host, parts.path or '/', parts.params, urlencode(query), ''))
+
+
+def is_pinterest(url: str) -> bool:
+    """Pinterest pin or pin.it short link (the recipe lives on the linked site)"""
+    return 'pin.it' in url or 'pinterest.com' in url
+
+
+def is_transient_error(error: Exception) -> bool:
+    """Fetch errors worth retrying: timeouts, connection errors and TRANSIENT_HTTP_STATUS answers"""
+    if isinstance(error, (requests.ConnectionError, requests.Timeout)):
+        return True
+    response = getattr(error, 'response', None)
+    return isinstance(error, requests.HTTPError) and response is not None \
+        and response.status_code in TRANSIENT_HTTP_STATUS
+
+
+def retry_delay(error: Exception, attempt: int, backoff: float) -> float:
+    """
+    Seconds to wait before retrying attempt + 1: backoff doubled per attempt,
+    or the site's Retry-After (in seconds) when it asks for longer, capped at
+    MAX_RETRY_DELAY.
+    """
+    delay = backoff * 2 ** (attempt - 1)
+    response = getattr(error, 'response', None)
+    retry_after = response.headers.get('Retry-After', '') if response is not None else ''
+    if retry_after.isdigit():
+        delay = max(delay, int(retry_after))
+    return min(delay, MAX_RETRY_DELAY)
+
+
+def read_body(response, limit: int) -> bytes:
+    """
+    Load the body of a streamed response, reading at most limit + 1 bytes;
+    a longer page is cut at limit (lxml parses what arrived). Responses
+    whose body is already loaded are returned as they are.
+    """
+    if getattr(response, '_content', None) is not False:
+        return response.content
+    body = bytearray()
+    for chunk in response.iter_content(64 * 1024):
+        body += chunk
+        if len(body) > limit:
+            break
+    response._content = bytes(body[:limit])
+    response.close()
+    return response._content
+
+
+def parse_html(content: bytes):
+    """
+    Parse a page once with lxml; the tree is shared by every extraction stage.
+    Valid UTF-8 is decoded as such (libxml2 would assume Latin-1 without a meta
+    charset); anything else is left to the page's own charset declaration.
+    An empty body (200/204 without content) gives an empty document, so it is
+    reported as a page without a recipe instead of raising ParserError.
+    """
+    if not content.strip():
+        return lxml_html.document_fromstring('<html></html>')
+    try:
+        content.decode('utf-8')
+        parser = lxml_html.HTMLParser(encoding='utf-8')
+    except UnicodeDecodeError:
+        parser = None
+    return lxml_html.document_fromstring(content, parser=parser)
+
+
+def text_of(element) -> str:
+    """Whitespace-trimmed text content of an element"""
+    return str(element.text_content()).strip()
+
+
+def first(tree, xpath: str):
+    """First result of an XPath query, or None"""
+    results = tree.xpath(xpath, namespaces=XPATH_NS)
+    return results[0] if results else None
+
 
 class RecipeExtractor:
-    """Extract recipe information from URLs"""
+    """
+    Extract recipe information from URLs.
+    
+    All requests go through one keep-alive requests.Session. Batch imports
+    (iter_extract_urls) fetch up to max_workers pages at once, but never more
+    than per_host at a time from the same site, and start requests to a site
+    at least host_delay seconds apart. Page bodies are read up to
+    max_page_bytes; longer pages are parsed from what arrived.
+    
+    With a page_cache (the Database http_cache table) fetched pages are kept
+    compressed by canonical URL: pages younger than PAGE_CACHE_TTL are served
+    from the cache, older ones are revalidated with If-None-Match /
+    If-Modified-Since. Pages cut at max_page_bytes are never cached.
+    offline=True never touches the network, so parsing improvements can be
+    re-run over every page fetched before.
+    """
     
-    def __init__(self):
+    def __init__(self, max_workers: Optional[int] = None, per_host: Optional[int] = None,
+                 host_delay: Optional[float] = None, page_cache=None, offline: bool = False):
         self.headers = {
             'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36'
         }
+        self.max_workers = int(os.getenv('RECIPE_FETCH_WORKERS', '8')) if max_workers is None else max_workers
+        self.per_host = int(os.getenv('RECIPE_FETCH_PER_HOST', '2')) if per_host is None else per_host
+        self.host_delay = float(os.getenv('RECIPE_FETCH_HOST_DELAY', '0.5')) if host_delay is None else host_delay
+        self.max_page_bytes = int(os.getenv('RECIPE_FETCH_MAX_BYTES', str(10 * 1024 * 1024)))
+        
+        self.session = requests.Session()
+        self.session.headers.update(self.headers)
+        adapter = HTTPAdapter(pool_connections=self.max_workers * 2, pool_maxsize=self.max_workers)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+        
+        self._hosts_lock = threading.Lock()
+        self._host_slots: 'OrderedDict[str, threading.BoundedSemaphore]' = OrderedDict()
+        self._host_next_start: Dict[str, float] = {}
+        
+        # Persistent page cache (see class docstring)
+        self.page_cache = page_cache
+        self.offline = offline
+        self.cache_ttl = float(os.getenv('PAGE_CACHE_TTL', '86400'))
+        self.cache_max_bytes = int(os.getenv('PAGE_CACHE_MAX_BYTES', str(200 * 1024 * 1024)))
+    
+    def _fetch(self, url: str, timeout: float) -> requests.Response:
+        """GET a page through the page cache (when configured) and the shared session"""
+        if self.page_cache is None:
+            if self.offline:
+                raise LookupError(f'Modo sin conexión sin caché de páginas: {url}')
+            return self._request(url, timeout)
+        
+        cache_key = hashlib.sha256(canonical_url(url).encode('utf-8')).hexdigest()
+        try:
+            cached = self.page_cache.get_cached_page(cache_key)
+        except Exception as e:
+            print(f"[RecipeExtractor] Page cache read error: {e}")
+            cached = None
+        
+        if cached and (self.offline or time.time() - cached['fetched_at'] < self.cache_ttl):
+            return self._cached_response(cached)
+        if self.offline:
+            raise LookupError(f'Página no disponible en la caché (modo sin conexión): {url}')
+        
+        validators = {}
+        if cached and cached.get('etag'):
+            validators['If-None-Match'] = cached['etag']
+        if cached and cached.get('last_modified'):
+            validators['If-Modified-Since'] = cached['last_modified']
+        response = self._request(url, timeout, validators)
+        
+        try:
+            if cached and response.status_code == 304:
+                self.page_cache.touch_cached_page(cache_key)
+                return self._cached_response(cached)
+            if response.status_code == 200 and len(response.content) < self.max_page_bytes:
+                self.page_cache.save_cached_page(cache_key, {
+                    'url': url,
+                    'final_url': response.url,
+                    'etag': response.headers.get('ETag'),
+                    'last_modified': response.headers.get('Last-Modified'),
+                    'content_type': response.headers.get('Content-Type'),
+                    'body': response.content
+                }, self.cache_max_bytes)
+        except Exception as e:
+            print(f"[RecipeExtractor] Page cache write error: {e}")
+        return response
+    
+    @staticmethod
+    def _cached_response(cached: Dict) -> requests.Response:
+        """Rebuild a 200 requests.Response from a cached page"""
+        response = requests.Response()
+        response.status_code = 200
+        response.url = cached.get('final_url') or cached['url']
+        response._content = cached['body']
+        response.headers = CaseInsensitiveDict({'Content-Type': cached.get('content_type') or 'text/html',
+                                                'X-Page-Cache': 'hit'})
+        response.encoding = requests.utils.get_encoding_from_headers(response.headers)
+        return response
+    
+    def _request(self, url: str, timeout: float, headers: Optional[Dict] = None) -> requests.Response:
+        """GET through the shared session, within the per-host concurrency limit and politeness delay"""
+        host = urlparse(url).netloc.lower()
+        with self._hosts_lock:
+            slots = self._host_slots.get(host)
+            if slots is None:
+                slots = self._host_slots[host] = threading.BoundedSemaphore(self.per_host)
+                # Forgotten sites were last used MAX_TRACKED_HOSTS sites ago, long past their delay
+                while len(self._host_slots) > MAX_TRACKED_HOSTS:
+                    forgotten, _ = self._host_slots.popitem(last=False)
+                    self._host_next_start.pop(forgotten, None)
+            else:
+                self._host_slots.move_to_end(host)
+        
+        with slots:
+            with self._hosts_lock:
+                now = time.monotonic()
+                start = max(now, self._host_next_start.get(host, now))
+                self._host_next_start[host] = start + self.host_delay
+            if start > now:
+                time.sleep(start - now)
+            response = self.session.get(url, headers=headers, timeout=timeout, allow_redirects=True, stream=True)
+            read_body(response, self.max_page_bytes)
+            return response
     
     def extract_from_url(self, url: str) -> Dict:
         """
@@ -21,32 +255,10 @@ class RecipeExtractor:
         """
         try:
             # Handle Pinterest URLs - they redirect to the actual recipe site
-            if 'pin.it' in url or 'pinterest.com' in url:
+            if is_pinterest(url):
                 return self._extract_from_pinterest(url)
             
-            # Fetch the page
-            response = requests.get(url, headers=self.headers, timeout=10, allow_redirects=True)
-            response.raise_for_status()
-            
-            # Parse with BeautifulSoup
-            soup = BeautifulSoup(response.content, 'html.parser')
-            
-            # Try to extract structured data (JSON-LD)
-            recipe_data = self._extract_json_ld(soup)
-            
-            # If no structured data, try manual extraction
-            if not recipe_data or not recipe_data.get('title'):
-                recipe_data = self._manual_extraction(soup, url)
-            
-            # Extract text content with trafilatura
-            text_content = trafilatura.extract(response.content)
-            recipe_data['extracted_text'] = text_content
-            
-            # Add URL
-            recipe_data['url'] = url
-            recipe_data['source_domain'] = urlparse(url).netloc
-            
-            return recipe_data
+            return self.extract_from_response(url, self.fetch_page(url))
             
         except Exception as e:
             return {
@@ -56,59 +268,103 @@ class RecipeExtractor:
                 'success': False
             }
     
-    def _extract_from_pinterest(self, url: str) -> Dict:
+    def fetch_page(self, url: str) -> requests.Response:
+        """
+        Fetch a recipe (or Pinterest pin) page; HTTP error statuses raise
+        requests.HTTPError. Split from extract_from_url so background imports
+        can retry the fetch on its own (see is_transient_error).
+        """
+        response = self._fetch(url, timeout=15 if is_pinterest(url) else 10)
+        response.raise_for_status()
+        return response
+    
+    def extract_from_response(self, url: str, response: requests.Response) -> Dict:
+        """Extract the recipe from a page returned by fetch_page"""
+        if is_pinterest(url):
+            return self._extract_from_pinterest(url, response)
+        
+        recipe_data = self._extract_from_tree(parse_html(response.content), url)
+        
+        # Add URL
+        recipe_data['url'] = url
+        recipe_data['source_domain'] = urlparse(url).netloc
+        
+        return recipe_data
+    
+    def _extract_from_tree(self, tree, url: str) -> Dict:
+        """
+        Run the extraction stages over one parsed page: JSON-LD, then manual
+        extraction if there is no structured recipe, then trafilatura for the
+        page text. trafilatura is the most expensive stage, so it is skipped
+        when the JSON-LD recipe is already complete.
         """
-        Extract recipe from Pinterest URL
+        # Try to extract structured data (JSON-LD)
+        recipe_data = self._extract_json_ld(tree)
+        
+        if self._is_complete(recipe_data):
+            recipe_data['extracted_text'] = '\n\n'.join(str(part) for part in (
+                recipe_data['title'], recipe_data.get('description'),
+                '\n'.join(map(str, recipe_data['ingredients'])), recipe_data['instructions']
+            ) if part)
+            return recipe_data
+        
+        # If no structured data, try manual extraction
+        if not recipe_data or not recipe_data.get('title'):
+            recipe_data = self._manual_extraction(tree, url)
+        
+        # Extract text content with trafilatura (last: it prunes the tree in place)
+        recipe_data['extracted_text'] = trafilatura.extract(tree)
+        return recipe_data
+    
+    @staticmethod
+    def _is_complete(recipe_data: Dict) -> bool:
+        """JSON-LD recipe with title, ingredients and instructions (nothing left for trafilatura)"""
+        return bool(recipe_data and recipe_data.get('title') and recipe_data.get('ingredients')
+                    and recipe_data.get('instructions'))
+    
+    def _extract_from_pinterest(self, url: str, response: Optional[requests.Response] = None) -> Dict:
+        """
+        Extract recipe from Pinterest URL (or its already fetched pin page)
         Pinterest usually redirects to the actual recipe site
         """
         try:
             # Follow redirects to get to Pinterest page
-            response = requests.get(url, headers=self.headers, timeout=15, allow_redirects=True)
-            response.raise_for_status()
+            if response is None:
+                response = self.fetch_page(url)
             
-            soup = BeautifulSoup(response.content, 'html.parser')
+            tree = parse_html(response.content)
             
             # Try to find the actual recipe URL from Pinterest
             # Pinterest often has the source URL in various places
             source_url = None
             
             # Method 1: Look for canonical link or og:url (but skip if it's Pinterest)
-            canonical = soup.find('link', rel='canonical')
-            if canonical and canonical.get('href'):
-                href = canonical['href']
+            href = first(tree, '//link[@rel="canonical"]/@href')
+            if href:
                 if 'pinterest.com' not in href and 'pin.it' not in href:
-                    source_url = href
+                    source_url = str(href)
             
             # Method 2: Look for og:url meta tag (but skip if it's Pinterest)
             if not source_url:
-                og_url = soup.find('meta', property='og:url')
-                if og_url and og_url.get('content'):
-                    href = og_url['content']
+                href = first(tree, '//meta[@property="og:url"]/@content')
+                if href:
                     if 'pinterest.com' not in href and 'pin.it' not in href:
-                        source_url = href
+                        source_url = str(href)
+            
+            # Pinterest's embedded JSON, scanned once for source URL, images and videos
+            pinterest_json = None
             
             # Method 3: Look for external link in Pinterest's data
             if not source_url:
-                # Try to find JSON data in script tags
-                scripts = soup.find_all('script', type='application/json')
-                for script in scripts:
-                    try:
-                        data = json.loads(script.string)
-                        # Pinterest stores source URL in various places
-                        if isinstance(data, dict):
-                            # Look for url or source_url in nested structures
-                            source_url = self._find_url_in_dict(data)
-                            if source_url:
-                                break
-                    except:
-                        continue
+                pinterest_json = self._scan_pinterest_json(tree)
+                source_url = pinterest_json['url']
             
             # Method 4: Look for links with "Visit" or "Source" text
             if not source_url:
-                links = soup.find_all('a', href=True)
+                links = tree.xpath('//a[@href]')
                 for link in links:
                     href = link.get('href', '')
-                    text = link.get_text().strip().lower()
+                    text = text_of(link).lower()
                     if ('visit' in text or 'source' in text or 'ver' in text) and href.startswith('http'):
                         source_url = href
                         break
@@ -116,7 +372,7 @@ class RecipeExtractor:
             # Method 5: Look for external domain links (not pinterest.com)
             # Prioritize links that look like recipe sites
             if not source_url:
-                links = soup.find_all('a', href=True)
+                links = tree.xpath('//a[@href]')
                 priority_urls = []
                 other_urls = []
                 
@@ -159,9 +415,9 @@ class RecipeExtractor:
             # Method 6: Look in Pinterest's JSON data for external links
             if not source_url:
                 # Pinterest stores recipe URLs in JSON-LD or script tags
-                scripts = soup.find_all('script')
+                scripts = tree.xpath('//script')
                 for script in scripts:
-                    script_text = script.string or ''
+                    script_text = script.text or ''
                     if not script_text:
                         continue
                     # Look for URLs in the script content - improved pattern
@@ -180,9 +436,8 @@ class RecipeExtractor:
             
             # Method 7: Look for og:url that points to external site
             if not source_url:
-                og_url_tag = soup.find('meta', property='og:url')
-                if og_url_tag:
-                    og_url = og_url_tag.get('content', '')
+                og_url = str(first(tree, '//meta[@property="og:url"]/@content') or '')
+                if og_url:
                     if og_url and 'pinterest.com' not in og_url and 'pin.it' not in og_url:
                         # Check if it's a real recipe site
                         if any(domain in og_url.lower() for domain in ['recipe', 'cook', 'food', 'blog', '.com']):
@@ -196,28 +451,28 @@ class RecipeExtractor:
                 
                 # Try to extract from the source site
                 try:
-                    source_response = requests.get(source_url, headers=self.headers, timeout=15, allow_redirects=True)
+                    source_response = self._fetch(source_url, timeout=15)
                     source_response.raise_for_status()
                     
-                    source_soup = BeautifulSoup(source_response.content, 'html.parser')
+                    source_tree = parse_html(source_response.content)
                     
                     # Try structured data first
-                    recipe_data = self._extract_json_ld(source_soup)
+                    recipe_data = self._extract_json_ld(source_tree)
                     
                     # If no structured data, try manual extraction
                     if not recipe_data or not recipe_data.get('title'):
-                        recipe_data = self._manual_extraction(source_soup, source_url)
+                        recipe_data = self._manual_extraction(source_tree, source_url)
                     
                     # Extract images and videos from source site if not already found
                     if not recipe_data.get('image_url'):
                         # Try to find images in source page
-                        img_tags = source_soup.find_all('img', src=True)
+                        img_tags = source_tree.xpath('//img[@src]')
                         for img in img_tags[:5]:  # Limit to first 5
                             src = img.get('src', '')
                             if src.startswith('http') or src.startswith('//'):
                                 if not src.startswith('http'):
                                     src = 'https:' + src
-                                if 'image' in img.get('class', []) or any(keyword in src.lower() for keyword in ['recipe', 'food', 'dish', 'meal']):
+                                if 'image' in (img.get('class') or '').split() or any(keyword in src.lower() for keyword in ['recipe', 'food', 'dish', 'meal']):
                                     recipe_data['image_url'] = src
                                     break
                     
@@ -243,44 +498,37 @@ class RecipeExtractor:
             }
             
             # Try to get title from Pinterest
-            title_tag = soup.find('h1') or soup.find('title')
-            if title_tag:
-                title_text = title_tag.get_text().strip()
+            title_tag = first(tree, '//h1')
+            if title_tag is None:
+                title_tag = first(tree, '//title')
+            if title_tag is not None:
+                title_text = text_of(title_tag)
                 # Clean Pinterest title (remove "on Pinterest" etc)
                 title_text = re.sub(r'\s*on\s+Pinterest.*$', '', title_text, flags=re.I)
                 recipe_data['title'] = title_text
             
             # Try to extract description
-            desc_tag = soup.find('meta', property='og:description')
-            if desc_tag and desc_tag.get('content'):
-                recipe_data['description'] = desc_tag['content']
+            description = first(tree, '//meta[@property="og:description"]/@content')
+            if description:
+                recipe_data['description'] = str(description)
             
             # Try to extract images from multiple sources
             images = []
             videos = []
             
             # Method 1: og:image meta tag
-            img_tag = soup.find('meta', property='og:image')
-            if img_tag and img_tag.get('content'):
-                images.append(img_tag['content'])
+            og_image = first(tree, '//meta[@property="og:image"]/@content')
+            if og_image:
+                images.append(str(og_image))
             
-            # Method 2: Look for Pinterest image in JSON data
-            scripts = soup.find_all('script', type='application/json')
-            for script in scripts:
-                try:
-                    data = json.loads(script.string)
-                    # Search for image URLs in nested data
-                    img_urls = self._find_images_in_dict(data)
-                    images.extend(img_urls)
-                    
-                    # Search for video URLs
-                    video_urls = self._find_videos_in_dict(data)
-                    videos.extend(video_urls)
-                except:
-                    continue
+            # Method 2: Pinterest images and videos found in the JSON data
+            if pinterest_json is None:
+                pinterest_json = self._scan_pinterest_json(tree)
+            images.extend(src for src in pinterest_json['images'] if src not in images)
+            videos.extend(pinterest_json['videos'])
             
             # Method 3: Look for img tags with Pinterest classes or data attributes
-            img_tags = soup.find_all('img', src=True)
+            img_tags = tree.xpath('//img[@src]')
             for img in img_tags:
                 src = img.get('src', '') or img.get('data-src', '') or img.get('data-lazy-src', '')
                 if src:
@@ -295,16 +543,16 @@ class RecipeExtractor:
                             images.append(src)
             
             # Method 4: Look for video tags
-            video_tags = soup.find_all('video', src=True)
+            video_tags = tree.xpath('//video[@src]')
             for video in video_tags:
                 src = video.get('src', '')
                 if src and src not in videos:
                     videos.append(src)
             
             # Also check for source tags inside video
-            video_containers = soup.find_all('video')
+            video_containers = tree.xpath('//video')
             for video in video_containers:
-                sources = video.find_all('source', src=True)
+                sources = video.xpath('.//source[@src]')
                 for source in sources:
                     src = source.get('src', '')
                     if src and src not in videos:
@@ -335,87 +583,47 @@ class RecipeExtractor:
                 'success': False
             }
     
-    def _find_url_in_dict(self, data: dict, max_depth: int = 5) -> Optional[str]:
-        """Recursively search for URL in nested dictionary"""
-        if max_depth <= 0:
-            return None
-        
-        for key, value in data.items():
-            if isinstance(value, str) and value.startswith('http') and 'pinterest.com' not in value:
-                return value
-            elif isinstance(value, dict):
-                result = self._find_url_in_dict(value, max_depth - 1)
-                if result:
-                    return result
-            elif isinstance(value, list):
-                for item in value:
-                    if isinstance(item, dict):
-                        result = self._find_url_in_dict(item, max_depth - 1)
-                        if result:
-                            return result
-        
-        return None
-    
-    def _find_images_in_dict(self, data: dict, max_depth: int = 5, found: list = None) -> list:
-        """Recursively search for image URLs in nested dictionary"""
-        if found is None:
-            found = []
-        if max_depth <= 0:
-            return found
-        
-        for key, value in data.items():
-            if isinstance(value, str):
-                # Look for image URLs
-                if value.startswith('http') and any(ext in value.lower() for ext in ['.jpg', '.jpeg', '.png', '.gif', '.webp', 'pinimg.com', 'image']):
-                    if value not in found:
-                        found.append(value)
-            elif isinstance(value, dict):
-                self._find_images_in_dict(value, max_depth - 1, found)
-            elif isinstance(value, list):
-                for item in value:
-                    if isinstance(item, dict):
-                        self._find_images_in_dict(item, max_depth - 1, found)
-                    elif isinstance(item, str) and item.startswith('http') and any(ext in item.lower() for ext in ['.jpg', '.jpeg', '.png', '.gif', '.webp']):
-                        if item not in found:
-                            found.append(item)
+    def _scan_pinterest_json(self, tree) -> Dict:
+        """
+        One pass over the JSON scripts of a Pinterest page (__PWS_DATA__ and
+        friends, often several MB) collecting together the first external URL
+        (the recipe source candidate), image URLs and video URLs, deduplicated.
+        Strings are streamed out of the text (iter_json_strings) instead of
+        loading it, and the scan stops once the URL is known and both lists hold
+        PINTEREST_MEDIA_LIMIT entries.
+        """
+        found = {'url': None, 'images': [], 'videos': []}
+        seen = {'images': set(), 'videos': set()}
         
-        return found
-    
-    def _find_videos_in_dict(self, data: dict, max_depth: int = 5, found: list = None) -> list:
-        """Recursively search for video URLs in nested dictionary"""
-        if found is None:
-            found = []
-        if max_depth <= 0:
-            return found
-        
-        for key, value in data.items():
-            if isinstance(value, str):
-                # Look for video URLs
-                if value.startswith('http') and any(ext in value.lower() for ext in ['.mp4', '.webm', '.mov', 'video', 'youtube.com', 'youtu.be', 'vimeo.com']):
-                    if value not in found:
-                        found.append(value)
-            elif isinstance(value, dict):
-                self._find_videos_in_dict(value, max_depth - 1, found)
-            elif isinstance(value, list):
-                for item in value:
-                    if isinstance(item, dict):
-                        self._find_videos_in_dict(item, max_depth - 1, found)
-                    elif isinstance(item, str) and item.startswith('http') and any(ext in item.lower() for ext in ['.mp4', '.webm', '.mov', 'video']):
-                        if item not in found:
-                            found.append(item)
+        for script in tree.xpath('//script[@type="application/json"]'):
+            for _, value in iter_json_strings(script.text or '', PINTEREST_JSON_DEPTH):
+                if not value.startswith('http'):
+                    continue
+                lower = value.lower()
+                if found['url'] is None and 'pinterest.com' not in lower and 'pinimg.com' not in lower:
+                    found['url'] = value
+                is_video_file = lower.split('?')[0].endswith(VIDEO_FILES)
+                for kind, matches in (('images', not is_video_file and any(hint in lower for hint in IMAGE_HINTS)),
+                                      ('videos', any(hint in lower for hint in VIDEO_HINTS))):
+                    if matches and len(found[kind]) < PINTEREST_MEDIA_LIMIT and value not in seen[kind]:
+                        seen[kind].add(value)
+                        found[kind].append(value)
+                if (found['url'] and len(found['images']) >= PINTEREST_MEDIA_LIMIT
+                        and len(found['videos']) >= PINTEREST_MEDIA_LIMIT):
+                    return found
         
         return found
     
-    def _extract_json_ld(self, soup: BeautifulSoup) -> Dict:
+    def _extract_json_ld(self, tree) -> Dict:
         """Extract recipe data from JSON-LD structured data"""
         recipe_data = {}
         
         # Find JSON-LD script tags
-        json_ld_scripts = soup.find_all('script', type='application/ld+json')
+        json_ld_scripts = tree.xpath('//script[@type="application/ld+json"]')
         
         for script in json_ld_scripts:
             try:
-                data = json.loads(script.string)
+                data = json.loads(script.text or '')
                 
                 # Handle @graph structure
                 if isinstance(data, dict) and '@graph' in data:
@@ -482,7 +690,7 @@ class RecipeExtractor:
         
         return recipe
     
-    def _manual_extraction(self, soup: BeautifulSoup, url: str) -> Dict:
+    def _manual_extraction(self, tree, url: str) -> Dict:
         """Manual extraction when structured data is not available"""
         recipe = {
             'title': '',
@@ -492,33 +700,33 @@ class RecipeExtractor:
         }
         
         # Try to find title
-        title_tag = soup.find('h1')
-        if title_tag:
-            recipe['title'] = title_tag.get_text().strip()
+        title_tag = first(tree, '//h1')
+        if title_tag is not None:
+            recipe['title'] = text_of(title_tag)
         else:
             # Fallback to page title
-            title_tag = soup.find('title')
-            if title_tag:
-                recipe['title'] = title_tag.get_text().strip()
+            title_tag = first(tree, '//title')
+            if title_tag is not None:
+                recipe['title'] = text_of(title_tag)
         
         # Try to find ingredients
-        ingredients_section = soup.find(['div', 'section', 'ul'], 
-                                       class_=re.compile(r'ingredient', re.I))
-        if ingredients_section:
-            ingredient_items = ingredients_section.find_all(['li', 'p'])
-            recipe['ingredients'] = [item.get_text().strip() for item in ingredient_items]
+        ingredients_section = first(tree, '//*[self::div or self::section or self::ul]'
+                                          '[re:test(@class, "ingredient", "i")]')
+        if ingredients_section is not None:
+            ingredient_items = ingredients_section.xpath('.//li | .//p')
+            recipe['ingredients'] = [text_of(item) for item in ingredient_items]
         
         # Try to find instructions
-        instructions_section = soup.find(['div', 'section', 'ol'], 
-                                        class_=re.compile(r'instruction|preparation|step', re.I))
-        if instructions_section:
-            instruction_items = instructions_section.find_all(['li', 'p'])
-            recipe['instructions'] = '\n'.join([item.get_text().strip() for item in instruction_items])
+        instructions_section = first(tree, '//*[self::div or self::section or self::ol]'
+                                           '[re:test(@class, "instruction|preparation|step", "i")]')
+        if instructions_section is not None:
+            instruction_items = instructions_section.xpath('.//li | .//p')
+            recipe['instructions'] = '\n'.join([text_of(item) for item in instruction_items])
         
         # Try to find image
-        img_tag = soup.find('img', class_=re.compile(r'recipe|featured|main', re.I))
-        if img_tag and img_tag.get('src'):
-            recipe['image_url'] = img_tag['src']
+        img_tag = first(tree, '//img[re:test(@class, "recipe|featured|main", "i")]')
+        if img_tag is not None and img_tag.get('src'):
+            recipe['image_url'] = img_tag.get('src')
         
         return recipe
     
@@ -567,13 +775,32 @@ class RecipeExtractor:
         
         return None
     
+    def iter_extract_urls(self, urls: List[str]) -> Iterator[Tuple[int, Dict]]:
+        """
+        Extract recipes from many URLs concurrently, yielding (index in urls, recipe)
+        as each page finishes. Failed pages yield the usual {'error': ...} dict.
+        """
+        if not urls:
+            return
+        
+        with ThreadPoolExecutor(max_workers=min(self.max_workers, len(urls)),
+                                thread_name_prefix='recipe-fetch') as pool:
+            futures = {pool.submit(self.extract_from_url, url): index for index, url in enumerate(urls)}
+            try:
+                for future in as_completed(futures):
+                    index = futures[future]
+                    print(f"Receta extraída ({index + 1}/{len(urls)}): {urls[index]}")
+                    yield index, future.result()
+            finally:
+                # Consumer gone (e.g. client disconnected): skip the pages not started yet
+                for future in futures:
+                    future.cancel()
+    
     def extract_multiple_urls(self, urls: List[str]) -> List[Dict]:
-        """Extract recipes from multiple URLs"""
-        recipes = []
+        """Extract recipes from multiple URLs (concurrently, results in the order of urls)"""
+        recipes = [None] * len(urls)
         
-        for url in urls:
-            print(f"Extrayendo receta de: {url}")
-            recipe = self.extract_from_url(url)
-            recipes.append(recipe)
+        for index, recipe in self.iter_extract_urls(urls):
+            recipes[index] = recipe
         
         return recipes
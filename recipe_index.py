@@ -0,0 +1,297 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Recipe retrieval for Family Kitchen Menu System
+Ranks the recipe library against the family profiles, past ratings and recent menus
+so only the most relevant recipes are sent to Claude
+"""
+import heapq
+import math
+import os
+import re
+import threading
+import unicodedata
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+from database import Database, normalize_title
+from models import Recipe
+
+# Field weights of a term in a recipe's postings
+TITLE_WEIGHT = 2.0
+TAG_WEIGHT = 1.0
+INGREDIENT_WEIGHT = 1.0
+
+# Query weights
+LIKE_WEIGHT = 1.0
+DISLIKE_WEIGHT = -2.0
+RATED_DISH_WEIGHT = 3.0     # per star above/below 3 for a recipe served on a rated day
+RATED_TERMS_WEIGHT = 0.3    # per star above/below 3 for the words of a rated dish
+RECENT_WEIGHT = -3.0        # recipe served last week (halved for each older week)
+
+# Profile fields feeding each part of the query
+LIKE_FIELDS = ('ingredientes_favoritos', 'cocinas_favoritas', 'cocinas_gustan', 'verduras_aceptadas',
+               'plato_favorito', 'snacks_favoritos')
+DISLIKE_FIELDS = ('ingredientes_no_gustan', 'ingredientes_rechaza', 'verduras_rechazadas',
+                  'plato_menos_favorito', 'plato_nunca_comeria')
+EXCLUDE_FIELDS = ('alergias', 'intolerancias')
+
+MEAL_TYPES = ('desayuno', 'comida', 'merienda', 'cena')
+
+STOPWORDS = frozenset('''
+    a al con de del el en la las lo los o para por sin su un una unas unos y
+    cucharada cucharadita gramo kilo litro pizca taza unidad
+    ninguna ninguno nada no ning
+'''.split())
+
+_WORD = re.compile(r'[a-zñ]+')
+_PHRASE_SEPARATORS = re.compile(r'[,;/\n]|\by\b|\be\b')
+
+
+def terms(text) -> List[str]:
+    """Lowercase, accent-free, lightly singularized words of text (stopwords dropped)"""
+    text = unicodedata.normalize('NFKD', str(text or '').lower())
+    text = ''.join(char for char in text if not unicodedata.combining(char) or char == '̃')
+    text = unicodedata.normalize('NFC', text)
+    words = []
+    for word in _WORD.findall(text):
+        # tomates -> tomate -> tomat, limones -> limone -> limon: both forms meet
+        if len(word) > 4 and word.endswith('s'):
+            word = word[:-1]
+        if len(word) > 4 and word.endswith('e'):
+            word = word[:-1]
+        if len(word) > 2 and word not in STOPWORDS:
+            words.append(word)
+    return words
+
+
+def phrases(value) -> List[List[str]]:
+    """Split a free-text profile answer ("pasta, frutos secos y pescado") into term lists"""
+    return [words for part in _PHRASE_SEPARATORS.split(str(value or '')) if (words := terms(part))]
+
+
+def menu_dishes(menu_data: Dict) -> Iterable[str]:
+    """Names and base recipes of every meal in a menu_data dict (or a single day of it)"""
+    menus = [menu_data.get(key) for key in ('menu_adultos', 'menu_ninos')] if 'dias' not in menu_data else [menu_data]
+    for menu in menus:
+        if not isinstance(menu, dict):
+            continue
+        for day in (menu.get('dias') or {}).values():
+            yield from day_dishes(day)
+
+
+def day_dishes(day: Dict) -> Iterable[str]:
+    """Names and base recipes of the meals of one menu day"""
+    if not isinstance(day, dict):
+        return
+    for meal_type in MEAL_TYPES:
+        meal = day.get(meal_type)
+        if isinstance(meal, dict):
+            name = meal.get('nombre')
+            yield name.get('name', '') if isinstance(name, dict) else (name or '')
+            if meal.get('receta_base') and str(meal['receta_base']).lower() != 'original':
+                yield str(meal['receta_base'])
+        elif isinstance(meal, str):
+            yield meal
+
+
+class RecipeIndex:
+    """
+    Inverted index over recipe titles, ingredients and tags (cuisine, meal
+    type, difficulty) used to pick the top-k recipes for a menu prompt.
+    
+    Only the index columns of the recipes table are read, and only when the
+    library changed (Database.get_recipes_stamp); selecting touches just the
+    postings of the query terms and then loads the k winning recipes.
+    
+    Scoring: liked ingredients/cuisines add idf-weighted points, disliked
+    ones subtract, recipes containing an allergy or intolerance are never
+    selected, dishes from well/badly rated days move the recipe up/down and
+    recipes served in recent weeks are pushed back for variety.
+    """
+    
+    def __init__(self, db: Database, top_k: Optional[int] = None):
+        self.db = db
+        self.top_k = int(os.getenv('RECIPE_PROMPT_TOP_K', '20')) if top_k is None else top_k
+        self._lock = threading.Lock()
+        self._stamp = None
+        self._postings: Dict[str, Dict[int, float]] = {}
+        self._title_keys: Dict[str, List[int]] = {}
+        self._ids: List[int] = []
+    
+    def refresh(self) -> bool:
+        """Rebuild the index if recipes were added, updated or deleted; True when it was rebuilt"""
+        stamp = self.db.get_recipes_stamp()
+        with self._lock:
+            if stamp == self._stamp:
+                return False
+            self.build(self.db.get_recipe_index_rows())
+            self._stamp = stamp
+        return True
+    
+    def build(self, recipes: Iterable[Recipe]):
+        """Index recipes (needs id, title, title_key, ingredients and the tag columns)"""
+        postings: Dict[str, Dict[int, float]] = {}
+        title_keys: Dict[str, List[int]] = {}
+        ids = []
+        
+        for recipe in recipes:
+            recipe_id = recipe['id']
+            ids.append(recipe_id)
+            title_keys.setdefault(recipe.get('title_key') or normalize_title(recipe.get('title')), []).append(recipe_id)
+            
+            weights: Dict[str, float] = {}
+            for term in set(terms(recipe.get('title'))):
+                weights[term] = weights.get(term, 0.0) + TITLE_WEIGHT
+            tags = ' '.join(str(recipe.get(column) or '') for column in ('cuisine_type', 'meal_type', 'difficulty'))
+            for term in set(terms(tags)):
+                weights[term] = weights.get(term, 0.0) + TAG_WEIGHT
+            ingredients = recipe.get('ingredients') or []
+            if isinstance(ingredients, str):
+                ingredients = [ingredients]
+            for term in set(term for ingredient in ingredients for term in terms(ingredient)):
+                weights[term] = weights.get(term, 0.0) + INGREDIENT_WEIGHT
+            
+            for term, weight in weights.items():
+                postings.setdefault(term, {})[recipe_id] = weight
+        
+        ids.sort(reverse=True)  # newest first when filling up with unscored recipes
+        self._postings, self._title_keys, self._ids = postings, title_keys, ids
+    
+    def __len__(self):
+        return len(self._ids)
+    
+    def _idf(self, term: str) -> float:
+        return math.log(1 + len(self._ids) / len(self._postings[term]))
+    
+    def _matching(self, words: List[str]) -> Set[int]:
+        """Recipes containing every word of a phrase"""
+        matches = None
+        for word in words:
+            ids = self._postings.get(word)
+            if not ids:
+                return set()
+            matches = set(ids) if matches is None else matches & ids.keys()
+        return matches or set()
+    
+    def _add_terms(self, scores: Dict[int, float], words: Iterable[str], weight: float):
+        for word in words:
+            ids = self._postings.get(word)
+            if ids:
+                idf = self._idf(word)
+                for recipe_id, field_weight in ids.items():
+                    scores[recipe_id] = scores.get(recipe_id, 0.0) + weight * idf * field_weight
+    
+    def _add_title(self, scores: Dict[int, float], title: str, weight: float):
+        for recipe_id in self._title_keys.get(normalize_title(title), ()):
+            scores[recipe_id] = scores.get(recipe_id, 0.0) + weight
+    
+    def rank(self,
+             adults: List[Dict],
+             children: List[Dict],
+             historical_ratings: Optional[List[Dict]] = None,
+             recent_menus: Optional[List[Dict]] = None,
+             k: Optional[int] = None) -> List[int]:
+        """
+        Ids of the k most relevant recipes, best first
+        
+        Args:
+            adults, children: Family profiles (likes, dislikes, allergies)
+            historical_ratings: Day ratings with their menu_data (Database.get_all_menu_ratings)
+            recent_menus: menu_data of the latest weeks, newest first
+            k: How many recipes to return (default top_k)
+        """
+        scores, excluded = self._profile_scores(adults, children)
+        self._add_history(scores, historical_ratings, recent_menus)
+        return self._top(scores, excluded, self.top_k if k is None else k)
+    
+    def _profile_scores(self, adults: List[Dict], children: List[Dict]) -> Tuple[Dict[int, float], Set[int]]:
+        """Scores from the family's likes and dislikes, and the recipes their allergies exclude"""
+        scores: Dict[int, float] = {}
+        excluded: Set[int] = set()
+        
+        for profile in list(adults or []) + list(children or []):
+            for field in LIKE_FIELDS:
+                for words in phrases(profile.get(field)):
+                    self._add_terms(scores, words, LIKE_WEIGHT / len(words))
+            for field in DISLIKE_FIELDS:
+                for words in phrases(profile.get(field)):
+                    matches = self._matching(words)
+                    if matches:
+                        penalty = DISLIKE_WEIGHT * sum(self._idf(word) for word in words) / len(words)
+                        for recipe_id in matches:
+                            scores[recipe_id] = scores.get(recipe_id, 0.0) + penalty
+            for field in EXCLUDE_FIELDS:
+                for words in phrases(profile.get(field)):
+                    excluded |= self._matching(words)
+        return scores, excluded
+    
+    def _add_history(self, scores: Dict[int, float],
+                     historical_ratings: Optional[List[Dict]], recent_menus: Optional[List[Dict]]):
+        """Move dishes of rated days up or down and push back recently served ones"""
+        for rating in historical_ratings or []:
+            stars = (rating.get('rating') or 3) - 3
+            menu_data = rating.get('menu_data')
+            if not stars or not isinstance(menu_data, dict):
+                continue
+            day = (menu_data.get(f"menu_{rating.get('menu_type')}") or {}).get('dias', {}).get(rating.get('day_name'))
+            for dish in day_dishes(day):
+                self._add_title(scores, dish, stars * RATED_DISH_WEIGHT)
+                self._add_terms(scores, terms(dish), stars * RATED_TERMS_WEIGHT)
+        
+        for weeks_ago, menu_data in enumerate(recent_menus or []):
+            for dish in set(menu_dishes(menu_data or {})):
+                self._add_title(scores, dish, RECENT_WEIGHT / 2 ** weeks_ago)
+    
+    def _top(self, scores: Dict[int, float], excluded: Set[int], k: int) -> List[int]:
+        """The k best scored recipes that are not excluded, filled up with unscored then penalized ones"""
+        ranked = heapq.nlargest(k, ((score, recipe_id) for recipe_id, score in scores.items()
+                                    if score > 0 and recipe_id not in excluded))
+        selected = [recipe_id for _, recipe_id in ranked]
+        
+        # Not enough relevant recipes: fill with unscored ones (newest first), then the penalized ones
+        if len(selected) < k:
+            for recipe_id in self._ids:
+                if recipe_id not in scores and recipe_id not in excluded:
+                    selected.append(recipe_id)
+                    if len(selected) == k:
+                        break
+        if len(selected) < k:
+            penalized = ((score, recipe_id) for recipe_id, score in scores.items()
+                         if score <= 0 and recipe_id not in excluded)
+            selected += [recipe_id for _, recipe_id in heapq.nlargest(k - len(selected), penalized)]
+        return selected
+    
+    def select(self,
+               adults: List[Dict],
+               children: List[Dict],
+               historical_ratings: Optional[List[Dict]] = None,
+               recent_menus: Optional[List[Dict]] = None,
+               k: Optional[int] = None) -> List[Recipe]:
+        """The k most relevant recipes, fully loaded, best first (see rank)"""
+        self.refresh()
+        return self.db.get_recipes_by_ids(self.rank(adults, children, historical_ratings, recent_menus, k))
+    
+    def select_for_prompt(self,
+                          adults: List[Dict],
+                          children: List[Dict],
+                          historical_ratings: Optional[List[Dict]] = None,
+                          recent_menus: Optional[List[Dict]] = None,
+                          k: Optional[int] = None) -> Tuple[List[Recipe], List[Recipe]]:
+        """
+        Recipes for a menu prompt from one scoring pass: the profile-only
+        selection (stable while the family and library are unchanged, so it can
+        go in the cached prompt prefix) and the selection that also weighs
+        ratings and recent menus, both fully loaded and best first
+        """
+        self.refresh()
+        k = self.top_k if k is None else k
+        scores, excluded = self._profile_scores(adults, children)
+        profile_ids = self._top(scores, excluded, k)
+        self._add_history(scores, historical_ratings, recent_menus)
+        ranked_ids = self._top(scores, excluded, k)
+        
+        # One query for both lists; they mostly share recipes
+        loaded = {recipe['id']: recipe
+                  for recipe in self.db.get_recipes_by_ids(list(dict.fromkeys(profile_ids + ranked_ids)))}
+        return ([loaded[recipe_id] for recipe_id in profile_ids if recipe_id in loaded],
+                [loaded[recipe_id] for recipe_id in ranked_ids if recipe_id in loaded])
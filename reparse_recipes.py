@@ -0,0 +1,63 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Re-run recipe extraction over every imported recipe from the page cache.
+
+Pages are read from the http_cache table only (RecipeExtractor offline
+mode), so extractor improvements can be tried on the whole history without
+refetching anything. Prints which recipes would change; --apply saves them.
+
+Usage:
+    python reparse_recipes.py [--apply] [--limit N]
+"""
+import argparse
+
+from dotenv import load_dotenv
+
+from database import Database
+from recipe_extractor import RecipeExtractor
+
+# Columns refreshed from the re-parsed page; the rest (id, extracted_data...) is kept
+REPARSED_FIELDS = ('title', 'ingredients', 'instructions', 'prep_time', 'cook_time', 'servings',
+                   'cuisine_type', 'difficulty', 'image_url')
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--apply', action='store_true', help='save the re-parsed recipes')
+    parser.add_argument('--limit', type=int, default=None, help='only the first N recipes with a URL')
+    args = parser.parse_args()
+
+    load_dotenv()
+    db = Database()
+    extractor = RecipeExtractor(page_cache=db, offline=True)
+
+    recipes = [recipe for recipe in db.get_all_recipes() if recipe.url and recipe.url.startswith('http')]
+    recipes = recipes[:args.limit] if args.limit else recipes
+    changed = missing = 0
+
+    for recipe in recipes:
+        data = extractor.extract_from_url(recipe.url)
+        if data.get('error'):
+            missing += 1
+            print(f"  - {recipe.title}: {data['error']}")
+            continue
+
+        updated = recipe.to_json()
+        updated.update({field: data[field] for field in REPARSED_FIELDS if data.get(field)})
+        differences = [field for field in REPARSED_FIELDS if updated.get(field) != recipe.get(field)]
+        if not differences:
+            continue
+
+        changed += 1
+        print(f"  * {recipe.title}: {', '.join(differences)}")
+        if args.apply:
+            db.update_recipe(recipe.id, updated)
+
+    print(f"\n{len(recipes)} recipes, {changed} {'updated' if args.apply else 'would change'}, "
+          f"{missing} without a cached page")
+    db.close_connections()
+
+
+if __name__ == '__main__':
+    main()
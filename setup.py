@@ -86,7 +86,7 @@ def check_dependencies():
     required = [
         'flask',
         'anthropic',
-        'beautifulsoup4',
+        'lxml',
         'pandas',
         'psycopg2',
     ]
@@ -526,6 +526,38 @@ function hideBatchExtract() {
     document.getElementById('batchUrls').value = '';
 }
 
+// Poll queued recipe imports until every one has succeeded or failed
+async function waitForImports(progressUrl, onProgress, interval = 1500) {
+    while (true) {
+        await new Promise(resolve => setTimeout(resolve, interval));
+        const body = await API.get(progressUrl);
+        onProgress(body.data);
+        if (body.data.finished === body.data.total) {
+            return body.data;
+        }
+    }
+}
+
+// Queue the URLs as background imports and report them as they finish
+async function importRecipes(urls) {
+    const queued = await API.post('/api/recipes/extract?async=1', { urls });
+    const reported = new Set();
+    return waitForImports(queued.progress_url, progress => {
+        for (const job of progress.jobs) {
+            if (reported.has(job.id) || (job.status !== 'succeeded' && job.status !== 'failed')) continue;
+            reported.add(job.id);
+            if (job.status === 'failed') {
+                showAlert(`${job.url}: ${job.error || 'Error al extraer la receta'}`, 'error');
+            } else {
+                loadRecipes();
+            }
+        }
+        if (progress.finished < progress.total) {
+            showAlert(`Importando recetas... ${Math.round(progress.progress * 100)}%`, 'success');
+        }
+    });
+}
+
 async function extractRecipe() {
     const url = document.getElementById('recipeUrl').value.trim();
     
@@ -536,14 +568,11 @@ async function extractRecipe() {
     
     try {
         showAlert('Extrayendo receta...', 'success');
-        const result = await API.post('/api/recipes/extract', { url });
+        document.getElementById('recipeUrl').value = '';
+        const progress = await importRecipes([url]);
         
-        if (result.success) {
+        if (progress.succeeded) {
             showAlert('Receta extraída correctamente', 'success');
-            document.getElementById('recipeUrl').value = '';
-            loadRecipes();
-        } else {
-            showAlert(result.error || 'Error al extraer la receta', 'error');
         }
     } catch (error) {
         showAlert('Error al extraer la receta', 'error');
@@ -562,13 +591,11 @@ async function extractBatchRecipes() {
     
     try {
         showAlert(`Extrayendo ${urls.length} recetas...`, 'success');
-        const result = await API.post('/api/recipes/batch', { urls });
+        hideBatchExtract();
+        const progress = await importRecipes(urls);
         
-        if (result.success) {
-            showAlert(result.message, 'success');
-            hideBatchExtract();
-            loadRecipes();
-        }
+        showAlert(`${progress.succeeded}/${progress.total} recetas extraídas correctamente`,
+                  progress.succeeded ? 'success' : 'error');
     } catch (error) {
         showAlert('Error al extraer las recetas', 'error');
     }
@@ -865,6 +892,21 @@ function getNextWeekStart() {
     return result;
 }
 
+// Poll a background job until it has succeeded or failed
+async function waitForJob(statusUrl, signal, interval = 2000) {
+    while (true) {
+        await new Promise(resolve => setTimeout(resolve, interval));
+        const response = await fetch(statusUrl, { signal });
+        const body = await response.json();
+        if (!response.ok) {
+            throw { status: response.status, data: body };
+        }
+        if (body.data.status === 'succeeded' || body.data.status === 'failed') {
+            return body.data;
+        }
+    }
+}
+
 // Menu generation - generates for the currently viewing week
 async function generateMenu() {
     const loading = document.getElementById('menu-loading');
@@ -900,6 +942,7 @@ async function generateMenu() {
     
     // Create AbortController for timeout
     const controller = new AbortController();
+    let dayStream = null;
     const timeoutId = setTimeout(() => controller.abort(), 360000); // 6 minutes timeout
     
     try {
@@ -913,28 +956,50 @@ async function generateMenu() {
         
         console.log('[Frontend] Fecha validada correctamente:', weekStartDate);
         
-        // Use fetch directly with timeout
+        // Show each day as soon as the server has it (streamed as menu_day_generated events)
+        const partialMenu = { menu_adultos: { dias: {} }, menu_ninos: { dias: {} } };
+        let generationJobId = null;
+        dayStream = subscribeToEvents({
+            menu_day_generated: data => {
+                if (data.job_id !== generationJobId) return;
+                partialMenu[`menu_${data.menu_type}`].dias[data.day_name] = data.day_menu;
+                displayMenu(partialMenu);
+            }
+        });
+        
+        // Generation runs as a background job: queue it, then poll until it finishes
         const response = await fetch('/api/menu/generate', {
             method: 'POST',
             headers: {
                 'Content-Type': 'application/json'
             },
             body: JSON.stringify({
-                week_start_date: weekStartDate.trim()
+                week_start_date: weekStartDate.trim(),
+                // Regenerating an existing week asks for a new menu instead of the cached one
+                fresh: await checkMenuExists(weekStartDate.trim())
             }),
             signal: controller.signal
         });
         
+        const submitted = await response.json();
+        
+        if (!response.ok) {
+            clearTimeout(timeoutId);
+            loading.classList.remove('show');
+            throw { status: response.status, data: submitted };
+        }
+        
+        console.log('[Frontend] Generación en cola, trabajo:', submitted.job_id);
+        generationJobId = submitted.job_id;
+        const job = await waitForJob(submitted.status_url, controller.signal);
+        
         clearTimeout(timeoutId);
+        dayStream?.close();
         
-        const result = await response.json();
+        const result = job.result || { success: false, error: job.error || 'Error al generar el menú' };
         
         loading.classList.remove('show');
         
-        if (!response.ok) {
-            throw { status: response.status, data: result };
-        }
-        
         if (result.success) {
             console.log('[Frontend] Menú generado correctamente');
             console.log('[Frontend] Result structure:', result);
@@ -975,6 +1040,16 @@ async function generateMenu() {
             if (menuData && menuData.nombre && menuData.ingredientes && !menuData.menu_adultos && !menuData.menu_ninos && !menuData.dias && !menuData.semana) {
                 console.warn('[Frontend] Menu data appears to be a single meal, checking raw_response for full menu...');
                 
+                // The job result does not carry the raw response; fetch it from the saved menu
+                if (!result.raw_response && result.menu_id) {
+                    try {
+                        const raw = await API.get(`/api/menu/${result.menu_id}/raw-response`);
+                        result.raw_response = raw.data.raw_response;
+                    } catch (error) {
+                        console.warn('[GenerateMenu] Could not load raw response:', error);
+                    }
+                }
+                
                 // Try to extract from raw_response if available
                 if (result.raw_response) {
                     try {
@@ -1104,6 +1179,7 @@ async function generateMenu() {
         }
     } catch (error) {
         clearTimeout(timeoutId);
+        dayStream?.close();
         loading.classList.remove('show');
         
         // Check if it's a timeout/abort
@@ -1191,7 +1267,8 @@ async function regenerateIndividualMenu() {
                 week_start_date: currentViewingWeek || getCurrentWeekStart(),
                 day_index: currentDayIndex,
                 day_name: currentDay,
-                current_menu_data: window.currentMenuDataForDays
+                current_menu_data: window.currentMenuDataForDays,
+                fresh: true  // a regenerate should not replay the cached answer
             })
         });
         
@@ -1268,7 +1345,8 @@ async function regenerateIndividualMeal(mealType, dayIndex) {
                 day_index: dayIndex,
                 day_name: currentDay,
                 meal_type: mealType,
-                current_menu_data: window.currentMenuDataForDays
+                current_menu_data: window.currentMenuDataForDays,
+                fresh: true  // a regenerate should not replay the cached answer
             })
         });
         
@@ -1296,6 +1374,30 @@ async function regenerateIndividualMeal(mealType, dayIndex) {
 }
 
 // Load current week menu (default) - with fallback to latest
+// Get the raw Claude response for a saved menu. It is no longer embedded in the
+// menu payload, so it is only downloaded when the parsing fallback needs it.
+async function getMenuRawResponse(menu) {
+    if (!menu) return null;
+    if (menu.ai_recommendations && menu.ai_recommendations.raw_response) {
+        return menu.ai_recommendations.raw_response;
+    }
+    const metadata = menu.metadata || {};
+    if (metadata.raw_response) {
+        return metadata.raw_response;
+    }
+    if (metadata.has_raw_response && menu.id) {
+        try {
+            const result = await API.get(`/api/menu/${menu.id}/raw-response`);
+            if (result.success && result.data) {
+                return result.data.raw_response;
+            }
+        } catch (e) {
+            console.error('[RawResponse] Failed to fetch raw response:', e);
+        }
+    }
+    return null;
+}
+
 async function loadCurrentWeekMenu() {
     const display = document.getElementById('menu-display');
     
@@ -1382,11 +1484,11 @@ async function loadCurrentWeekMenu() {
             if (menuData && menuData.nombre && menuData.ingredientes && !menuData.menu_adultos && !menuData.menu_ninos && !menuData.dias && !menuData.semana) {
                 console.warn('[LoadLatestMenu] Menu data appears to be a single meal, checking for full menu structure...');
                 
-                // Try to use raw_response if available in metadata
-                if (result.data.ai_recommendations && result.data.ai_recommendations.raw_response) {
+                // Try to use raw_response if available (fetched on demand, stored apart from the menu)
+                const rawResponse = await getMenuRawResponse(result.data);
+                if (rawResponse) {
                     try {
                         let rawMenu;
-                        const rawResponse = result.data.ai_recommendations.raw_response;
                         
                         if (typeof rawResponse === 'string') {
                             // Try direct parse first
@@ -1473,11 +1575,11 @@ async function loadLatestMenuFallback() {
             if (menuData && menuData.nombre && menuData.ingredientes && !menuData.menu_adultos && !menuData.menu_ninos && !menuData.dias && !menuData.semana) {
                 console.warn('[LoadLatestMenu] Menu data appears to be a single meal, checking for full menu structure...');
                 
-                // Try to use raw_response if available in metadata
-                if (result.data.ai_recommendations && result.data.ai_recommendations.raw_response) {
+                // Try to use raw_response if available (fetched on demand, stored apart from the menu)
+                const rawResponse = await getMenuRawResponse(result.data);
+                if (rawResponse) {
                     try {
                         let rawMenu;
-                        const rawResponse = result.data.ai_recommendations.raw_response;
                         
                         if (typeof rawResponse === 'string') {
                             // Try direct parse first
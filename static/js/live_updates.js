@@ -0,0 +1,48 @@
+// Live updates: listens to the /api/events Server-Sent Events stream so pages
+// can refetch only the fragment a change notification refers to instead of
+// polling whole payloads. EventSource reconnects on its own and resumes after
+// the last received event id. A busy server answers 503, which closes the
+// EventSource for good, so that case is retried here after a few seconds.
+
+const EVENT_STREAM_RETRY_MS = 5000;
+
+function subscribeToEvents(handlers) {
+    if (!window.EventSource) {
+        console.warn('[Events] EventSource not supported, live updates disabled');
+        return null;
+    }
+
+    let source = null;
+    let lastEventId = null;
+    let retryTimer = null;
+    let closed = false;
+
+    function connect() {
+        const url = lastEventId ? `/api/events?last_event_id=${encodeURIComponent(lastEventId)}` : '/api/events';
+        source = new EventSource(url);
+        Object.keys(handlers).forEach(eventType => {
+            source.addEventListener(eventType, event => {
+                lastEventId = event.lastEventId || lastEventId;
+                try {
+                    handlers[eventType](JSON.parse(event.data));
+                } catch (error) {
+                    console.error(`[Events] Error handling ${eventType}:`, error);
+                }
+            });
+        });
+        source.onerror = () => {
+            if (closed || source.readyState !== EventSource.CLOSED) return;
+            // Spread the retries of the pages that were turned away together
+            retryTimer = setTimeout(connect, EVENT_STREAM_RETRY_MS * (1 + Math.random()));
+        };
+    }
+
+    connect();
+    return {
+        close() {
+            closed = true;
+            clearTimeout(retryTimer);
+            source.close();
+        }
+    };
+}
@@ -0,0 +1,30 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Shared pytest fixtures
+"""
+import os
+import tempfile
+
+import pytest
+
+from database import Database
+
+
+@pytest.fixture
+def temp_db_path():
+    """Path of a throwaway SQLite file, removed afterwards with its WAL and shared-memory files"""
+    fd, path = tempfile.mkstemp(suffix='.db')
+    os.close(fd)
+    yield path
+    for suffix in ('', '-wal', '-shm'):
+        if os.path.exists(path + suffix):
+            os.unlink(path + suffix)
+
+
+@pytest.fixture
+def temp_db(temp_db_path):
+    """Database on a temporary SQLite file; its connections are closed before the files go"""
+    db = Database(db_url=f'sqlite:///{temp_db_path}')
+    yield db
+    db.close_connections()
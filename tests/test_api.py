@@ -5,18 +5,14 @@ Tests for Flask API endpoints
 """
 import pytest
 import json
-import tempfile
-import os
 from app import app
 from database import Database
 
 
 @pytest.fixture
-def client():
+def client(temp_db_path):
     """Create a test client"""
-    # Create temporary database
-    fd, path = tempfile.mkstemp(suffix='.db')
-    os.close(fd)
+    path = temp_db_path
     
     # Override database URL for testing
     app.config['TESTING'] = True
@@ -25,14 +21,14 @@ def client():
     # Reinitialize database with test DB
     from app import db
     db.db_url = f'sqlite:///{path}'
+    db.clear_cache()
     db.init_database()
     
     with app.test_client() as client:
         yield client
     
-    # Cleanup
-    if os.path.exists(path):
-        os.unlink(path)
+    # Cleanup (temp_db_path removes the files)
+    db.close_connections()
 
 
 @pytest.fixture
@@ -199,6 +195,401 @@ class TestSettingsAPI:
         assert len(data['data']['children']) == 1
 
 
+class TestMenuConditionalGet:
+    """Test ETag / If-None-Match handling on the polled menu endpoints"""
+    
+    def _save_menu(self, week_start, dish='Paella'):
+        from app import db
+        return db.save_weekly_menu(week_start, {'menu_adultos': {'dias': {'lunes': {'comida': {'nombre': dish}}}}})
+    
+    def test_latest_menu_returns_304_when_unchanged(self, client):
+        """Test that a matching If-None-Match gets a bodiless 304"""
+        self._save_menu('2024-01-08')
+        
+        response = client.get('/api/menu/latest')
+        assert response.status_code == 200
+        etag = response.headers['ETag']
+        assert not etag.startswith('W/')
+        assert response.headers['Cache-Control'] == 'no-cache'
+        
+        response = client.get('/api/menu/latest', headers={'If-None-Match': etag})
+        assert response.status_code == 304
+        assert response.data == b''
+        assert response.headers['ETag'] == etag
+    
+    def test_etag_changes_when_menu_is_updated(self, client):
+        """Test that saving or rating the menu invalidates the ETag"""
+        from app import db
+        menu_id = self._save_menu('2024-01-08')
+        etag = client.get('/api/menu/latest').headers['ETag']
+        
+        self._save_menu('2024-01-08', dish='Tortilla')
+        response = client.get('/api/menu/latest', headers={'If-None-Match': etag})
+        assert response.status_code == 200
+        assert json.loads(response.data)['data']['menu_data']['menu_adultos']['dias']['lunes']['comida']['nombre'] == 'Tortilla'
+        
+        etag = response.headers['ETag']
+        db.rate_menu(menu_id, 5)
+        response = client.get('/api/menu/latest', headers={'If-None-Match': etag})
+        assert response.status_code == 200
+        assert response.headers['ETag'] != etag
+    
+    def test_current_week_menu_conditional_get(self, client):
+        """Test ETags on the current-week endpoint, including its latest-menu fallback"""
+        from datetime import datetime, timedelta
+        today = datetime.now()
+        week_start = (today - timedelta(days=today.weekday())).strftime('%Y-%m-%d')
+        
+        response = client.get('/api/menu/current-week')
+        assert response.status_code == 404
+        assert response.headers['Cache-Control'] == 'no-store'
+        
+        self._save_menu('2020-01-06')
+        response = client.get('/api/menu/current-week')
+        assert json.loads(response.data)['is_fallback'] is True
+        fallback_etag = response.headers['ETag']
+        assert client.get('/api/menu/current-week', headers={'If-None-Match': fallback_etag}).status_code == 304
+        
+        self._save_menu(week_start)
+        response = client.get('/api/menu/current-week', headers={'If-None-Match': fallback_etag})
+        assert response.status_code == 200
+        assert json.loads(response.data)['is_fallback'] is False
+        assert response.headers['Cache-Control'] == 'private, no-cache'
+        assert client.get('/api/menu/current-week',
+                          headers={'If-None-Match': response.headers['ETag']}).status_code == 304
+
+
+class TestEventStream:
+    """Test the /api/events Server-Sent Events stream"""
+    
+    def test_stream_sends_change_notifications(self, client, monkeypatch):
+        """Test that events after Last-Event-ID are streamed as SSE messages"""
+        import app as app_module
+        from app import db
+        monkeypatch.setattr(app_module, 'EVENT_STREAM_KEEPALIVE', 0.05)
+        monkeypatch.setattr(app_module, 'EVENT_STREAM_MAX_DURATION', 0.2)
+        
+        last_id = db.get_latest_event_id()
+        menu_id = db.save_weekly_menu('2024-01-08', {'menu_adultos': {}})
+        db.rate_menu_day(menu_id, '2024-01-08', 'martes', 'adultos', 5)
+        
+        response = client.get('/api/events', headers={'Last-Event-ID': str(last_id)}, buffered=True)
+        assert response.status_code == 200
+        assert response.mimetype == 'text/event-stream'
+        body = response.get_data(as_text=True)
+        messages = [m for m in body.split('\n\n') if m.startswith('id:')]
+        assert len(messages) == 2
+        assert 'event: menu_updated' in messages[0]
+        assert 'event: day_rating_changed' in messages[1]
+        data = json.loads(messages[1].split('data: ', 1)[1])
+        assert data['day_name'] == 'martes' and data['rating'] == 5
+    
+    def test_new_subscribers_only_get_new_events(self, client, monkeypatch):
+        """Test that a stream without Last-Event-ID skips the backlog"""
+        import app as app_module
+        from app import db
+        monkeypatch.setattr(app_module, 'EVENT_STREAM_KEEPALIVE', 0.05)
+        monkeypatch.setattr(app_module, 'EVENT_STREAM_MAX_DURATION', 0.1)
+        
+        db.save_weekly_menu('2024-01-08', {})
+        body = client.get('/api/events', buffered=True).get_data(as_text=True)
+        assert 'event:' not in body
+        assert body.startswith('retry:')
+    
+    def test_streams_beyond_the_cap_are_rejected(self, client, monkeypatch):
+        """Test that a process serves a bounded number of streams and frees slots as they close"""
+        import threading
+        import app as app_module
+        monkeypatch.setattr(app_module, 'EVENT_STREAM_MAX_DURATION', 0.1)
+        monkeypatch.setattr(app_module, 'event_stream_slots', threading.BoundedSemaphore(1))
+        
+        first = client.get('/api/events', buffered=False)
+        rejected = client.get('/api/events', buffered=True)
+        assert rejected.status_code == 503
+        assert rejected.headers['Retry-After'] == str(app_module.EVENT_STREAM_RETRY)
+        assert rejected.get_data(as_text=True).startswith('retry:')
+        
+        first.get_data()
+        first.close()
+        assert client.get('/api/events', buffered=True).status_code == 200
+
+
+class TestMenuGenerationJob:
+    """Test that /api/menu/generate queues a job reported by /api/jobs/<id>"""
+    
+    class FakeGenerator:
+        def __init__(self, result):
+            self.result = result
+            self.calls = []
+        
+        def generate_weekly_menu(self, **kwargs):
+            self.calls.append(kwargs)
+            if self.result['success']:
+                for day_name, day_menu in self.result['menu']['menu_adultos']['dias'].items():
+                    kwargs['on_day']('adultos', day_name, day_menu)
+            return dict(self.result)
+        
+        def generate_weekly_menu_parallel(self, **kwargs):
+            return self.generate_weekly_menu(mode='parallel', **kwargs)
+    
+    @pytest.fixture
+    def generator(self, client, monkeypatch, sample_adult):
+        """Fake AI generator; jobs run in the test thread via run_pending()"""
+        import app as app_module
+        fake = self.FakeGenerator({
+            'success': True,
+            'menu': {'menu_adultos': {'dias': {'lunes': {'comida': {'nombre': 'Paella', 'ingredientes': ['arroz']}}}}},
+            'generated_at': '2024-01-08T10:00:00',
+            'raw_response': '{"menu_adultos": {}}'
+        })
+        monkeypatch.setattr(app_module, 'get_menu_generator', lambda: fake)
+        monkeypatch.setattr(app_module.job_queue, 'start', lambda: None)
+        client.post('/api/adults', data=json.dumps(sample_adult), content_type='application/json')
+        return fake
+    
+    def test_generate_returns_job_and_result_is_polled(self, client, generator):
+        """Test that the menu is generated and saved by the job, not the request"""
+        from app import db, job_queue
+        response = client.post('/api/menu/generate', data=json.dumps({'week_start_date': '2024-01-08'}),
+                               content_type='application/json')
+        assert response.status_code == 202
+        data = json.loads(response.data)
+        assert data['status'] == 'queued'
+        assert data['status_url'] == f"/api/jobs/{data['job_id']}"
+        assert generator.calls == []
+        
+        job = json.loads(client.get(data['status_url']).data)['data']
+        assert job['status'] == 'queued' and job['result'] is None
+        
+        start = db.get_latest_event_id()
+        assert job_queue.run_pending() == 1
+        streamed = [e['data'] for e in db.get_events_since(start) if e['event_type'] == 'menu_day_generated']
+        assert streamed == [{'job_id': data['job_id'], 'week_start': '2024-01-08', 'menu_type': 'adultos',
+                             'day_name': 'lunes',
+                             'day_menu': {'comida': {'nombre': 'Paella', 'ingredientes': ['arroz']}}}]
+        response = client.get(data['status_url'])
+        assert response.headers['Cache-Control'] == 'no-store'
+        job = json.loads(response.data)['data']
+        assert job['status'] == 'succeeded'
+        assert job['result']['week_start'] == '2024-01-08'
+        assert 'raw_response' not in job['result']
+        assert db.get_menu_by_week_start('2024-01-08')['id'] == job['result']['menu_id']
+        assert db.get_menu_raw_response(job['result']['menu_id']) == '{"menu_adultos": {}}'
+    
+    def test_failed_generation_marks_job_failed(self, client, generator):
+        """Test that a generator failure is reported on the job"""
+        from app import job_queue
+        generator.result = {'success': False, 'error': 'Respuesta vacía'}
+        data = json.loads(client.post('/api/menu/generate', data=json.dumps({}),
+                                      content_type='application/json').data)
+        job_queue.run_pending()
+        
+        job = json.loads(client.get(data['status_url']).data)['data']
+        assert job['status'] == 'failed'
+        assert job['error'] == 'Respuesta vacía'
+    
+    def test_invalid_requests_are_rejected_before_queueing(self, client, generator):
+        """Test that validation errors still fail the request itself"""
+        from app import job_queue
+        response = client.post('/api/menu/generate', data=json.dumps({'week_start_date': '08/01/2024'}),
+                               content_type='application/json')
+        assert response.status_code == 400
+        assert job_queue.run_pending() == 0
+        assert client.get('/api/jobs/999').status_code == 404
+    
+    def test_generation_mode_is_selectable(self, client, generator):
+        """Test that mode=parallel uses the fan-out engine and unknown modes are rejected"""
+        from app import db, job_queue
+        response = client.post('/api/menu/generate', data=json.dumps({'week_start_date': '2024-01-08', 'mode': 'fast'}),
+                               content_type='application/json')
+        assert response.status_code == 400
+        
+        client.post('/api/menu/generate', data=json.dumps({'week_start_date': '2024-01-08', 'mode': 'parallel'}),
+                    content_type='application/json')
+        job_queue.run_pending()
+        assert generator.calls[-1]['mode'] == 'parallel'
+        assert db.get_menu_by_week_start('2024-01-08')['metadata']['generation_mode'] == 'parallel'
+
+
+class TestBatchRecipeExtraction:
+    """Test concurrent batch recipe import"""
+    
+    @pytest.fixture
+    def slow_pages(self, monkeypatch):
+        """Fake extractor: each URL takes 0.2 s, '/bad' URLs fail"""
+        from app import extractor
+        import time
+        
+        def extract_from_url(url):
+            time.sleep(0.2)
+            if url.endswith('/bad'):
+                return {'error': 'No se pudo extraer la receta', 'url': url, 'success': False}
+            return {'title': f'Receta {url[-1]}', 'url': url, 'ingredients': ['sal']}
+        monkeypatch.setattr(extractor, 'extract_from_url', extract_from_url)
+        monkeypatch.setattr(extractor, 'max_workers', 8)
+        return [f'https://site{i}.example/r{i}' for i in range(6)] + ['https://site0.example/bad']
+    
+    def test_batch_fetches_concurrently_in_input_order(self, client, slow_pages):
+        """Test that the JSON response keeps URL order and takes about one page's time"""
+        import time
+        started = time.monotonic()
+        response = client.post('/api/recipes/batch', json={'urls': slow_pages})
+        elapsed = time.monotonic() - started
+        
+        data = json.loads(response.data)
+        assert data['message'].startswith('6/7')
+        assert [r['url'] for r in data['data']] == slow_pages
+        assert all(r.get('id') for r in data['data'][:6]) and data['data'][6]['error']
+        assert elapsed < 0.2 * 3
+        assert len(json.loads(client.get('/api/recipes').data)['data']) == 6
+    
+    def test_batch_streams_ndjson(self, client, slow_pages):
+        """Test one line per recipe and a final summary line"""
+        response = client.post('/api/recipes/batch', json={'urls': slow_pages},
+                               headers={'Accept': 'application/x-ndjson'})
+        assert response.mimetype == 'application/x-ndjson'
+        lines = [json.loads(line) for line in response.data.decode().splitlines()]
+        assert sorted(line['index'] for line in lines[:-1]) == list(range(7))
+        assert lines[-1]['done'] and lines[-1]['message'].startswith('6/7')
+
+
+class TestRecipeImportJobs:
+    """Test queued recipe imports, their stage rows and retries"""
+    
+    PAGE = '<html><head><title>Receta</title></head><body><h1>Lentejas</h1></body></html>'
+    
+    @pytest.fixture
+    def pages(self, client, monkeypatch):
+        """Fake fetches: '/flaky' fails twice with a connection error, '/gone' is a 404"""
+        import app as app_module
+        import requests
+        from types import SimpleNamespace
+        calls = []
+        
+        def fetch_page(url):
+            calls.append(url)
+            if url.endswith('/flaky') and calls.count(url) <= 2:
+                raise requests.ConnectionError('Connection reset')
+            if url.endswith('/gone'):
+                raise requests.HTTPError('404 Not Found', response=SimpleNamespace(status_code=404, headers={}))
+            return SimpleNamespace(content=self.PAGE.encode())
+        monkeypatch.setattr(app_module.extractor, 'fetch_page', fetch_page)
+        monkeypatch.setattr(app_module.import_queue, 'start', lambda: None)
+        monkeypatch.setattr(app_module, 'RECIPE_IMPORT_BACKOFF', 0)
+        return calls
+    
+    def test_imports_are_queued_and_report_stages(self, client, pages):
+        """Test that the request only queues jobs and progress shows fetch/parse/save"""
+        from app import import_queue
+        response = client.post('/api/recipes/extract?async=1', json={'urls': ['https://a.example/flaky', 'https://b.example/gone']})
+        assert response.status_code == 202
+        data = json.loads(response.data)
+        assert pages == [] and len(data['jobs']) == 2
+        
+        progress = json.loads(client.get(data['progress_url']).data)['data']
+        assert progress['finished'] == 0 and progress['progress'] == 0
+        assert [stage['status'] for stage in progress['jobs'][0]['stages']] == ['pending'] * 3
+        
+        assert import_queue.run_pending() == 2
+        progress = json.loads(client.get(data['progress_url']).data)['data']
+        flaky, gone = progress['jobs']
+        assert (progress['finished'], progress['succeeded'], progress['failed'], progress['progress']) == (2, 1, 1, 1.0)
+        
+        assert flaky['url'] == 'https://a.example/flaky' and flaky['status'] == 'succeeded'
+        assert [(s['stage'], s['status']) for s in flaky['stages']] == [
+            ('fetch', 'succeeded'), ('parse', 'succeeded'), ('save', 'succeeded')]
+        assert flaky['stages'][0]['attempts'] == 3
+        assert flaky['result']['data']['title'] == 'Lentejas'
+        assert 'extracted_text' not in flaky['result']['data']
+        
+        # A 404 is not retried and the later stages never run
+        assert gone['status'] == 'failed' and '404' in gone['error']
+        assert [(s['status'], s['attempts']) for s in gone['stages']] == [('failed', 1), ('pending', 0), ('pending', 0)]
+        assert pages.count('https://b.example/gone') == 1
+        
+        recipes = json.loads(client.get('/api/recipes').data)['data']
+        assert [r['id'] for r in recipes] == [flaky['result']['data']['id']]
+    
+    def test_extract_without_async_returns_the_recipe(self, client, pages):
+        """Test that clients that do not opt in still get the saved recipe in the response"""
+        from app import db
+        response = client.post('/api/recipes/extract', json={'url': 'https://a.example/r'})
+        assert response.status_code == 200
+        data = json.loads(response.data)
+        assert data['success'] and data['data']['title'] == 'Lentejas'
+        assert db.get_recipes_by_ids([data['data']['id']])[0]['title'] == 'Lentejas'
+        assert db.get_job(1) is None
+        
+        response = client.post('/api/recipes/extract', json={'url': 'https://b.example/gone'})
+        assert response.status_code == 400 and '404' in json.loads(response.data)['error']
+        assert client.post('/api/recipes/extract', json={'urls': ['https://a.example/r']}).status_code == 400
+    
+    def test_prefer_respond_async_queues_the_import(self, client, pages):
+        """Test that Prefer: respond-async selects the job-based contract"""
+        response = client.post('/api/recipes/extract', json={'url': 'https://a.example/r'},
+                               headers={'Prefer': 'wait=5, respond-async'})
+        assert response.status_code == 202
+        assert response.headers['Preference-Applied'] == 'respond-async'
+        assert json.loads(response.data)['status'] == 'queued' and pages == []
+    
+    def test_retries_stop_after_the_last_attempt(self, client, pages, monkeypatch):
+        """Test that a site that keeps failing is given up after RECIPE_IMPORT_ATTEMPTS"""
+        import app as app_module
+        from app import import_queue
+        monkeypatch.setattr(app_module, 'RECIPE_IMPORT_ATTEMPTS', 2)
+        data = json.loads(client.post('/api/recipes/extract?async=1', json={'url': 'https://a.example/flaky'}).data)
+        import_queue.run_pending()
+        
+        job = json.loads(client.get(data['progress_url']).data)['data']['jobs'][0]
+        assert job['status'] == 'failed'
+        assert job['stages'][0]['status'] == 'failed' and job['stages'][0]['attempts'] == 2
+        assert 'Connection reset' in job['error']
+        assert client.post('/api/recipes/extract?async=1', json={}).status_code == 400
+        assert client.post('/api/recipes/extract?async=1', data='no es json', content_type='text/plain').status_code == 400
+    
+    def test_queueing_failures_are_server_errors(self, client, pages, monkeypatch):
+        """Test that a database error while queueing is a 500, not a client error"""
+        from app import db
+        
+        def create_job(job_type, payload=None):
+            raise RuntimeError('database is locked')
+        monkeypatch.setattr(db, 'create_job', create_job)
+        response = client.post('/api/recipes/extract?async=1', json={'url': 'https://a.example/r'})
+        assert response.status_code == 500
+        assert 'database is locked' in json.loads(response.data)['error']
+    
+    def test_parse_errors_fail_the_parse_stage(self, client, pages, monkeypatch):
+        """Test that an exception while parsing is recorded on the parse stage, not left running"""
+        import app as app_module
+        from app import import_queue
+        
+        def extract_from_response(url, response):
+            raise ValueError('Document is empty')
+        monkeypatch.setattr(app_module.extractor, 'extract_from_response', extract_from_response)
+        data = json.loads(client.post('/api/recipes/extract?async=1', json={'url': 'https://a.example/r'}).data)
+        import_queue.run_pending()
+        
+        job = json.loads(client.get(data['progress_url']).data)['data']['jobs'][0]
+        assert job['status'] == 'failed' and 'Document is empty' in job['error']
+        assert [(s['stage'], s['status']) for s in job['stages']] == [
+            ('fetch', 'succeeded'), ('parse', 'failed'), ('save', 'pending')]
+        assert job['stages'][1]['error'] == 'Document is empty'
+    
+    def test_retry_delay_backs_off_and_honours_retry_after(self):
+        """Test exponential backoff, Retry-After and the transient-error check"""
+        import requests
+        from types import SimpleNamespace
+        from recipe_extractor import MAX_RETRY_DELAY, is_transient_error, retry_delay
+        
+        def http_error(status, headers=None):
+            return requests.HTTPError(str(status), response=SimpleNamespace(status_code=status, headers=headers or {}))
+        
+        assert [retry_delay(requests.Timeout(), attempt, 2) for attempt in (1, 2, 3)] == [2, 4, 8]
+        assert retry_delay(http_error(429, {'Retry-After': '30'}), 1, 2) == 30
+        assert retry_delay(http_error(503), 10, 2) == MAX_RETRY_DELAY
+        assert is_transient_error(http_error(503)) and is_transient_error(requests.ConnectionError())
+        assert not is_transient_error(http_error(404)) and not is_transient_error(ValueError())
+
 class TestHealthCheck:
     """Test health check endpoint"""
     
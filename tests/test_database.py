@@ -4,39 +4,30 @@
 Tests for database operations
 """
 import pytest
+import json
 import sqlite3
 import os
-import tempfile
-from database import Database
-
-
-@pytest.fixture
-def temp_db():
-    """Create a temporary database for testing"""
-    fd, path = tempfile.mkstemp(suffix='.db')
-    os.close(fd)
-    db_url = f'sqlite:///{path}'
-    db = Database(db_url=db_url)
-    yield db, path
-    # Cleanup
-    if os.path.exists(path):
-        os.unlink(path)
+import threading
+import time
+from unittest.mock import MagicMock
+from database import Database, MonitoredConnectionPool, compile_sql, normalize_title
+from models import Adult, Recipe
 
 
 class TestDatabase:
     """Test database initialization and operations"""
     
-    def test_database_initialization(self, temp_db):
+    def test_database_initialization(self, temp_db, temp_db_path):
         """Test that database initializes correctly"""
-        db, path = temp_db
+        db, path = temp_db, temp_db_path
         assert db is not None
         assert os.path.exists(path)
         assert db.db_url == f'sqlite:///{path}'
         assert db.is_postgres == False
     
-    def test_tables_created(self, temp_db):
+    def test_tables_created(self, temp_db, temp_db_path):
         """Test that all required tables are created"""
-        db, path = temp_db
+        db, path = temp_db, temp_db_path
         conn = sqlite3.connect(path)
         cursor = conn.cursor()
         
@@ -51,7 +42,7 @@ class TestDatabase:
     
     def test_add_adult(self, temp_db):
         """Test adding an adult profile"""
-        db, path = temp_db
+        db = temp_db
         adult_data = {
             'nombre': 'Test Adult',
             'edad': 30,
@@ -86,7 +77,7 @@ class TestDatabase:
     
     def test_add_child(self, temp_db):
         """Test adding a child profile"""
-        db, path = temp_db
+        db = temp_db
         child_data = {
             'nombre': 'Test Child',
             'edad': 8,
@@ -120,7 +111,7 @@ class TestDatabase:
     
     def test_delete_adult(self, temp_db):
         """Test deleting an adult profile"""
-        db, path = temp_db
+        db = temp_db
         adult_data = {
             'nombre': 'Test Adult',
             'edad': 30,
@@ -137,7 +128,7 @@ class TestDatabase:
     
     def test_get_menu_preferences(self, temp_db):
         """Test getting menu preferences"""
-        db, path = temp_db
+        db = temp_db
         prefs = db.get_menu_preferences()
         
         assert 'include_weekend' in prefs
@@ -149,7 +140,7 @@ class TestDatabase:
     
     def test_save_menu_preferences(self, temp_db):
         """Test saving menu preferences"""
-        db, path = temp_db
+        db = temp_db
         prefs = {
             'include_weekend': False,
             'include_breakfast': True,
@@ -165,6 +156,572 @@ class TestDatabase:
         assert saved_prefs['include_weekend'] == False
         assert saved_prefs['include_dinner'] == False
         assert 'Monday' in saved_prefs['excluded_days']
+    
+    
+    def test_sqlite_connection_is_reused(self, temp_db):
+        """Test that SQLite connections persist per thread in WAL mode"""
+        db = temp_db
+        conn = db.get_connection()
+        journal_mode = conn.execute('PRAGMA journal_mode').fetchone()[0]
+        db._close_connection(conn)
+        
+        assert journal_mode == 'wal'
+        assert db.get_connection() is conn
+        db._close_connection(conn)
+    
+    def test_released_connection_discards_uncommitted_work(self, temp_db):
+        """Test that returning a connection rolls back uncommitted changes"""
+        db = temp_db
+        conn = db.get_connection()
+        conn.execute("INSERT INTO adults (nombre) VALUES ('Uncommitted')")
+        db._close_connection(conn)
+        
+        assert db.get_all_adults() == []
+    
+    def test_closed_connection_is_replaced(self, temp_db):
+        """Test that a pooled connection closed by a caller is reopened"""
+        db = temp_db
+        conn = db.get_connection()
+        db._close_connection(conn)
+        conn.close()
+        
+        assert db.get_all_adults() == []
+    
+    
+    def test_transaction_commits_all_work_at_once(self, temp_db, temp_db_path):
+        """Test that methods called inside a transaction share its commit"""
+        db, path = temp_db, temp_db_path
+        with db.transaction():
+            db.add_adult({'nombre': 'Ana', 'edad': 40})
+            db.add_child({'nombre': 'Leo', 'edad': 6})
+            # Not visible to other connections until the unit of work commits
+            other = sqlite3.connect(path)
+            assert other.execute('SELECT COUNT(*) FROM adults').fetchone()[0] == 0
+            other.close()
+        
+        assert len(db.get_all_adults()) == 1
+        assert len(db.get_all_children()) == 1
+    
+    def test_transaction_rolls_back_on_error(self, temp_db):
+        """Test that an exception undoes every write in the unit of work"""
+        db = temp_db
+        with pytest.raises(RuntimeError):
+            with db.transaction():
+                db.add_adult({'nombre': 'Ana', 'edad': 40})
+                raise RuntimeError('boom')
+        
+        assert db.get_all_adults() == []
+    
+    def test_savepoint_only_undoes_inner_block(self, temp_db):
+        """Test that a failing savepoint keeps the outer transaction's work"""
+        db = temp_db
+        with db.transaction():
+            db.add_adult({'nombre': 'Ana', 'edad': 40})
+            with pytest.raises(RuntimeError):
+                with db.transaction(savepoint=True):
+                    db.add_child({'nombre': 'Leo', 'edad': 6})
+                    raise RuntimeError('boom')
+        
+        assert len(db.get_all_adults()) == 1
+        assert db.get_all_children() == []
+    
+    
+    def test_extract_and_save_recipes_from_menu(self, temp_db):
+        """Test that menu recipes are matched case-insensitively and new ones inserted once"""
+        db = temp_db
+        existing_id = db.add_recipe({'title': 'Paella Valenciana', 'ingredients': ['arroz']})
+        menu_data = {
+            'menu_adultos': {'dias': {
+                'lunes': {
+                    'comida': {'receta_base': 'paella valenciana'},
+                    'cena': {'receta_base': 'Crema de calabaza', 'ingredientes': ['calabaza']},
+                },
+                'martes': {
+                    'comida': {'receta_base': 'Original'},
+                    'cena': {'receta_base': 'CREMA DE CALABAZA'},
+                },
+            }},
+            'menu_ninos': {'dias': {
+                'lunes': {'comida': {'receta_base': 'Macarrones con tomate'}},
+            }},
+        }
+        
+        recipe_ids = db.extract_and_save_recipes_from_menu(menu_data)
+        
+        recipes = {r['title']: r for r in db.get_all_recipes()}
+        assert len(recipes) == 3
+        crema_id = recipes['Crema de calabaza']['id']
+        assert recipe_ids == [existing_id, crema_id, crema_id, recipes['Macarrones con tomate']['id']]
+        assert recipes['Crema de calabaza']['ingredients'] == ['calabaza']
+        assert recipes['Crema de calabaza']['extracted_data']['day'] == 'lunes'
+        
+        # Running it again only resolves, never duplicates
+        assert db.extract_and_save_recipes_from_menu(menu_data) == recipe_ids
+        assert len(db.get_all_recipes()) == 3
+    
+    def test_find_recipe_by_normalized_title(self, temp_db):
+        """Test that title lookups ignore case, accents and extra whitespace"""
+        db = temp_db
+        recipe_id = db.add_recipe({'title': 'Crème Brûlée  de  Café'})
+        
+        assert normalize_title('  CREME brulee de cafe ') == 'creme brulee de cafe'
+        assert db._find_recipe_by_title('creme brulee de CAFE')['id'] == recipe_id
+        assert db._find_recipe_by_title('Tarta de queso') is None
+    
+    def test_title_key_backfilled_for_existing_recipes(self, temp_db_path):
+        """Test that init_database adds and backfills title_key on an old schema"""
+        path = temp_db_path
+        conn = sqlite3.connect(path)
+        conn.execute('CREATE TABLE recipes (id INTEGER PRIMARY KEY AUTOINCREMENT, title TEXT NOT NULL, '
+                     "ingredients TEXT DEFAULT '[]', extracted_data TEXT DEFAULT '{}')")
+        conn.execute("INSERT INTO recipes (title) VALUES ('Tortilla Española')")
+        conn.commit()
+        conn.close()
+        
+        db = Database(db_url=f'sqlite:///{path}')
+        try:
+            assert db._find_recipe_by_title('tortilla espanola')['title'] == 'Tortilla Española'
+            indexes = [row[1] for row in db.get_connection().execute('PRAGMA index_list(recipes)')]
+            assert 'idx_recipes_title_key' in indexes
+        finally:
+            db.close_connections()
+    
+    def test_index_migrations_are_versioned(self, temp_db):
+        """Test that index migrations are recorded once and deferred until their table exists"""
+        db = temp_db
+        conn = db.get_connection()
+        versions = [row[0] for row in conn.execute('SELECT version FROM schema_migrations ORDER BY version')]
+        indexes = [row[0] for row in conn.execute("SELECT name FROM sqlite_master WHERE type = 'index'")]
+        db._close_connection(conn)
+        
+        assert versions == [1, 2, 4, 5, 6, 7]
+        assert 'idx_weekly_menus_created_at' in indexes
+        assert 'idx_menu_day_ratings_created_at' in indexes
+        
+        with db.transaction() as conn:
+            conn.execute('CREATE TABLE cleaning_assignments (id INTEGER PRIMARY KEY, dia_semana TEXT, '
+                         'week_start DATE, fecha_especifica DATE)')
+        db.init_database()
+        
+        conn = db.get_connection()
+        versions = [row[0] for row in conn.execute('SELECT version FROM schema_migrations ORDER BY version')]
+        db._close_connection(conn)
+        assert versions == [1, 2, 3, 4, 5, 6, 7]
+    
+    def test_get_all_menus_summary_and_lazy_decoding(self, temp_db):
+        """Test that menu listings can skip or defer JSON decoding"""
+        db = temp_db
+        db.save_weekly_menu('2024-01-08', {'menu_adultos': {'dias': {}}}, {'raw_response': 'x' * 1000})
+        db.save_weekly_menu('2024-01-15', {'menu_ninos': {'dias': {}}})
+        
+        summaries = db.get_all_menus(summary=True)
+        assert [m['week_start_date'] for m in summaries] == ['2024-01-15', '2024-01-08']
+        assert set(summaries[0]) == {'id', 'week_start_date', 'rating', 'created_at'}
+        
+        menus = db.get_all_menus()
+        assert menus[1]._pending == {'menu_data', 'metadata'}
+        assert menus[1]['menu_data'] == {'menu_adultos': {'dias': {}}}
+        assert menus[1]._pending == {'metadata'}
+        assert json.loads(json.dumps(menus[1]))['metadata'] == {'has_raw_response': True}
+    
+    def test_raw_response_stored_compressed_outside_metadata(self, temp_db):
+        """Test that raw LLM responses live in menu_raw_responses, not in metadata"""
+        db = temp_db
+        raw_response = '{"menu_adultos": {}} ' * 2000
+        menu_id = db.save_weekly_menu('2024-01-08', {'menu_adultos': {}}, {'raw_response': raw_response})
+        
+        menu = db.get_latest_menu()
+        assert 'raw_response' not in menu['metadata']
+        assert menu['metadata']['has_raw_response'] is True
+        assert db.get_menu_raw_response(menu_id) == raw_response
+        
+        conn = db.get_connection()
+        stored_size = len(conn.execute('SELECT data FROM menu_raw_responses').fetchone()[0])
+        db._close_connection(conn)
+        assert stored_size < len(raw_response) / 10
+        
+        # Re-saving without a raw response (e.g. meal regeneration) keeps the stored one
+        db.save_weekly_menu('2024-01-08', {'menu_adultos': {'dias': {}}}, menu['metadata'])
+        assert db.get_menu_raw_response(menu_id) == raw_response
+    
+    def test_existing_raw_responses_are_migrated(self, temp_db):
+        """Test that raw_response embedded in old metadata is moved to the side table"""
+        db = temp_db
+        with db.transaction() as conn:
+            conn.execute("INSERT INTO weekly_menus (week_start_date, menu_data, metadata) VALUES (?, ?, ?)",
+                         ('2023-05-01', '{}', json.dumps({'raw_response': 'respuesta', 'generated_at': 'x'})))
+            conn.execute('DELETE FROM schema_migrations WHERE version = 4')
+        db.init_database()
+        
+        menu = db.get_menu_by_week_start('2023-05-01')
+        assert menu['metadata'] == {'generated_at': 'x', 'has_raw_response': True}
+        assert db.get_menu_raw_response(menu['id']) == 'respuesta'
+    
+    def test_rows_are_mapped_without_row_objects(self, temp_db):
+        """Test that listing queries map rows straight into dicts or models"""
+        db = temp_db
+        db.add_recipe({'title': 'Tortilla', 'ingredients': ['huevos'], 'extracted_data': {'a': 1}})
+        menu_id = db.save_weekly_menu('2024-01-08', {'menu_adultos': {}})
+        assert db.rate_menu_day(menu_id, '2024-01-08', 'lunes', 'adultos', 3)
+        assert db.rate_menu_day(menu_id, '2024-01-08', 'lunes', 'adultos', 5)
+        
+        recipes = db.get_all_recipes()
+        assert isinstance(recipes[0], Recipe)
+        assert recipes[0]['ingredients'] == ['huevos']
+        assert recipes[0]['extracted_data'] == {'a': 1}
+        
+        ratings = db.get_all_menu_ratings()
+        assert len(ratings) == 1
+        assert type(ratings[0]) is dict
+        assert ratings[0]['rating'] == 5
+        assert ratings[0]['menu_data'] == {'menu_adultos': {}}
+        assert db.get_menu_day_rating(menu_id, 'lunes', 'adultos') == 5
+    
+    
+    def test_profiles_and_recipes_are_slotted_models(self, temp_db):
+        """Test that adults/children/recipes come back as compact models with dict-style access"""
+        db = temp_db
+        db.add_adult({'nombre': 'Ana', 'edad': 40, 'alergias': 'nueces'})
+        db.add_child({'nombre': 'Leo', 'edad': 8})
+        db.add_recipe({'title': 'Paella', 'ingredients': ['arroz']})
+        
+        adult = db.get_all_adults()[0]
+        assert isinstance(adult, Adult)
+        assert not hasattr(adult, '__dict__')
+        assert adult.alergias == adult['alergias'] == adult.get('alergias') == 'nueces'
+        assert adult.get('comentarios', 'x') is None
+        assert adult.get('missing', 'x') == 'x'
+        
+        child = db.get_all_children()[0]
+        assert child.to_json()['nombre'] == 'Leo'
+        assert json.loads(json.dumps(child.to_json()))['edad'] == 8
+        
+        recipe = db._find_recipe_by_title('paella')
+        assert recipe.ingredients == ['arroz']
+        assert recipe.to_json()['title'] == 'Paella'
+    
+    def test_unknown_columns_are_kept_in_extra(self):
+        """Test that columns added outside the model survive a round trip"""
+        adult = Adult.from_row([('id', 1), ('nombre', 'Ana'), ('apodo', 'Anita')])
+        assert adult['apodo'] == 'Anita'
+        assert 'apodo' in adult
+        assert adult.to_json()['apodo'] == 'Anita'
+        assert dict(adult)['nombre'] == 'Ana'
+    
+    def test_models_are_full_mappings(self, temp_db):
+        """Test iteration, items(), values() and dict() like the old row dicts, and that to_json() hides internal columns"""
+        db = temp_db
+        db.add_recipe({'title': 'Paella Valenciana', 'ingredients': ['arroz']})
+        recipe = db.get_all_recipes()[0]
+        
+        assert 'title' in list(recipe) and len(recipe) == len(list(recipe))
+        assert dict(recipe.items())['title'] == 'Paella Valenciana'
+        assert ['arroz'] in list(recipe.values())
+        assert {**recipe}['title_key'] == recipe['title_key'] == 'paella valenciana'
+        assert 'title_key' not in recipe.to_json()
+        assert list(Adult(nombre='Ana').items())[:2] == [('id', None), ('nombre', 'Ana')]
+    
+    
+    def test_profile_reads_are_cached_until_a_write(self, temp_db, monkeypatch):
+        """Test that profile reads are memory lookups and writes invalidate them"""
+        db = temp_db
+        adult_id = db.add_adult({'nombre': 'Ana', 'edad': 40})
+        db.add_child({'nombre': 'Leo', 'edad': 8})
+        assert [a.nombre for a in db.get_all_adults()] == ['Ana']
+        assert [c.nombre for c in db.get_all_children()] == ['Leo']
+        
+        queries = []
+        fetch_all = db._fetch_all
+        monkeypatch.setattr(db, '_fetch_all', lambda sql, *args, **kwargs: queries.append(sql) or fetch_all(sql, *args, **kwargs))
+        db.profile_cache_check_interval = 60
+        for _ in range(5):
+            assert db.get_all_adults()[0].nombre == 'Ana'
+            db.get_all_children()
+        assert queries == []
+        
+        assert db.update_adult(adult_id, {'nombre': 'Ana María', 'id': 99, 'no_existe': 'x'})
+        assert db.get_all_adults()[0].nombre == 'Ana María'
+        assert db.get_all_adults()[0].id == adult_id
+        assert not db.update_adult(adult_id + 100, {'nombre': 'Nadie'})
+        
+        db.add_adult({'nombre': 'Bruno', 'edad': 41})
+        assert len(db.get_all_adults()) == 2
+        assert db.delete_adult(adult_id)
+        assert [a.nombre for a in db.get_all_adults()] == ['Bruno']
+    
+    def test_profile_cache_is_consistent_across_workers(self, temp_db, temp_db_path):
+        """Test that a write from another process is picked up through the generation counter"""
+        db, path = temp_db, temp_db_path
+        other_worker = Database(db_url=f'sqlite:///{path}')
+        try:
+            child_id = db.add_child({'nombre': 'Leo', 'edad': 8})
+            db.profile_cache_check_interval = 60
+            assert db.get_all_children()[0].edad == 8
+            
+            assert other_worker.update_child(child_id, {'edad': 9})
+            assert db.get_all_children()[0].edad == 8  # within the check interval
+            
+            db.profile_cache_check_interval = 0
+            assert db.get_all_children()[0].edad == 9
+        finally:
+            other_worker.close_connections()
+    
+    def test_reads_inside_a_transaction_bypass_the_profile_cache(self, temp_db):
+        """Test that uncommitted profile changes are visible to their own transaction only"""
+        db = temp_db
+        db.profile_cache_check_interval = 60
+        assert db.get_all_adults() == []
+        
+        with pytest.raises(RuntimeError):
+            with db.transaction():
+                db.add_adult({'nombre': 'Ana'})
+                assert len(db.get_all_adults()) == 1
+                raise RuntimeError('rollback')
+        
+        db.profile_cache_check_interval = 0
+        assert db.get_all_adults() == []
+    
+    
+    def test_changes_publish_events(self, temp_db):
+        """Test that menu saves, day ratings and cleaning completion record change events"""
+        db = temp_db
+        start = db.get_latest_event_id()
+        menu_id = db.save_weekly_menu('2024-01-08', {'menu_adultos': {}})
+        db.rate_menu_day(menu_id, '2024-01-08', 'lunes', 'ninos', 4)
+        with db.transaction() as conn:
+            conn.execute('CREATE TABLE cleaning_assignments (id INTEGER PRIMARY KEY, completado BOOLEAN, notas TEXT)')
+            conn.execute('INSERT INTO cleaning_assignments (id, completado) VALUES (7, 0)')
+        assert db.update_assignment_completion(7, True, 'hecho')
+        assert not db.update_assignment_completion(8, True)
+        
+        events = db.get_events_since(start)
+        assert [e['event_type'] for e in events] == ['menu_updated', 'day_rating_changed', 'cleaning_assignment_updated']
+        assert events[0]['data'] == {'menu_id': menu_id, 'week_start_date': '2024-01-08'}
+        assert events[1]['data']['rating'] == 4
+        assert events[2]['data'] == {'assignment_id': 7, 'completado': True}
+        assert db.get_latest_event_id() == events[-1]['id']
+        assert db.get_events_since(events[-1]['id']) == []
+    
+    def test_events_are_only_published_on_commit(self, temp_db):
+        """Test that a rolled back change does not leave a notification behind"""
+        db = temp_db
+        start = db.get_latest_event_id()
+        with pytest.raises(RuntimeError):
+            with db.transaction():
+                db.save_weekly_menu('2024-01-08', {})
+                raise RuntimeError('rollback')
+        assert db.get_events_since(start) == []
+    
+    def test_wait_for_events_wakes_on_commit(self, temp_db):
+        """Test that a waiting stream is woken as soon as an event is committed in-process"""
+        db = temp_db
+        start = db.get_latest_event_id()
+        timer = threading.Timer(0.1, db.publish_event, args=('menu_regenerated', {'day_name': 'lunes'}))
+        timer.start()
+        try:
+            events = db.wait_for_events(start, timeout=5)
+        finally:
+            timer.join()
+            db.close_connections()
+        assert [e['data'] for e in events] == [{'day_name': 'lunes'}]
+    
+    def test_event_poller_sees_other_workers(self, temp_db, monkeypatch):
+        """Test that one poller thread wakes waiting streams for events committed by another process"""
+        import database
+        monkeypatch.setattr(database, 'EVENT_POLL_INTERVAL', 0.05)
+        db = temp_db
+        other = Database(db_url=db.db_url)
+        start = db.get_latest_event_id()
+        timer = threading.Timer(0.2, other.publish_event, args=('menu_regenerated', {'day_name': 'martes'}))
+        timer.start()
+        try:
+            events = db.wait_for_events(start, timeout=5)
+        finally:
+            timer.join()
+            other.close_connections()
+            db.close_connections()
+        assert [e['data'] for e in events] == [{'day_name': 'martes'}]
+    
+    def test_job_lifecycle(self, temp_db):
+        """Test that a job is claimed by exactly one worker and its outcome recorded"""
+        db = temp_db
+        job_id = db.create_job('generate_menu', {'week_start': '2024-01-08'})
+        db.create_job('other', {})
+        
+        job = db.claim_next_job(['generate_menu'])
+        assert job['id'] == job_id and job['status'] == 'running'
+        assert job['payload'] == {'week_start': '2024-01-08'} and job['attempts'] == 1
+        assert db.claim_next_job(['generate_menu']) is None
+        
+        start = db.get_latest_event_id()
+        assert db.finish_job(job_id, 'succeeded', {'menu_id': 3})
+        assert not db.finish_job(job_id, 'failed', error='late')
+        job = db.get_job(job_id)
+        assert job['status'] == 'succeeded' and job['result'] == {'menu_id': 3}
+        assert job['finished_at'] is not None and 'payload' not in job
+        assert [e['data'] for e in db.get_events_since(start)] == [{'job_id': job_id, 'status': 'succeeded'}]
+    
+    def test_stale_running_jobs_are_failed(self, temp_db):
+        """Test that jobs orphaned by a dead worker are failed after max_runtime"""
+        db = temp_db
+        job_id = db.create_job('generate_menu')
+        db.claim_next_job(['generate_menu'])
+        assert db.fail_stale_jobs(['generate_menu'], max_runtime=600) == 0
+        
+        with db.transaction() as conn:
+            conn.execute("UPDATE jobs SET started_at = '2000-01-01 00:00:00' WHERE id = ?", (job_id,))
+        assert db.fail_stale_jobs(['generate_menu'], max_runtime=600) == 1
+        job = db.get_job(job_id)
+        assert job['status'] == 'failed' and job['error']
+    
+    def test_job_queue_records_handler_outcomes(self, temp_db):
+        """Test that handler results, {'success': False} and exceptions map to job statuses"""
+        from job_queue import JobQueue
+        db = temp_db
+        queue = JobQueue(db, workers=0)
+        
+        def handler(job_id, payload):
+            if payload.get('raise'):
+                raise RuntimeError('boom')
+            return {'success': payload['ok'], 'error': None if payload['ok'] else 'no'}
+        queue.register('task', handler)
+        
+        ok = queue.submit('task', {'ok': True})
+        refused = queue.submit('task', {'ok': False})
+        crashed = queue.submit('task', {'raise': True})
+        assert queue.run_pending() == 3
+        assert db.get_job(ok)['status'] == 'succeeded'
+        assert (db.get_job(refused)['status'], db.get_job(refused)['error']) == ('failed', 'no')
+        assert (db.get_job(crashed)['status'], db.get_job(crashed)['error']) == ('failed', 'boom')
+        with pytest.raises(ValueError):
+            queue.submit('unknown')
+    
+    def test_started_queue_drains_leftover_jobs(self, temp_db):
+        """Test that a fresh queue runs jobs queued before it existed without a submit()"""
+        from job_queue import JobQueue
+        db = temp_db
+        job_id = db.create_job('task', {'n': 2})
+        queue = JobQueue(db, workers=1, poll_interval=0.05)
+        queue.register('task', lambda job_id, payload: {'double': payload['n'] * 2})
+        queue.start()
+        try:
+            deadline = time.monotonic() + 5
+            while db.get_job(job_id)['status'] != 'succeeded' and time.monotonic() < deadline:
+                time.sleep(0.02)
+        finally:
+            queue.stop()
+        assert db.get_job(job_id)['result'] == {'double': 4}
+    
+    def test_llm_cache_ttl_and_lru_eviction(self, temp_db):
+        """Test that cached LLM results expire and the least recently used are evicted"""
+        db = temp_db
+        db.save_llm_response('a', 'model', {'menu': {'x': 1}}, max_entries=2, max_age=60)
+        db.save_llm_response('b', 'model', {'menu': {'x': 2}}, max_entries=2, max_age=60)
+        assert db.get_llm_response('a', max_age=60) == {'menu': {'x': 1}}
+        
+        # 'b' is now the least recently used entry
+        db.save_llm_response('c', 'model', {'menu': {'x': 3}}, max_entries=2, max_age=60)
+        assert db.get_llm_response('b', max_age=60) is None
+        assert db.get_llm_response('a', max_age=60) is not None
+        
+        with db.transaction() as conn:
+            conn.execute('UPDATE llm_cache SET created_at = created_at - 120')
+        assert db.get_llm_response('c', max_age=60) is None
+        assert db.clear_llm_cache() == 1
+
+
+class TestCompileSql:
+    """Test the per-dialect statement compiler"""
+    
+    def test_sqlite_statements_are_unchanged(self):
+        sql = 'SELECT * FROM recipes WHERE id = ?'
+        assert compile_sql(sql, 'sqlite') == sql
+        assert compile_sql('INSERT INTO adults (nombre) VALUES (?)', 'sqlite', returning_id=True) == \
+            'INSERT INTO adults (nombre) VALUES (?)'
+    
+    def test_postgres_placeholders_and_returning(self):
+        assert compile_sql("SELECT * FROM weekly_menus WHERE metadata LIKE '%x%' AND id = ?", 'postgres') == \
+            "SELECT * FROM weekly_menus WHERE metadata LIKE '%%x%%' AND id = %s"
+        assert compile_sql('INSERT INTO adults (nombre) VALUES (?) ', 'postgres', returning_id=True) == \
+            'INSERT INTO adults (nombre) VALUES (%s) RETURNING id'
+    
+    def test_statements_are_compiled_once(self):
+        sql = 'SELECT rating FROM menu_day_ratings WHERE menu_id = ? -- cache test'
+        compile_sql(sql, 'postgres')
+        hits = compile_sql.cache_info().hits
+        compile_sql(sql, 'postgres')
+        assert compile_sql.cache_info().hits == hits + 1
+
+
+@pytest.fixture
+def fake_pg_pool(monkeypatch):
+    """MonitoredConnectionPool backed by fake psycopg2 connections"""
+    import psycopg2
+    from psycopg2 import extensions
+    
+    def fake_connect(*args, **kwargs):
+        conn = MagicMock()
+        conn.closed = 0
+        conn.info.transaction_status = extensions.TRANSACTION_STATUS_IDLE
+        return conn
+    
+    monkeypatch.setattr(psycopg2, 'connect', fake_connect)
+    return lambda **kwargs: MonitoredConnectionPool(1, 2, 'postgresql://fake', **kwargs)
+
+
+class TestConnectionPool:
+    """Test the thread-safe PostgreSQL pool"""
+    
+    def test_pool_prewarms_and_reports_metrics(self, fake_pg_pool):
+        """Test that minconn connections are opened up front and metrics track checkouts"""
+        pool = fake_pg_pool()
+        assert pool.metrics()['idle'] == 1
+        
+        conn = pool.getconn()
+        metrics = pool.metrics()
+        assert metrics['in_use'] == 1
+        assert metrics['total_checkouts'] == 1
+        assert metrics['checkouts_per_sec'] > 0
+        
+        pool.putconn(conn)
+        assert pool.metrics()['in_use'] == 0
+    
+    def test_exhausted_pool_waits_for_a_connection(self, fake_pg_pool):
+        """Test that getconn blocks until another thread returns a connection"""
+        pool = fake_pg_pool(wait_timeout=5)
+        first, second = pool.getconn(), pool.getconn()
+        
+        timer = threading.Timer(0.2, pool.putconn, args=(first,))
+        timer.start()
+        third = pool.getconn()
+        timer.join()
+        
+        assert third is first
+        pool.putconn(second)
+        pool.putconn(third)
+    
+    def test_exhausted_pool_times_out(self, fake_pg_pool):
+        """Test that getconn raises once wait_timeout expires"""
+        from psycopg2.pool import PoolError
+        pool = fake_pg_pool(wait_timeout=0.1)
+        pool.getconn()
+        pool.getconn()
+        
+        with pytest.raises(PoolError):
+            pool.getconn()
+    
+    def test_idle_connections_are_reaped(self, fake_pg_pool):
+        """Test that connections above minconn are closed after idle_timeout"""
+        pool = fake_pg_pool(idle_timeout=0)
+        first, second = pool.getconn(), pool.getconn()
+        pool.putconn(first)
+        pool.putconn(second)
+        assert pool.metrics()['idle'] == 2
+        
+        conn = pool.getconn()
+        assert pool.metrics()['idle'] == 0
+        assert first.close.called or second.close.called
+        pool.putconn(conn)
 
 
 if __name__ == '__main__':
@@ -0,0 +1,206 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Tests for incremental and tolerant JSON parsing
+"""
+import inspect
+import json
+import random
+import pytest
+from json_stream import IncrementalJSONParser, TolerantJSONParser, iter_json_strings, loads_tolerant
+
+
+def is_day(path):
+    return len(path) == 3 and path[1] == 'dias'
+
+
+@pytest.fixture
+def menu_text():
+    """A streamed-looking response: prose and a code fence around the JSON"""
+    menu = {
+        'semana': '2024-01-08',
+        'menu_adultos': {
+            'dias': {
+                'lunes': {'comida': {'nombre': 'Paella "valenciana" {casera}', 'ingredientes': ['arroz', ']']}},
+                'martes': {}
+            },
+            'lista_compras': {'otros': [{'nombre': 'Sal'}]}
+        },
+        'menu_ninos': {'dias': {'miércoles': {'cena': None}}}
+    }
+    return menu, 'Aquí está el menú:\n```json\n' + json.dumps(menu, indent=2) + '\n```\nFin.'
+
+
+class TestIncrementalJSONParser:
+    """Test that watched containers are reported as soon as they close"""
+    
+    def test_reports_each_watched_object_once_complete(self, menu_text):
+        """Test paths and texts of completed days, whatever the chunk boundaries"""
+        menu, text = menu_text
+        rng = random.Random(7)
+        for _ in range(50):
+            parser = IncrementalJSONParser(is_day)
+            found = []
+            position = 0
+            while position < len(text):
+                size = rng.randint(1, 12)
+                found += parser.feed(text[position:position + size])
+                position += size
+            
+            assert [path for path, _ in found] == [
+                ('menu_adultos', 'dias', 'lunes'),
+                ('menu_adultos', 'dias', 'martes'),
+                ('menu_ninos', 'dias', 'miércoles'),
+            ]
+            assert json.loads(found[0][1]) == menu['menu_adultos']['dias']['lunes']
+            assert parser.done
+    
+    def test_day_is_reported_before_the_document_ends(self, menu_text):
+        """Test that a day is emitted by the chunk containing its closing brace"""
+        menu, text = menu_text
+        parser = IncrementalJSONParser(is_day)
+        cut = text.index('"martes"')
+        found = parser.feed(text[:cut])
+        assert [path[2] for path, _ in found] == ['lunes']
+        assert not parser.done
+    
+    def test_array_indexes_in_paths(self):
+        """Test that array elements get their index as path component"""
+        parser = IncrementalJSONParser(lambda path: path[:1] == ('items',) and len(path) == 2)
+        found = parser.feed('{"items": [{"a": 1}, [2], {"b": "x,y"}]}')
+        assert [path for path, _ in found] == [('items', 0), ('items', 1), ('items', 2)]
+
+
+
+def weekly_menu_response():
+    """A full weekly menu response shaped like the ones Claude returns (about 60 KB)"""
+    meal = lambda name: {
+        'nombre': name,
+        'ingredientes': [f'{i * 50}g de ingrediente {i}' for i in range(1, 11)],
+        'tiempo_prep': 25,
+        'calorias': 540,
+        'nutrientes': {'proteinas': '32g', 'carbohidratos': '48g', 'grasas': '18g', 'fibra': '7g'},
+        'instrucciones': '1. Preparar los ingredientes. 2. Cocinar a fuego medio durante 20 minutos. ' * 4,
+        'receta_base': 'Original',
+        'porque_seleccionada': 'Equilibrado, rápido y con ingredientes de temporada que gustan a toda la familia.'
+    }
+    days = ['lunes', 'martes', 'miercoles', 'jueves', 'viernes', 'sabado', 'domingo']
+    menu = {
+        f'menu_{menu_type}': {
+            'dias': {day: {m: meal(f'{m} del {day} ({menu_type})') for m in ('desayuno', 'comida', 'merienda', 'cena')}
+                     for day in days},
+            'lista_compras': {'verduras': [f'verdura {i}' for i in range(30)], 'proteinas': ['pollo', 'merluza']}
+        }
+        for menu_type in ('adultos', 'ninos')
+    }
+    text = 'Aquí tienes el menú semanal:\n\n```json\n' + json.dumps(menu, indent=2, ensure_ascii=False) + '\n```\n\n¡Buen provecho!'
+    return menu, text
+
+
+class TestTolerantJSONParser:
+    """Test the single-pass decoder for LLM-written JSON"""
+    
+    @pytest.mark.parametrize('text, expected', [
+        ('```json\n{"a": [1, 2,], "b": {"c": null,},}\n```', {'a': [1, 2], 'b': {'c': None}}),
+        ('{"a": 1, // comentario\n /* bloque\n */ "url": "https://x.es/a//b"}', {'a': 1, 'url': 'https://x.es/a//b'}),
+        ('{"nombre": "Tortilla "de la abuela" casera", "n": 1}', {'nombre': 'Tortilla "de la abuela" casera', 'n': 1}),
+        ('{"a": "5\\€ y \\q", "b": "caf\\u00e9"}', {'a': '5\\€ y \\q', 'b': 'café'}),
+        ('{calorias: 350 kcal, "ok": True, "l": ["a", ...]}', {'calorias': '350 kcal', 'ok': True, 'l': ['a']}),
+        ('{"a": 1\n "b": 2}', {'a': 1, 'b': 2}),
+        ('Texto [previo] ```json\n[{"a": 1}]\n```', [{'a': 1}]),
+    ])
+    def test_repairs(self, text, expected):
+        """Test fences, comments, trailing commas, stray quotes and bare values"""
+        assert loads_tolerant(text) == expected
+    
+    def test_truncated_output_keeps_the_complete_part(self):
+        """Test that truncated text closes open containers and drops a dangling key"""
+        parser = TolerantJSONParser()
+        assert parser.parse('{"a": {"b": "sin termin') == {'a': {'b': 'sin termin'}}
+        assert parser.truncated
+        assert loads_tolerant('{"a": [1, 2, {"x": tru') == {'a': [1, 2, {}]}
+        assert loads_tolerant('{"a": "x",\n "b": ') == {'a': 'x'}
+        
+        parser.parse('{"a": 1}')
+        assert not parser.truncated
+    
+    def test_no_json_raises(self):
+        """Test that text without an object or array is rejected"""
+        with pytest.raises(json.JSONDecodeError):
+            loads_tolerant('Lo siento, no puedo generar el menú.')
+    
+    def test_valid_json_matches_json_loads(self):
+        """Test that well-formed responses decode exactly like json.loads"""
+        menu, text = weekly_menu_response()
+        assert loads_tolerant(text) == menu
+        assert loads_tolerant(json.dumps(menu)) == menu
+    
+    def test_fuzz_truncation_and_noise(self):
+        """Test random cuts, commas and comments on a recorded-style response never raise"""
+        menu, text = weekly_menu_response()
+        rng = random.Random(2024)
+        body_start = text.index('{')
+        
+        for _ in range(200):
+            cut = rng.randint(body_start + 1, len(text))
+            parser = TolerantJSONParser()
+            result = parser.parse(text[:cut])
+            assert isinstance(result, dict)
+            if cut < text.rindex('}'):
+                assert parser.truncated
+        
+        # Trailing commas and comments after any structural character leave the value unchanged
+        compact = json.dumps(menu, ensure_ascii=False)
+        positions = [i for i, char in enumerate(compact) if char in '}]' and compact[i - 1] != '"']
+        for _ in range(50):
+            noisy = compact
+            for position in sorted(rng.sample(positions, 20), reverse=True):
+                noisy = noisy[:position] + rng.choice([', ', ' // nota\n', ' /* x */ ']) + noisy[position:]
+            assert loads_tolerant(noisy) == menu
+        
+        # Arbitrary mutations may change the value but must not raise or hang
+        for _ in range(300):
+            chars = list(text)
+            for _ in range(rng.randint(1, 10)):
+                chars[rng.randrange(len(chars))] = rng.choice('{}[]",:/*\\ \nax0')
+            try:
+                loads_tolerant(''.join(chars))
+            except json.JSONDecodeError:
+                pass
+    
+    def test_large_documents_parse_completely(self):
+        """Test that a document four weekly responses long comes back whole (timings: benchmark_json_parsing.py)"""
+        menu, text = weekly_menu_response()
+        assert len(text) > 50000
+        
+        body = text[text.index('{'):text.rindex('}') + 1]
+        big = '{"semanas": [' + ', '.join([body] * 4) + ']}'
+        assert loads_tolerant(big) == {'semanas': [menu] * 4}
+
+
+class TestIterJsonStrings:
+    """Test streaming string values out of large documents"""
+    
+    def test_values_with_object_depth(self):
+        """Test that keys are skipped, depth counts objects and deep values are cut off"""
+        text = json.dumps({'a': 'x', 'b': ['y', {'c': 'z', 'd': {'e': 'w'}}], 'k"q': 1, 'n': None})
+        assert list(iter_json_strings(text)) == [(1, 'x'), (1, 'y'), (2, 'z'), (3, 'w')]
+        assert [value for _, value in iter_json_strings(text, max_depth=2)] == ['x', 'y', 'z']
+    
+    def test_malformed_input_ends_the_stream(self):
+        """Test that broken or truncated JSON yields what came before, without raising"""
+        assert list(iter_json_strings('{"a": "x"}]]}, "b": "y"')) == [(1, 'x')]
+        assert list(iter_json_strings('{"a": "x", "b": "unterminated')) == [(1, 'x')]
+    
+    def test_multi_megabyte_document_streams_lazily(self):
+        """Test that values come out one at a time in document order (timings: benchmark_json_parsing.py)"""
+        pins = [{'id': str(i), 'images': {'orig': {'url': f'https://i.pinimg.com/originals/{i}.jpg'}},
+                 'description': 'Receta ' * 20} for i in range(20000)]
+        text = json.dumps({'props': {'initialReduxState': {'pins': pins}}})
+        assert len(text) > 4_000_000
+        
+        stream = iter_json_strings(text)
+        assert inspect.isgenerator(stream)
+        assert next(stream) == (4, '0')
+        assert next(stream) == (6, 'https://i.pinimg.com/originals/0.jpg')
+        assert sum(1 for _ in stream) == 60000 - 2
@@ -5,6 +5,11 @@ Tests for menu generator (requires API key)
 """
 import pytest
 import os
+import re
+import json
+import threading
+import time
+from types import SimpleNamespace
 from menu_generator import MenuGenerator
 
 
@@ -81,5 +86,256 @@ class TestMenuGenerator:
             assert 'error' in result
 
 
+
+class FakeStream:
+    """Stand-in for client.messages.stream() yielding the response in small chunks"""
+    
+    def __init__(self, text, chunk_size=40):
+        self.text_stream = (text[i:i + chunk_size] for i in range(0, len(text), chunk_size))
+    
+    def __enter__(self):
+        return self
+    
+    def __exit__(self, *exc):
+        return False
+
+
+class TestStreamingGeneration:
+    """Test streamed weekly menu generation (no API calls)"""
+    
+    def test_days_are_reported_while_streaming(self, sample_family, monkeypatch):
+        """Test that on_day gets each day and the full menu is still returned"""
+        gen = MenuGenerator('sk-test')
+        menu = {
+            'menu_adultos': {'dias': {
+                'lunes': {'comida': {'nombre': 'Paella', 'ingredientes': ['arroz']}},
+                'martes': {'cena': {'nombre': 'Crema de "calabaza"', 'ingredientes': ['calabaza']}},
+            }},
+            'menu_ninos': {'dias': {'lunes': {'comida': {'nombre': 'Macarrones', 'ingredientes': ['pasta']}}}}
+        }
+        requests = []
+        
+        def stream(**request):
+            requests.append(request)
+            return FakeStream(json.dumps(menu))
+        monkeypatch.setattr(gen.client.messages, 'stream', stream)
+        
+        days = []
+        result = gen.generate_weekly_menu(
+            adults=sample_family['adults'],
+            children=sample_family['children'],
+            on_day=lambda menu_type, day_name, day_menu: days.append((menu_type, day_name, day_menu))
+        )
+        
+        assert result['success']
+        assert requests[0]['max_tokens'] == 16000
+        assert days == [
+            ('adultos', 'lunes', menu['menu_adultos']['dias']['lunes']),
+            ('adultos', 'martes', menu['menu_adultos']['dias']['martes']),
+            ('ninos', 'lunes', menu['menu_ninos']['dias']['lunes']),
+        ]
+        assert result['menu']['menu_adultos']['dias']['martes']['cena']['nombre'] == 'Crema de "calabaza"'
+        assert result['raw_response'] == json.dumps(menu)
+
+
+
+class FakeDayClient:
+    """Stand-in for client.messages answering single-day prompts"""
+    
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.active = 0
+        self.max_active = 0
+        self.prompts = []
+    
+    def create(self, **request):
+        prompt = request['messages'][0]['content']
+        with self.lock:
+            self.prompts.append(prompt)
+            self.active += 1
+            self.max_active = max(self.max_active, self.active)
+        time.sleep(0.05)
+        with self.lock:
+            self.active -= 1
+        
+        day = re.search(r'\*\*DÍA:\*\* (\w+)', prompt).group(1).lower()
+        specific = re.search(r'\*\*COMIDA ESPECÍFICA:\*\* (\w+)', prompt)
+        if specific:
+            meal = specific.group(1).lower()
+            body = {meal: {'nombre': f'Alternativa {day}', 'ingredientes': ['garbanzos']}}
+        else:
+            meals = re.findall(r'^- (desayuno|comida|merienda|cena)$', prompt, re.MULTILINE)
+            # Every day proposes the same breakfast to exercise the diversity check
+            body = {meal: {'nombre': 'Tostadas' if meal == 'desayuno' else f'{meal} {day}',
+                           'ingredientes': ['pan', 'Tomate'] if meal == 'desayuno' else ['tomate']}
+                    for meal in meals}
+        return SimpleNamespace(content=[SimpleNamespace(text=json.dumps(body))])
+
+
+class TestParallelGeneration:
+    """Test the per-day fan-out generation mode (no API calls)"""
+    
+    def test_days_are_generated_concurrently_and_merged(self, sample_family, monkeypatch):
+        """Test that day prompts run in parallel and the merged week has no repeated dishes"""
+        gen = MenuGenerator('sk-test')
+        fake = FakeDayClient()
+        monkeypatch.setattr(gen.client.messages, 'create', fake.create)
+        
+        days = []
+        result = gen.generate_weekly_menu_parallel(
+            adults=sample_family['adults'],
+            children=sample_family['children'],
+            preferences={'include_weekend': False, 'excluded_days': ['miércoles'], 'include_dinner': False},
+            day_settings={'viernes': {'no_cooking': True}},
+            on_day=lambda menu_type, day_name, day_menu: days.append((menu_type, day_name))
+        )
+        
+        assert result['success']
+        assert fake.max_active > 1
+        adultos = result['menu']['menu_adultos']['dias']
+        ninos = result['menu']['menu_ninos']['dias']
+        assert list(adultos) == ['lunes', 'martes', 'jueves']
+        assert set(adultos['lunes']) == {'desayuno', 'comida'}
+        assert set(ninos['lunes']) == {'desayuno', 'comida', 'merienda'}
+        assert sorted(days) == sorted([(t, d) for t in ('adultos', 'ninos') for d in ('lunes', 'martes', 'jueves')])
+        
+        # Only the first day keeps the shared breakfast; the others were regenerated
+        assert [adultos[d]['desayuno']['nombre'] for d in adultos] == ['Tostadas', 'Alternativa martes', 'Alternativa jueves']
+        assert any('Tostadas' in p for p in fake.prompts if 'COMIDA ESPECÍFICA' in p)
+        
+        shopping = result['menu']['menu_adultos']['lista_compras']['por_categoria']
+        names = [item['nombre'] for items in shopping.values() for item in items]
+        assert sorted(name.lower() for name in names) == ['garbanzos', 'pan', 'tomate']
+    
+    def test_failed_days_are_retried_then_reported(self, sample_family, monkeypatch):
+        """Test that a day failing twice fails the whole generation"""
+        gen = MenuGenerator('sk-test')
+        fake = FakeDayClient()
+        
+        def create(**request):
+            if '**DÍA:** Martes' in request['messages'][0]['content']:
+                return SimpleNamespace(content=[SimpleNamespace(text='no json here')])
+            return fake.create(**request)
+        monkeypatch.setattr(gen.client.messages, 'create', create)
+        
+        result = gen.generate_weekly_menu_parallel(adults=sample_family['adults'], children=[])
+        assert not result['success']
+        assert 'martes (adultos)' in result['error']
+
+
+
+class TestResponseCache:
+    """Test the content-addressed cache of parsed Claude results"""
+    
+    def test_identical_requests_are_served_from_cache(self, sample_family, temp_db, monkeypatch):
+        """Test cache hits, prompt-sensitive keys and the use_cache opt-out"""
+        gen = MenuGenerator('sk-test', response_cache=temp_db)
+        fake = FakeDayClient()
+        monkeypatch.setattr(gen.client.messages, 'create', fake.create)
+        args = dict(adults=sample_family['adults'], children=[], day_name='lunes', menu_type='adultos')
+        
+        first = gen.generate_single_day_menu(**args)
+        second = gen.generate_single_day_menu(**args)
+        assert len(fake.prompts) == 1
+        assert second['cached'] and second['day_menu'] == first['day_menu']
+        
+        gen.generate_single_day_menu(**dict(args, day_name='martes'))
+        assert len(fake.prompts) == 2
+        
+        fresh = gen.generate_single_day_menu(**args, use_cache=False)
+        assert len(fake.prompts) == 3 and 'cached' not in fresh
+    
+    def test_weekly_cache_hit_replays_days(self, sample_family, temp_db, monkeypatch):
+        """Test that a cached weekly menu still reports its days to on_day"""
+        gen = MenuGenerator('sk-test', response_cache=temp_db)
+        menu = {'menu_adultos': {'dias': {'lunes': {'comida': {'nombre': 'Paella', 'ingredientes': ['arroz']}}}}}
+        calls = []
+        
+        def stream(**request):
+            calls.append(request)
+            return FakeStream(json.dumps(menu))
+        monkeypatch.setattr(gen.client.messages, 'stream', stream)
+        
+        days = []
+        on_day = lambda menu_type, day_name, day_menu: days.append(day_name)
+        gen.generate_weekly_menu(adults=sample_family['adults'], children=[], on_day=on_day)
+        result = gen.generate_weekly_menu(adults=sample_family['adults'], children=[], on_day=on_day)
+        
+        assert len(calls) == 1
+        assert result['cached'] and result['menu']['menu_adultos']['dias']['lunes']['comida']['nombre'] == 'Paella'
+        assert days == ['lunes', 'lunes']
+    
+    def test_truncated_menu_is_not_cached(self, sample_family, temp_db, monkeypatch):
+        """Test that a menu recovered from a cut-off stream is returned but never stored"""
+        gen = MenuGenerator('sk-test', response_cache=temp_db)
+        menu = {'menu_adultos': {'dias': {'lunes': {'comida': {'nombre': 'Paella'}},
+                                          'martes': {'comida': {'nombre': 'Lentejas'}}}}}
+        text = json.dumps(menu)
+        monkeypatch.setattr(gen.client.messages, 'stream', lambda **request: FakeStream(text[:text.index('Lentejas')]))
+        
+        result = gen.generate_weekly_menu(adults=sample_family['adults'], children=[], on_day=lambda *args: None)
+        
+        assert result['success'] and result['menu']['truncated']
+        assert result['menu']['menu_adultos']['dias']['lunes']['comida']['nombre'] == 'Paella'
+        assert temp_db._fetch_one('SELECT COUNT(*) AS n FROM llm_cache')['n'] == 0
+
+
+
+class TestPromptPrefix:
+    """Test the cached family prefix and the prompt token budgets (no API calls)"""
+    
+    def test_family_context_is_a_shared_cached_system_block(self, sample_family, monkeypatch):
+        """Test that weekly and single-day requests send the same cache_control prefix"""
+        gen = MenuGenerator('sk-test')
+        requests = []
+        
+        def create(**request):
+            requests.append(request)
+            return SimpleNamespace(content=[SimpleNamespace(text='{}')])
+        monkeypatch.setattr(gen.client.messages, 'create', create)
+        
+        family = dict(adults=sample_family['adults'], children=sample_family['children'])
+        gen.generate_weekly_menu(**family, preferences={'include_weekend': False})
+        gen.generate_single_day_menu(**family, day_name='martes', menu_type='ninos')
+        
+        weekly, day = requests
+        assert weekly['system'] == day['system']
+        assert weekly['system'][0]['cache_control'] == {'type': 'ephemeral'}
+        assert 'Test Child' in weekly['system'][0]['text']
+        assert 'Test Child' not in day['messages'][0]['content']
+        assert '**DÍA:** Martes' in day['messages'][0]['content']
+    
+    def test_recipes_and_history_are_trimmed_to_budget(self, monkeypatch):
+        """Test that recipe and rating entries stop at their token budgets"""
+        monkeypatch.setenv('MENU_PROMPT_CONTEXT_TOKENS', '250')
+        monkeypatch.setenv('MENU_PROMPT_HISTORY_TOKENS', '60')
+        gen = MenuGenerator('sk-test')
+        recipes = [{'title': f'Receta {i}', 'ingredients': ['arroz', 'pollo']} for i in range(20)]
+        ratings = [{'rating': 5, 'day_name': 'lunes', 'menu_type': 'adultos',
+                    'menu_data': {'menu_adultos': {'dias': {'lunes': {'comida': {'nombre': f'Plato {i}'}}}}}}
+                   for i in range(10)]
+        
+        context = gen._build_family_context([], [], recipes)
+        kept = [i for i in range(20) if f'Receta {i}**' in context]
+        assert kept == list(range(len(kept))) and 0 < len(kept) < 20
+        
+        prompt = gen._build_menu_prompt([], [], None, None, historical_ratings=ratings)
+        liked = [i for i in range(10) if f'Plato {i}\n' in prompt]
+        assert liked == list(range(len(liked))) and 0 < len(liked) < 10
+    
+    
+    def test_prefix_does_not_follow_the_rating_ranking(self):
+        """Test that the cached prefix lists recipes by id and rated picks go in the request prompt"""
+        gen = MenuGenerator('sk-test')
+        recipes = [{'id': i, 'title': f'Receta {i}', 'ingredients': ['arroz']} for i in (3, 1, 2)]
+        
+        context = gen._build_family_context([], [], recipes)
+        assert context == gen._build_family_context([], [], list(reversed(recipes)))
+        assert context.index('Receta 1**') < context.index('Receta 2**') < context.index('Receta 3**')
+        
+        prompt = gen._build_menu_prompt([], [], recipes, None, recommended=['Receta 2', 'Receta 3'])
+        assert prompt.index('• Receta 2') < prompt.index('• Receta 3')
+        assert 'RECOMENDADAS' not in gen._build_menu_prompt([], [], recipes, None)
+
 if __name__ == '__main__':
     pytest.main([__file__, '-v'])
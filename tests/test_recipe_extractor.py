@@ -0,0 +1,324 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Tests for recipe extraction (no network access)
+"""
+import pytest
+import io
+import os
+import json
+import threading
+import time
+import requests
+from types import SimpleNamespace
+import recipe_extractor
+from recipe_extractor import RecipeExtractor, canonical_url
+
+
+class FakeSession:
+    """Stand-in for requests.Session recording concurrency and start times per host"""
+    
+    def __init__(self, delay=0.1):
+        self.delay = delay
+        self.lock = threading.Lock()
+        self.active = {}
+        self.max_active = {}
+        self.starts = {}
+    
+    def get(self, url, headers=None, timeout=None, allow_redirects=True, stream=False):
+        host = url.split('/')[2]
+        with self.lock:
+            self.active[host] = self.active.get(host, 0) + 1
+            self.max_active[host] = max(self.max_active.get(host, 0), self.active[host])
+            self.starts.setdefault(host, []).append(time.monotonic())
+        time.sleep(self.delay)
+        with self.lock:
+            self.active[host] -= 1
+        html = f'<html><head><title>{url}</title></head><body><h1>Receta {url[-1]}</h1></body></html>'
+        return SimpleNamespace(content=html.encode(), text=html, raise_for_status=lambda: None)
+
+
+class TestConcurrentExtraction:
+    """Test the bounded pool, per-host limits and politeness delay"""
+    
+    def test_per_host_limit_and_delay(self):
+        """Test that one site gets at most per_host requests, spaced by host_delay"""
+        extractor = RecipeExtractor(max_workers=8, per_host=2, host_delay=0.05)
+        extractor.session = FakeSession()
+        urls = [f'https://a.example/{i}' for i in range(6)] + [f'https://b.example/{i}' for i in range(2)]
+        
+        results = dict(extractor.iter_extract_urls(urls))
+        
+        assert sorted(results) == list(range(8))
+        assert all(results[i]['url'] == url for i, url in enumerate(urls))
+        assert extractor.session.max_active == {'a.example': 2, 'b.example': 2}
+        starts = sorted(extractor.session.starts['a.example'])
+        assert all(later - earlier >= 0.045 for earlier, later in zip(starts, starts[1:]))
+    
+    def test_results_stream_as_pages_finish(self):
+        """Test that a fast page is yielded before a slow one submitted earlier"""
+        extractor = RecipeExtractor(max_workers=4, per_host=1, host_delay=0)
+        
+        def extract_from_url(url):
+            time.sleep(0.3 if 'slow' in url else 0.01)
+            return {'url': url}
+        extractor.extract_from_url = extract_from_url
+        
+        order = [index for index, _ in extractor.iter_extract_urls(['https://slow.example/1', 'https://fast.example/2'])]
+        assert order == [1, 0]
+        assert [r['url'] for r in extractor.extract_multiple_urls(['https://slow.example/1', 'https://fast.example/2'])] \
+            == ['https://slow.example/1', 'https://fast.example/2']
+    
+    def test_tracked_hosts_are_bounded(self, monkeypatch):
+        """Test that per-host state keeps only the most recently used sites"""
+        monkeypatch.setattr(recipe_extractor, 'MAX_TRACKED_HOSTS', 3)
+        extractor = RecipeExtractor(max_workers=1, host_delay=0)
+        extractor.session = FakeSession(delay=0)
+        for host in ('a', 'b', 'c', 'a', 'd', 'e'):
+            extractor.fetch_page(f'https://{host}.example/1')
+        
+        assert list(extractor._host_slots) == ['a.example', 'd.example', 'e.example']
+        assert set(extractor._host_next_start) == {'a.example', 'd.example', 'e.example'}
+
+
+
+class RevalidatingSession:
+    """Stand-in for requests.Session serving one page with an ETag and honouring If-None-Match"""
+    
+    PAGE = (b'<html><head><script type="application/ld+json">{"@type": "Recipe", "name": "Lentejas",'
+            b' "recipeIngredient": ["lentejas", "chorizo"]}</script></head><body></body></html>')
+    
+    def __init__(self):
+        self.calls = []
+    
+    def get(self, url, headers=None, timeout=None, allow_redirects=True, stream=False):
+        self.calls.append((url, dict(headers or {})))
+        response = requests.Response()
+        response.url = url
+        if (headers or {}).get('If-None-Match') == '"v1"':
+            response.status_code = 304
+            response._content = b''
+        else:
+            response.status_code = 200
+            response._content = self.PAGE
+            response.headers['ETag'] = '"v1"'
+            response.headers['Content-Type'] = 'text/html; charset=utf-8'
+        return response
+
+
+class StreamingSession:
+    """Stand-in for requests.Session streaming a body of the given size, recording how much was read"""
+    
+    def __init__(self, size):
+        self.page = b'<html><head><title>Grande</title></head><body>' + b'x' * size
+        self.read = 0
+    
+    def get(self, url, headers=None, timeout=None, allow_redirects=True, stream=False):
+        assert stream
+        body = io.BytesIO(self.page)
+        
+        def read(size=-1):
+            chunk = io.BytesIO.read(body, size)
+            self.read += len(chunk)
+            return chunk
+        body.read = read
+        response = requests.Response()
+        response.url = url
+        response.status_code = 200
+        response.raw = body
+        return response
+
+
+class TestPageCache:
+    """Test the persistent page cache, revalidation and offline mode"""
+    
+    def test_canonical_url(self):
+        """Test that tracking params, fragments, case and default ports do not split the cache"""
+        assert canonical_url('HTTPS://Www.Example.com:443/receta?utm_source=x&b=2&a=1#paso-3') == \
+            'https://www.example.com/receta?a=1&b=2'
+        assert canonical_url('https://example.com') == 'https://example.com/'
+    
+    def test_fresh_pages_are_served_from_cache_then_revalidated(self, temp_db):
+        """Test cache hits within the TTL and a 304 revalidation afterwards"""
+        extractor = RecipeExtractor(host_delay=0, page_cache=temp_db)
+        extractor.session = RevalidatingSession()
+        url = 'https://recetas.example/lentejas'
+        
+        first = extractor.extract_from_url(url)
+        second = extractor.extract_from_url(url + '?utm_campaign=pin#top')
+        assert first['title'] == second['title'] == 'Lentejas'
+        assert len(extractor.session.calls) == 1
+        
+        extractor.cache_ttl = 0
+        third = extractor.extract_from_url(url)
+        assert third['ingredients'] == ['lentejas', 'chorizo']
+        assert extractor.session.calls[-1][1] == {'If-None-Match': '"v1"'}
+    
+    def test_offline_mode_never_uses_the_network(self, temp_db):
+        """Test that offline extraction re-parses cached pages and fails for unknown ones"""
+        online = RecipeExtractor(host_delay=0, page_cache=temp_db)
+        online.session = RevalidatingSession()
+        online.extract_from_url('https://recetas.example/lentejas')
+        
+        offline = RecipeExtractor(page_cache=temp_db, offline=True)
+        offline.session = None  # any network access would fail
+        assert offline.extract_from_url('https://recetas.example/lentejas')['title'] == 'Lentejas'
+        assert 'caché' in offline.extract_from_url('https://recetas.example/otra')['error']
+    
+    def test_oversized_pages_are_cut_and_not_cached(self, temp_db):
+        """Test that bodies are read up to max_page_bytes and only smaller pages are cached"""
+        extractor = RecipeExtractor(host_delay=0, page_cache=temp_db)
+        extractor.max_page_bytes = 100_000
+        extractor.session = StreamingSession(1_000_000)
+        
+        response = extractor.fetch_page('https://recetas.example/grande')
+        assert len(response.content) == 100_000
+        assert extractor.session.read < 200_000
+        assert temp_db.get_connection().execute('SELECT COUNT(*) FROM http_cache').fetchone()[0] == 0
+        
+        extractor.session = StreamingSession(1000)
+        assert extractor.fetch_page('https://recetas.example/pequena').content.endswith(b'x' * 1000)
+        assert temp_db.get_connection().execute('SELECT COUNT(*) FROM http_cache').fetchone()[0] == 1
+    
+    def test_size_bounded_eviction(self, temp_db):
+        """Test that least recently used pages are evicted once the compressed total is too big"""
+        pages = {key: os.urandom(1000) for key in ('a', 'b', 'c')}  # incompressible
+        temp_db.save_cached_page('a', {'url': 'a', 'body': pages['a']}, 2500)
+        temp_db.save_cached_page('b', {'url': 'b', 'body': pages['b']}, 2500)
+        assert temp_db.get_cached_page('a')['body'] == pages['a']  # a is now more recent than b
+        temp_db.save_cached_page('c', {'url': 'c', 'body': pages['c']}, 2500)
+        
+        assert temp_db.get_cached_page('b') is None
+        assert temp_db.get_cached_page('a') and temp_db.get_cached_page('c')
+
+
+JSON_LD_PAGE = '''<html><head><script type="application/ld+json">
+{"@context": "https://schema.org", "@graph": [{"@type": "WebPage"}, {"@type": "Recipe", "name": "Tortilla de patatas",
+ "recipeIngredient": ["4 huevos", "3 patatas"], "recipeInstructions": [{"@type": "HowToStep", "text": "Freír y cuajar"}]}]}
+</script></head><body><h1>Tortilla</h1><p>Texto del blog</p></body></html>'''
+
+MANUAL_PAGE = '''<html><head><title>Lentejas</title></head><body><h1>Lentejas con chorizo</h1>
+<div class="wprm-Ingredients-list"><ul><li> 300 g lentejas </li><li>1 chorizo</li></ul></div>
+<ol class="recipe-steps"><li>Remojar</li><li>Cocer 40 minutos</li></ol>
+<img class="Featured-image" src="https://img.example/lentejas.jpg"></body></html>'''
+
+
+class StaticSession:
+    """Stand-in for requests.Session always returning the same page"""
+    
+    def __init__(self, html):
+        self.content = html.encode('utf-8')
+    
+    def get(self, url, headers=None, timeout=None, allow_redirects=True, stream=False):
+        return SimpleNamespace(content=self.content, raise_for_status=lambda: None)
+
+
+class TestSinglePassParsing:
+    """Test the shared lxml tree and the trafilatura short-circuit"""
+    
+    @pytest.fixture
+    def trafilatura_calls(self, monkeypatch):
+        calls = []
+        monkeypatch.setattr(recipe_extractor.trafilatura, 'extract', lambda tree: calls.append(tree) or 'texto')
+        return calls
+    
+    def extract(self, html, monkeypatch):
+        parses = []
+        parse_html = recipe_extractor.parse_html
+        monkeypatch.setattr(recipe_extractor, 'parse_html', lambda content: parses.append(content) or parse_html(content))
+        extractor = RecipeExtractor(host_delay=0)
+        extractor.session = StaticSession(html)
+        return extractor.extract_from_url('https://recetas.example/receta'), parses
+    
+    def test_complete_json_ld_skips_trafilatura(self, monkeypatch, trafilatura_calls):
+        """Test that a complete JSON-LD recipe is returned without running trafilatura"""
+        recipe, parses = self.extract(JSON_LD_PAGE, monkeypatch)
+        
+        assert recipe['title'] == 'Tortilla de patatas'
+        assert recipe['ingredients'] == ['4 huevos', '3 patatas']
+        assert recipe['instructions'] == 'Freír y cuajar'
+        assert '3 patatas' in recipe['extracted_text']
+        assert len(parses) == 1 and trafilatura_calls == []
+    
+    def test_manual_extraction_shares_the_tree_with_trafilatura(self, monkeypatch, trafilatura_calls):
+        """Test class-based extraction on the parsed tree, which trafilatura then reuses"""
+        recipe, parses = self.extract(MANUAL_PAGE, monkeypatch)
+        
+        assert recipe['title'] == 'Lentejas con chorizo'
+        assert recipe['ingredients'] == ['300 g lentejas', '1 chorizo']
+        assert recipe['instructions'] == 'Remojar\nCocer 40 minutos'
+        assert recipe['image_url'] == 'https://img.example/lentejas.jpg'
+        assert recipe['extracted_text'] == 'texto'
+        assert len(parses) == 1
+        assert len(trafilatura_calls) == 1 and not isinstance(trafilatura_calls[0], bytes)
+    
+    def test_empty_body_is_a_page_without_recipe(self, monkeypatch, trafilatura_calls):
+        """Test that an empty or blank 200 response does not raise"""
+        for body in ('', ' \n '):
+            recipe, _ = self.extract(body, monkeypatch)
+            assert 'error' not in recipe
+            assert recipe['title'] == '' and recipe['ingredients'] == []
+    
+    def test_utf8_without_charset_declaration(self):
+        """Test that accents survive pages that do not declare their charset"""
+        tree = recipe_extractor.parse_html('<html><body><h1>Guiso de ñoras</h1></body></html>'.encode('utf-8'))
+        assert recipe_extractor.text_of(tree.xpath('//h1')[0]) == 'Guiso de ñoras'
+
+
+def pinterest_page(data):
+    return ('<html><head><title>Pin on Pinterest</title>'
+            '<meta property="og:image" content="https://i.pinimg.com/736x/a.jpg">'
+            f'<script id="__PWS_DATA__" type="application/json">{json.dumps(data)}</script>'
+            '</head><body><h1>Croquetas on Pinterest</h1></body></html>')
+
+
+class PinterestSession:
+    """Stand-in for requests.Session serving a pin page; other sites are unreachable"""
+    
+    def __init__(self, html):
+        self.content = html.encode('utf-8')
+    
+    def get(self, url, headers=None, timeout=None, allow_redirects=True, stream=False):
+        if 'pinterest.com' not in url:
+            raise requests.ConnectionError(url)
+        return SimpleNamespace(content=self.content, raise_for_status=lambda: None)
+
+
+class TestPinterestJSON:
+    """Test the single-pass scan of Pinterest's embedded JSON"""
+    
+    def extractor(self, data):
+        extractor = RecipeExtractor(host_delay=0)
+        extractor.session = PinterestSession(pinterest_page(data))
+        return extractor
+    
+    def test_source_url_images_and_videos_in_one_pass(self):
+        """Test that the source URL, images and videos come from one scan, deduplicated"""
+        data = {'props': {'pin': {
+            'images': [{'url': 'https://i.pinimg.com/736x/a.jpg'}, {'url': 'https://i.pinimg.com/736x/a.jpg'}],
+            'videos': {'V_HLSV4': {'url': 'https://v.pinimg.com/videos/b.mp4'}},
+            'link': 'https://recetas.example/croquetas',
+        }}}
+        extractor = self.extractor(data)
+        
+        found = extractor._scan_pinterest_json(recipe_extractor.parse_html(pinterest_page(data).encode()))
+        assert found == {'url': 'https://recetas.example/croquetas',
+                         'images': ['https://i.pinimg.com/736x/a.jpg'],
+                         'videos': ['https://v.pinimg.com/videos/b.mp4']}
+        
+        # The source site is unreachable: the pin page itself is used
+        recipe = extractor.extract_from_url('https://www.pinterest.com/pin/1/')
+        assert recipe['title'] == 'Croquetas'
+        assert recipe['images'] == ['https://i.pinimg.com/736x/a.jpg']
+        assert recipe['video_url'] == 'https://v.pinimg.com/videos/b.mp4'
+    
+    def test_scan_is_bounded(self):
+        """Test that deep values are ignored and media lists stop at the limit"""
+        data = {'a': {'b': {'c': {'d': {'e': {'f': 'https://deep.example/recipe'}}}}},
+                'pins': [{'image': f'https://i.pinimg.com/{i}.jpg'} for i in range(100)]}
+        extractor = self.extractor(data)
+        
+        found = extractor._scan_pinterest_json(recipe_extractor.parse_html(pinterest_page(data).encode()))
+        assert found['url'] is None
+        assert len(found['images']) == recipe_extractor.PINTEREST_MEDIA_LIMIT
+        assert found['videos'] == []
@@ -0,0 +1,106 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Tests for relevance-ranked recipe selection
+"""
+import pytest
+from recipe_index import RecipeIndex, terms
+
+
+def add_recipes(db, recipes):
+    """Add (title, ingredients) pairs and return their ids by title"""
+    return {title: db.add_recipe({'title': title, 'ingredients': ingredients}) for title, ingredients in recipes}
+
+
+class TestRecipeIndex:
+    """Test scoring, exclusions and index refresh"""
+    
+    def test_terms_meet_across_plural_and_accents(self):
+        """Test that singular/plural and accented forms share a term"""
+        assert terms('Tomates, limón') == terms('tomate y LIMONES')
+        assert terms('2 cucharadas de azúcar') == ['azucar']
+    
+    def test_ranks_by_preferences_and_excludes_allergies(self, temp_db):
+        """Test that liked recipes come first, disliked last and allergens never"""
+        add_recipes(temp_db, [
+            ('Pasta con tomate', ['pasta', 'tomates']),
+            ('Ensalada de brócoli', ['brócoli', 'aceite']),
+            ('Tarta de nueces', ['harina', 'nueces', 'huevos']),
+            ('Arroz blanco', ['arroz']),
+        ])
+        index = RecipeIndex(temp_db, top_k=10)
+        adults = [{'ingredientes_favoritos': 'pasta, tomate', 'alergias': 'nueces'}]
+        children = [{'verduras_rechazadas': 'brócoli', 'alergias': 'Ninguna'}]
+        
+        selected = [recipe.title for recipe in index.select(adults, children)]
+        assert selected[0] == 'Pasta con tomate'
+        assert selected[-1] == 'Ensalada de brócoli'
+        assert 'Tarta de nueces' not in selected
+        assert selected[1] == 'Arroz blanco'
+        assert index.select(adults, children)[0].ingredients == ['pasta', 'tomates']
+    
+    def test_ratings_and_recent_menus_move_recipes(self, temp_db):
+        """Test that rated dishes move up/down and last week's dishes are pushed back"""
+        add_recipes(temp_db, [('Lentejas', ['lentejas']), ('Paella', ['arroz']), ('Gazpacho', ['tomate'])])
+        index = RecipeIndex(temp_db, top_k=3)
+        day = lambda name: {'menu_adultos': {'dias': {'lunes': {'comida': {'nombre': name}}}}}
+        ratings = [
+            {'rating': 5, 'menu_type': 'adultos', 'day_name': 'lunes', 'menu_data': day('Lentejas')},
+            {'rating': 1, 'menu_type': 'adultos', 'day_name': 'lunes', 'menu_data': day('Paella')},
+        ]
+        
+        assert [r.title for r in index.select([], [], ratings)] == ['Lentejas', 'Gazpacho', 'Paella']
+        assert [r.title for r in index.select([], [], recent_menus=[day('Gazpacho')])][-1] == 'Gazpacho'
+    
+    def test_prompt_selection_matches_both_rankings_from_one_pass(self, temp_db, monkeypatch):
+        """Test that select_for_prompt scores the profiles once and returns both selections"""
+        add_recipes(temp_db, [('Lentejas', ['lentejas']), ('Paella', ['arroz']), ('Gazpacho', ['tomate'])])
+        index = RecipeIndex(temp_db, top_k=3)
+        adults = [{'ingredientes_favoritos': 'arroz'}]
+        day = lambda name: {'menu_adultos': {'dias': {'lunes': {'comida': {'nombre': name}}}}}
+        ratings = [{'rating': 5, 'menu_type': 'adultos', 'day_name': 'lunes', 'menu_data': day('Lentejas')}]
+        recent = [day('Paella')]
+        
+        expected = (index.select(adults, []), index.select(adults, [], ratings, recent))
+        passes = []
+        profile_scores = index._profile_scores
+        monkeypatch.setattr(index, '_profile_scores', lambda *args: passes.append(args) or profile_scores(*args))
+        
+        assert index.select_for_prompt(adults, [], ratings, recent) == expected
+        assert len(passes) == 1
+        assert [r.title for r in expected[0]] == ['Paella', 'Gazpacho', 'Lentejas']
+        assert [r.title for r in expected[1]][0] == 'Lentejas'
+    
+    def test_index_refreshes_when_recipes_change(self, temp_db):
+        """Test that added and deleted recipes are picked up on the next select"""
+        ids = add_recipes(temp_db, [('Pasta', ['pasta'])])
+        index = RecipeIndex(temp_db, top_k=5)
+        assert index.refresh() and not index.refresh()
+        
+        add_recipes(temp_db, [('Pizza', ['harina'])])
+        temp_db.delete_recipe(ids['Pasta'])
+        assert [r.title for r in index.select([], [])] == ['Pizza']
+    
+    def test_index_refreshes_when_a_recipe_is_rewritten(self, temp_db):
+        """Test that an in-place update (e.g. reparse_recipes.py) changes the ranking on the next select"""
+        ids = add_recipes(temp_db, [('Guiso', ['patata']), ('Crema', ['calabaza'])])
+        index = RecipeIndex(temp_db, top_k=1)
+        adults = [{'ingredientes_favoritos': 'lentejas'}]
+        assert [r.title for r in index.select(adults, [])] == ['Crema']
+        
+        temp_db.update_recipe(ids['Guiso'], {'title': 'Guiso de lentejas', 'ingredients': ['lentejas', 'chorizo']})
+        assert [r.title for r in index.select(adults, [])] == ['Guiso de lentejas']
+        assert not index.refresh()
+    
+    def test_large_library_ranking(self, temp_db):
+        """Test the top k of a 10k recipe library (timings: benchmark_recipe_index.py)"""
+        words = ['pollo', 'arroz', 'tomate', 'pasta', 'lentejas', 'merluza', 'patata', 'huevo', 'queso', 'pimiento']
+        ingredients = lambda i: [words[i % 10], words[i * 7 % 10]]
+        index = RecipeIndex(temp_db, top_k=20)
+        index.build({'id': i, 'title': f'Receta {i}', 'ingredients': ingredients(i)} for i in range(1, 10001))
+        adults = [{'ingredientes_favoritos': 'pollo, pasta', 'ingredientes_no_gustan': 'queso', 'alergias': 'huevo'}]
+        
+        top = index.rank(adults, [])
+        assert len(top) == len(set(top)) == 20
+        assert all({'pollo', 'pasta'} & set(ingredients(i)) for i in top)
+        assert not any({'huevo', 'queso'} & set(ingredients(i)) for i in top)